@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import torch
+
+from weapon_classifier import WeaponCNN, input_channels, load_dump_stack, load_model, stack_to_input, IMAGE_EXTENSIONS
+
+# Per-dump CPU latency of the classifier variants.
+#
+# A dump of N z-slices is classified either
+#   - per slice: N WeaponCNN forward passes (one at a time, or batched), or
+#   - volumetric: one forward pass on the depth-resampled stack or the 3 MIPs.
+# Slice preprocessing (PNG decode + reflectivity normalization) is the same for
+# all variants and is reported separately; the volumetric rows include the
+# stack_to_input() cost.
+#
+# Latency does not depend on the weights, so untrained models are used unless
+# trained ones are given (--slice_model / --stack_model / --mips_model).
+
+
+def time_call(fn, warmup=3, runs=20):
+    """Median and p95 wall time of fn() in ms."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times_ms = np.array(times) * 1000.0
+    return {'ms_median': float(np.median(times_ms)), 'ms_p95': float(np.percentile(times_ms, 95))}
+
+
+def _model(path, num_classes, in_channels):
+    if path:
+        model, _ = load_model(path)
+        return model
+    return WeaponCNN(num_classes=num_classes, in_channels=in_channels).eval()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-dump classification latency: per-slice vs. volumetric WeaponCNN')
+    parser.add_argument('--dump_dir', type=str, default=None, help='Folder of slice images of one dump (default: synthetic slices)')
+    parser.add_argument('--num_slices', type=int, default=100, help='Synthetic slices per dump when --dump_dir is not given (default: 100)')
+    parser.add_argument('--depth', type=int, default=16, help='Z channels of the stack model (default: 16)')
+    parser.add_argument('--num_classes', type=int, default=4, help='Classes of the untrained models (default: 4)')
+    parser.add_argument('--slice_model', type=str, default=None, help='Trained per-slice model (optional)')
+    parser.add_argument('--stack_model', type=str, default=None, help="Trained '--input_mode stack' model (optional)")
+    parser.add_argument('--mips_model', type=str, default=None, help="Trained '--input_mode mips' model (optional)")
+    parser.add_argument('--batch_size', type=int, default=32, help='Batch size for the batched per-slice run (default: 32)')
+    parser.add_argument('--threads', type=int, default=None, help='torch.set_num_threads (default: torch default)')
+    parser.add_argument('--runs', type=int, default=20, help='Timed runs per variant (default: 20)')
+    parser.add_argument('--output', type=str, default=None, help='Write the results as JSON')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    if args.dump_dir:
+        images = [os.path.join(args.dump_dir, f) for f in os.listdir(args.dump_dir) if f.lower().endswith(IMAGE_EXTENSIONS)]
+        print(f"Preprocessing {len(images)} slices from {args.dump_dir}...")
+        preprocess = time_call(lambda: load_dump_stack(images), warmup=1, runs=3)
+        volume = load_dump_stack(images)
+    else:
+        rng = np.random.default_rng(0)
+        volume = rng.random((args.num_slices, 100, 100), dtype=np.float32)
+        preprocess = None
+    n_slices = len(volume)
+    slices = torch.from_numpy(volume).unsqueeze(1)
+
+    slice_model = _model(args.slice_model, args.num_classes, 1)
+    stack_depth = args.depth
+    if args.stack_model:
+        stack_model, _ = load_model(args.stack_model)
+        stack_depth = stack_model.meta['depth']
+    else:
+        stack_model = _model(None, args.num_classes, input_channels('stack', args.depth))
+    mips_model = _model(args.mips_model, args.num_classes, input_channels('mips'))
+
+    def per_slice_sequential():
+        for i in range(n_slices):
+            slice_model(slices[i:i + 1])
+
+    def per_slice_batched():
+        for start in range(0, n_slices, args.batch_size):
+            slice_model(slices[start:start + args.batch_size])
+
+    def volumetric(model, mode, depth):
+        def run():
+            x = torch.from_numpy(stack_to_input(volume, mode, depth)).unsqueeze(0)
+            model(x)
+        return run
+
+    variants = {
+        f'per_slice_x{n_slices}_batch1': per_slice_sequential,
+        f'per_slice_x{n_slices}_batch{args.batch_size}': per_slice_batched,
+        f'stack_depth{stack_depth}': volumetric(stack_model, 'stack', stack_depth),
+        'mips': volumetric(mips_model, 'mips', 1),
+    }
+
+    print(f"Per-dump latency for {n_slices} slices ({torch.get_num_threads()} threads):")
+    results = {}
+    baseline = None
+    with torch.no_grad():
+        for name, fn in variants.items():
+            result = time_call(fn, runs=args.runs)
+            baseline = baseline or result['ms_median']
+            result['speedup_vs_per_slice'] = baseline / result['ms_median']
+            results[name] = result
+            print(f"  {name:28s} {result['ms_median']:9.2f} ms (p95 {result['ms_p95']:9.2f})  x{result['speedup_vs_per_slice']:.1f}")
+    if preprocess:
+        print(f"  (slice preprocessing, all variants: {preprocess['ms_median']:.2f} ms)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'slices': n_slices, 'threads': torch.get_num_threads(),
+                       'preprocess': preprocess, 'results': results}, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import json
+import argparse
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader, Subset
+
+from weapon_classifier import (ARCHITECTURES, INPUT_MODES, build_dataset, build_model, count_parameters, dataset_groups,
+                               dataset_labels, input_channels, stratified_folds, train_epoch)
+from export_weapon_model import evaluate_accuracy
+from benchmark_classifier import time_call
+
+# Accuracy vs. size vs. CPU latency of the classifier architectures.
+#
+# Every architecture is trained from the same seed on the same train split and
+# evaluated on the same held-out split. By default the split keeps all slices
+# of a dump on one side (--split_by dump); slices of one dump are
+# near-duplicates, so a per-slice split overstates accuracy.
+#
+# Latency is single-image (batch 1) CPU inference, median and p95.
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the classifier architectures on the same split and compare accuracy, parameters and CPU latency')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--data_dir', type=str, help='Training image folders (class subfolders)')
+    source.add_argument('--tensor_store', type=str, help='Training tensor store')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Preprocessed tensor cache for --data_dir')
+    parser.add_argument('--archs', type=str, default=','.join(ARCHITECTURES), help=f"Comma-separated architectures (default: {','.join(ARCHITECTURES)})")
+    parser.add_argument('--input_mode', type=str, default='slice', choices=list(INPUT_MODES), help="Input mode (default: slice)")
+    parser.add_argument('--depth', type=int, default=16, help='Z channels for --input_mode stack (default: 16)')
+    parser.add_argument('--epochs', type=int, default=20, help='Training epochs per architecture (default: 20)')
+    parser.add_argument('--batch_size', type=int, default=16, help='Batch size (default: 16)')
+    parser.add_argument('--lr', type=float, default=0.001, help='Learning rate (default: 0.001)')
+    parser.add_argument('--test_fraction', type=float, default=0.2, help='Held-out fraction (default: 0.2)')
+    parser.add_argument('--split_by', type=str, default='dump', choices=['dump', 'sample'], help="Keep the slices of a dump together ('dump', default) or split single samples")
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the split, initialization and shuffling (default: 0)')
+    parser.add_argument('--workers', type=int, default=0, help='DataLoader worker processes (default: 0)')
+    parser.add_argument('--threads', type=int, default=None, help='torch.set_num_threads (default: torch default)')
+    parser.add_argument('--runs', type=int, default=100, help='Timed single-image runs per architecture (default: 100)')
+    parser.add_argument('--output', type=str, default=None, help='Write the results as JSON')
+    args = parser.parse_args()
+
+    archs = [a.strip() for a in args.archs.split(',') if a.strip()]
+    for arch in archs:
+        if arch not in ARCHITECTURES:
+            parser.error(f"Unknown architecture: {arch} (choose from {list(ARCHITECTURES)})")
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    dataset = build_dataset(args.data_dir, args.tensor_store, args.cache_dir, input_mode=args.input_mode, depth=args.depth)
+    labels = dataset_labels(dataset)
+    groups = dataset_groups(dataset) if args.split_by == 'dump' else None
+    num_folds = max(2, int(round(1.0 / args.test_fraction)))
+    folds = stratified_folds(labels, num_folds, groups=groups, seed=args.seed)
+    test_idx = folds[0]
+    train_idx = np.sort(np.concatenate(folds[1:]))
+    if len(test_idx) == 0 or len(train_idx) == 0:
+        parser.error(f"Not enough {args.split_by}s for a {args.test_fraction:.0%} held-out split")
+    missing = sorted(set(dataset.classes[l] for l in labels) - set(dataset.classes[labels[i]] for i in test_idx))
+    if missing:
+        print(f"Warning: no held-out samples for {missing} (too few dumps); use --split_by sample to include them")
+    print(f"Split: {len(train_idx)} train / {len(test_idx)} test samples (by {args.split_by})")
+
+    train_set = Subset(dataset, train_idx.tolist())
+    test_set = Subset(dataset, test_idx.tolist())
+    example = test_set[0][0].unsqueeze(0)
+    in_channels = input_channels(args.input_mode, args.depth)
+
+    results = {}
+    for arch in archs:
+        print(f"\n=== {arch} ===")
+        torch.manual_seed(args.seed)
+        model = build_model(arch, num_classes=len(dataset.classes), in_channels=in_channels)
+        loader = DataLoader(train_set, batch_size=args.batch_size, shuffle=True, num_workers=args.workers,
+                            persistent_workers=args.workers > 0, generator=torch.Generator().manual_seed(args.seed))
+        criterion = nn.CrossEntropyLoss()
+        optimizer = optim.Adam(model.parameters(), lr=args.lr)
+        throughput = []
+        acc = 0.0
+        for epoch in range(args.epochs):
+            loss, acc, samples_per_s = train_epoch(model, loader, criterion, optimizer)
+            throughput.append(samples_per_s)
+            print(f"Epoch [{epoch+1}/{args.epochs}] Loss: {loss:.4f} Accuracy: {acc:.2f}% ({samples_per_s:.1f} samples/s)")
+
+        model.eval()
+        test_acc, _ = evaluate_accuracy(model, test_set, batch_size=64)
+        with torch.no_grad():
+            latency = time_call(lambda: model(example), warmup=10, runs=args.runs)
+        results[arch] = {
+            'parameters': count_parameters(model),
+            'size_mb': sum(t.numel() * t.element_size() for t in model.state_dict().values()) / 1024 ** 2,
+            'train_accuracy': acc,
+            'test_accuracy': test_acc,
+            'train_samples_per_s': float(np.median(throughput)) if throughput else 0.0,
+            'latency_ms_median': latency['ms_median'],
+            'latency_ms_p95': latency['ms_p95'],
+        }
+
+    print(f"\nHeld-out accuracy and single-image CPU latency ({torch.get_num_threads()} threads):")
+    for arch, r in results.items():
+        print(f"  {arch:14s} {r['parameters']:>10,} params  {r['size_mb']:7.2f} MB  acc {r['test_accuracy']:6.2f}%  "
+              f"{r['latency_ms_median']:7.3f} ms (p95 {r['latency_ms_p95']:7.3f})")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'classes': dataset.classes, 'split_by': args.split_by, 'seed': args.seed,
+                       'train_samples': len(train_idx), 'test_samples': len(test_idx),
+                       'epochs': args.epochs, 'threads': torch.get_num_threads(), 'results': results}, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import importlib
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader, Subset
+from concurrent.futures import ProcessPoolExecutor
+
+from weapon_classifier import (ARCHITECTURES, CACHE_DTYPES, INPUT_MODES, SARDataset, SARStackDataset, SARTensorDataset, build_dataset,
+                               build_model, count_parameters, dataset_groups, dataset_labels, input_channels,
+                               stratified_folds, train_epoch)
+from benchmark_classifier import time_call
+
+# Reproducible quality/speed measurement of the SAR classifiers.
+#
+# Stratified k-fold cross-validation: every fold trains a fresh model from the
+# same seed on k-1 folds and evaluates it on the held-out fold. Folds run in
+# parallel on a process pool. The dataset is built once, so --cache_dir /
+# --tensor_store are preprocessed once and every worker memory-maps the same
+# files; the preprocessed dumps of the volumetric input modes are written to a
+# temporary .npy for that. Folds keep the slices of a dump together
+# (--split_by dump).
+#
+# Models: any weapon_classifier architecture (--archs) and, optionally, the
+# radar-cube Weapon3DCNN from bin_examples_and_parser/attempt1_SafeHaven3DCNN.py
+# on a folder of DCA1000 captures (--radar_dir, one subfolder per class).
+#
+# The JSON report holds, per model and fold: accuracy, per-class precision /
+# recall / F1, the confusion matrix (rows = true class, columns = predicted)
+# and single-image CPU latency; plus a fingerprint of the dataset so reports
+# of different dataset versions can be told apart.
+
+RADAR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin_examples_and_parser')
+
+# Per-process state, set by _init_worker
+_DATASETS = {}
+
+
+def _import_radar_module():
+    if RADAR_DIR not in sys.path:
+        sys.path.append(RADAR_DIR)
+    return importlib.import_module('attempt1_SafeHaven3DCNN')
+
+
+def radar_dataset(radar_dir, cube_size, cache_dir=None, method='fft_zoom', samples_per_chirp=256,
+                  window='hann', interleaved=False):
+    """WeaponRadarDataset over <radar_dir>/<class>/*.bin, with the class names as .classes."""
+    radar = _import_radar_module()
+    classes = sorted(d for d in os.listdir(radar_dir) if os.path.isdir(os.path.join(radar_dir, d)))
+    files, labels = [], []
+    for idx, cls_name in enumerate(classes):
+        for root, _, names in os.walk(os.path.join(radar_dir, cls_name)):
+            for name in sorted(names):
+                if name.endswith('.bin'):
+                    files.append(os.path.join(root, name))
+                    labels.append(idx)
+    if not files:
+        raise ValueError(f"No .bin captures found in {radar_dir}")
+    dataset = radar.WeaponRadarDataset(files, labels, cube_size=cube_size, cache_dir=cache_dir, method=method,
+                                       samples_per_chirp=samples_per_chirp, window=window, interleaved=interleaved)
+    dataset.classes = classes
+    return dataset
+
+
+def dataset_fingerprint(dataset):
+    """SHA-256 over the dataset's files (names, sizes, mtimes) and labels."""
+    if isinstance(dataset, SARDataset):
+        paths = [path for path, _ in dataset.images]
+    elif isinstance(dataset, SARTensorDataset):
+        paths = list(dataset.shard_paths)
+    elif hasattr(dataset, 'bin_files'):
+        paths = list(dataset.bin_files)
+    else:
+        paths = []
+    entries = []
+    for path in paths:
+        st = os.stat(path)
+        entries.append([os.path.basename(os.path.dirname(path)), os.path.basename(path), st.st_size, st.st_mtime_ns])
+    blob = json.dumps({'classes': dataset.classes, 'files': entries, 'groups': dataset_groups_any(dataset),
+                       'labels': [int(l) for l in dataset_labels_any(dataset)]})
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+def dataset_labels_any(dataset):
+    return list(dataset.labels) if hasattr(dataset, 'bin_files') else dataset_labels(dataset)
+
+
+def dataset_groups_any(dataset):
+    # Every radar capture is its own group
+    return list(dataset.bin_files) if hasattr(dataset, 'bin_files') else dataset_groups(dataset)
+
+
+def classification_metrics(labels, predictions, num_classes):
+    """Accuracy, confusion matrix and per-class precision/recall/F1."""
+    confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+    for true, pred in zip(labels, predictions):
+        confusion[true, pred] += 1
+    per_class = []
+    for c in range(num_classes):
+        tp = confusion[c, c]
+        precision = tp / confusion[:, c].sum() if confusion[:, c].sum() else 0.0
+        recall = tp / confusion[c, :].sum() if confusion[c, :].sum() else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        per_class.append({'precision': float(precision), 'recall': float(recall), 'f1': float(f1),
+                          'support': int(confusion[c, :].sum())})
+    total = confusion.sum()
+    return {
+        'accuracy': float(100.0 * np.trace(confusion) / total) if total else 0.0,
+        'macro_f1': float(np.mean([m['f1'] for m in per_class])),
+        'per_class': per_class,
+        'confusion_matrix': confusion.tolist(),
+    }
+
+
+def _init_worker(datasets, threads):
+    # Datasets arrive pickled as paths (without their memmaps) and reopen them lazily
+    _DATASETS.update(datasets)
+    if threads:
+        torch.set_num_threads(threads)
+
+
+def _make_model(model_name, num_classes, config):
+    if model_name == 'Weapon3DCNN':
+        return _import_radar_module().Weapon3DCNN(num_classes=num_classes, input_channels=1)
+    return build_model(model_name, num_classes=num_classes,
+                       in_channels=input_channels(config['input_mode'], config['depth']))
+
+
+def run_fold(job):
+    """Train and evaluate one (model, fold). Runs in a pool worker."""
+    model_name, dataset_key, fold, train_idx, test_idx, config = job
+    dataset = _DATASETS[dataset_key]
+    num_classes = len(dataset.classes)
+    torch.manual_seed(config['seed'] + fold)
+    model = _make_model(model_name, num_classes, config)
+    loader = DataLoader(Subset(dataset, train_idx), batch_size=config['batch_size'], shuffle=True,
+                        generator=torch.Generator().manual_seed(config['seed'] + fold))
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(model.parameters(), lr=config['lr'])
+
+    start = time.perf_counter()
+    train_acc = 0.0
+    throughput = []
+    for _ in range(config['epochs']):
+        _, train_acc, samples_per_s = train_epoch(model, loader, criterion, optimizer)
+        throughput.append(samples_per_s)
+    train_seconds = time.perf_counter() - start
+
+    model.eval()
+    labels, predictions = [], []
+    test_loader = DataLoader(Subset(dataset, test_idx), batch_size=config['batch_size'], shuffle=False)
+    with torch.no_grad():
+        for inputs, targets in test_loader:
+            predictions.extend(model(inputs).argmax(dim=1).tolist())
+            labels.extend(int(t) for t in targets)
+        example = dataset[test_idx[0]][0].unsqueeze(0)
+        latency = time_call(lambda: model(example), warmup=5, runs=config['latency_runs'])
+
+    result = classification_metrics(labels, predictions, num_classes)
+    result.update({
+        'fold': fold,
+        'train_samples': len(train_idx),
+        'test_samples': len(test_idx),
+        'train_accuracy': train_acc,
+        'train_seconds': train_seconds,
+        'train_samples_per_s': float(np.median(throughput)) if throughput else 0.0,
+        'latency_ms_median': latency['ms_median'],
+        'latency_ms_p95': latency['ms_p95'],
+        'parameters': count_parameters(model),
+    })
+    return model_name, result
+
+
+def summarize(folds):
+    def stats(key):
+        values = np.array([f[key] for f in folds], dtype=np.float64)
+        return {'mean': float(values.mean()), 'std': float(values.std())}
+    return {
+        'accuracy': stats('accuracy'),
+        'macro_f1': stats('macro_f1'),
+        'latency_ms_median': stats('latency_ms_median'),
+        'train_samples_per_s': stats('train_samples_per_s'),
+        'confusion_matrix': np.sum([f['confusion_matrix'] for f in folds], axis=0).tolist(),
+        'parameters': folds[0]['parameters'] if folds else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stratified k-fold training and evaluation of the SAR classifiers with a JSON report')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--data_dir', type=str, help='Training image folders (class subfolders)')
+    source.add_argument('--tensor_store', type=str, help='Training tensor store')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Preprocessed tensor cache for --data_dir (built once, shared by all workers)')
+    parser.add_argument('--cache_dtype', type=str, default='float16', choices=list(CACHE_DTYPES), help='Storage dtype of --cache_dir (default: float16)')
+    parser.add_argument('--archs', type=str, default='WeaponCNN', help=f"Comma-separated classifier architectures ({', '.join(ARCHITECTURES)}; default: WeaponCNN)")
+    parser.add_argument('--input_mode', type=str, default='slice', choices=list(INPUT_MODES), help='Input mode of the classifiers (default: slice)')
+    parser.add_argument('--depth', type=int, default=16, help='Z channels for --input_mode stack (default: 16)')
+    parser.add_argument('--radar_dir', type=str, default=None, help='Also evaluate Weapon3DCNN on DCA1000 captures in <radar_dir>/<class>/*.bin')
+    parser.add_argument('--cube_size', type=int, nargs=3, default=[64, 64, 32], help='Radar cube size (R D A) for Weapon3DCNN (default: 64 64 32)')
+    parser.add_argument('--cube_method', type=str, default='fft_zoom', choices=['fft_zoom', 'decimate', 'pool'], help="Radar cube computation: 'fft_zoom' (full FFTs + zoom), 'decimate' or 'pool' (target resolution) (default: fft_zoom)")
+    parser.add_argument('--cube_window', type=str, default='hann', choices=['none', 'hann'], help='Range/Doppler window of the radar cubes (default: hann)')
+    parser.add_argument('--samples_per_chirp', type=int, default=256, help='ADC samples per chirp of the radar captures (default: 256)')
+    parser.add_argument('--interleaved', action='store_true', help='Read the radar captures in the sample-interleaved layout, as stream_radar_inference.py --live does')
+    parser.add_argument('--radar_cache', type=str, default=None, help='Radar cube cache directory: cubes are computed once and memory-mapped by all workers')
+    parser.add_argument('--folds', type=int, default=5, help='Number of folds, >= 2 (default: 5)')
+    parser.add_argument('--split_by', type=str, default='dump', choices=['dump', 'sample'], help="Keep the slices of a dump in one fold ('dump', default) or split single samples")
+    parser.add_argument('--epochs', type=int, default=20, help='Training epochs per fold (default: 20)')
+    parser.add_argument('--batch_size', type=int, default=16, help='Batch size (default: 16)')
+    parser.add_argument('--lr', type=float, default=0.001, help='Learning rate (default: 0.001)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the folds, initialization and shuffling (default: 0)')
+    parser.add_argument('--workers', type=int, default=None, help='Folds trained in parallel (default: min(folds, CPU count); 1 runs in-process)')
+    parser.add_argument('--threads', type=int, default=None, help='torch threads per worker (default: CPU count / workers)')
+    parser.add_argument('--latency_runs', type=int, default=50, help='Timed single-image runs per fold (default: 50)')
+    parser.add_argument('--output', type=str, default='kfold_report.json', help='JSON report path (default: kfold_report.json)')
+    args = parser.parse_args()
+
+    if not (args.data_dir or args.tensor_store or args.radar_dir):
+        parser.error('one of --data_dir, --tensor_store or --radar_dir is required')
+    if args.folds < 2:
+        parser.error(f'--folds must be >= 2, got {args.folds}')
+    archs = [a.strip() for a in args.archs.split(',') if a.strip()] if (args.data_dir or args.tensor_store) else []
+    for arch in archs:
+        if arch not in ARCHITECTURES:
+            parser.error(f"Unknown architecture: {arch} (choose from {list(ARCHITECTURES)})")
+
+    datasets = {}
+    runs = [] # (model name, dataset key)
+    if archs:
+        datasets['sar'] = build_dataset(args.data_dir, args.tensor_store, args.cache_dir, args.cache_dtype,
+                                        args.input_mode, args.depth)
+        runs += [(arch, 'sar') for arch in archs]
+    if args.radar_dir:
+        datasets['radar'] = radar_dataset(args.radar_dir, tuple(args.cube_size), args.radar_cache, args.cube_method,
+                                           args.samples_per_chirp, args.cube_window, args.interleaved)
+        runs.append(('Weapon3DCNN', 'radar'))
+
+    config = {'epochs': args.epochs, 'batch_size': args.batch_size, 'lr': args.lr, 'seed': args.seed,
+              'input_mode': args.input_mode, 'depth': args.depth, 'latency_runs': args.latency_runs}
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'folds': args.folds, 'split_by': args.split_by,
+              'config': config, 'datasets': {}, 'models': {}}
+
+    jobs = []
+    for key, dataset in datasets.items():
+        labels = dataset_labels_any(dataset)
+        groups = dataset_groups_any(dataset) if args.split_by == 'dump' else None
+        folds = stratified_folds(labels, args.folds, groups=groups, seed=args.seed)
+        if any(len(fold) == 0 for fold in folds):
+            parser.error(f"Not enough {args.split_by}s in the {key} dataset for {args.folds} folds")
+        report['datasets'][key] = {
+            'source': os.path.abspath(args.radar_dir if key == 'radar' else (args.tensor_store or args.data_dir)),
+            'fingerprint': dataset_fingerprint(dataset),
+            'classes': dataset.classes,
+            'samples': len(labels),
+            'class_counts': {c: int(np.sum(np.asarray(labels) == i)) for i, c in enumerate(dataset.classes)},
+            'fold_sizes': [len(fold) for fold in folds],
+        }
+        for model_name, dataset_key in runs:
+            if dataset_key != key:
+                continue
+            for fold, test_idx in enumerate(folds):
+                train_idx = np.sort(np.concatenate([f for i, f in enumerate(folds) if i != fold]))
+                jobs.append((model_name, key, fold, train_idx.tolist(), test_idx.tolist(), config))
+
+    workers = args.workers or min(len(jobs), os.cpu_count() or 1)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+    print(f"Running {len(jobs)} folds ({', '.join(name for name, _ in runs)}) on {workers} workers x {threads} threads...")
+    results = {name: [] for name, _ in runs}
+    start = time.perf_counter()
+    shared_dir = None
+    if workers <= 1:
+        _init_worker(datasets, threads)
+        outcomes = map(run_fold, jobs)
+    else:
+        # In-RAM inputs would be pickled into every worker; share them as a memmap
+        for key, dataset in datasets.items():
+            if isinstance(dataset, SARStackDataset):
+                shared_dir = shared_dir or tempfile.TemporaryDirectory(prefix='kfold_')
+                dataset.share_inputs(os.path.join(shared_dir.name, f"{key}_inputs.npy"))
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(datasets, threads))
+        outcomes = pool.map(run_fold, jobs)
+    try:
+        for model_name, result in outcomes:
+            results[model_name].append(result)
+            print(f"  {model_name} fold {result['fold'] + 1}/{args.folds}: acc {result['accuracy']:6.2f}%  "
+                  f"macro F1 {result['macro_f1']:.3f}  {result['latency_ms_median']:.3f} ms/image")
+    finally:
+        if workers > 1:
+            pool.shutdown()
+        if shared_dir is not None:
+            shared_dir.cleanup()
+    report['wall_seconds'] = time.perf_counter() - start
+    report['workers'] = workers
+    report['threads_per_worker'] = threads
+
+    print("\nSummary:")
+    for model_name, dataset_key in runs:
+        folds = sorted(results[model_name], key=lambda r: r['fold'])
+        summary = summarize(folds)
+        report['models'][model_name] = {'dataset': dataset_key, 'folds': folds, 'summary': summary}
+        print(f"  {model_name:14s} acc {summary['accuracy']['mean']:6.2f}% ± {summary['accuracy']['std']:.2f}  "
+              f"macro F1 {summary['macro_f1']['mean']:.3f}  {summary['latency_ms_median']['mean']:.3f} ms/image  "
+              f"{summary['parameters']:,} params")
+
+    tmp_path = args.output + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, args.output)
+    print(f"Saved report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
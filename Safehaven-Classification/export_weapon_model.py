@@ -0,0 +1,304 @@
+import os
+import copy
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Subset
+
+from weapon_classifier import build_dataset, dataset_groups, dataset_labels, load_model, stratified_folds
+
+# Edge export of a trained WeaponCNN (e.g. for the Raspberry Pi 5 next to the gantry).
+#
+# Artifacts written to --out_dir:
+#   weapon_cnn_fp32.pt / .onnx          float reference (TorchScript / ONNX)
+#   weapon_cnn_int8_dynamic.pt / .onnx  int8 weights for the Linear layers (fc1 holds ~97% of the weights)
+#   weapon_cnn_int8_static.pt / .onnx   int8 weights + activations, calibrated on the training set
+#   <artifact>.classes / .json          class mapping and input description (as for the .pth)
+#   export_report.json                  CPU latency, throughput and accuracy vs. the float model
+#
+# Accuracy and disagreement are measured on held-out data, never on the
+# calibration samples: --eval_dir / --eval_tensor_store if given, else the
+# validation split of the training checkpoint (<model>.ckpt, train
+# --val_fraction), else a dump-grouped split of the data (--eval_fraction),
+# which the model itself may have been trained on.
+#
+# Static TorchScript quantization uses FX graph mode (no model changes needed).
+# ONNX int8 models are produced by onnxruntime's quantizer from the float ONNX
+# export; ONNX steps are skipped if onnx/onnxruntime are not installed.
+#
+# Use --backend qnnpack for ARM (Raspberry Pi), x86 (or fbgemm) for PCs. The
+# backend used for export must match the one used at inference time.
+
+ARTIFACT_PREFIX = 'weapon_cnn'
+
+
+def held_out_split(dataset, model_path, eval_fraction=0.2, seed=0):
+    """
+    (calibration indices, evaluation indices, source) over dataset. Uses the
+    validation split stored in the training checkpoint when it matches the
+    dataset, else a new split that keeps the slices of a dump together.
+    """
+    checkpoint_path = model_path + '.ckpt'
+    if os.path.exists(checkpoint_path):
+        # Our own file: it holds numpy/python RNG state, not only tensors
+        checkpoint = torch.load(checkpoint_path, map_location='cpu', weights_only=False)
+        split = checkpoint.get('split')
+        if (split and split['val'] and checkpoint.get('classes') == dataset.classes
+                and max(split['train'] + split['val']) < len(dataset)):
+            return split['train'], split['val'], f"validation split of {checkpoint_path}"
+    folds = stratified_folds(dataset_labels(dataset), max(2, int(round(1.0 / eval_fraction))),
+                             groups=dataset_groups(dataset), seed=seed)
+    calib_idx, eval_idx = np.sort(np.concatenate(folds[1:])).tolist(), folds[0].tolist()
+    if not calib_idx or not eval_idx:
+        raise ValueError(f"Not enough dumps for a {eval_fraction:.0%} evaluation split; pass --eval_dir or --eval_tensor_store")
+    print("Warning: no training checkpoint split; evaluating on a dump-grouped split the model may have been trained on")
+    return calib_idx, eval_idx, f"{eval_fraction:.0%} dump-grouped split (seed {seed})"
+
+
+def calibration_batches(dataset, num_samples=256, batch_size=32, seed=0):
+    """Random, reproducible subset of the training set for calibration."""
+    rng = np.random.default_rng(seed)
+    indices = rng.permutation(len(dataset))[:num_samples].tolist()
+    loader = DataLoader(Subset(dataset, indices), batch_size=batch_size, shuffle=False)
+    return [inputs for inputs, _ in loader]
+
+
+def quantize_dynamic_torch(model):
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static_torch(model, calib_batches, backend):
+    """Post-training static quantization (FX graph mode) with calibration."""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    torch.backends.quantized.engine = backend
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+    # prepare_fx rewrites the module; keep the float model intact for comparison
+    prepared = prepare_fx(copy.deepcopy(model).eval(), qconfig_mapping, example_inputs=(calib_batches[0],))
+    with torch.no_grad():
+        for inputs in calib_batches:
+            prepared(inputs)
+    return convert_fx(prepared)
+
+
+def save_torchscript(model, example, path):
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+    traced.save(path)
+    return path
+
+
+def export_onnx(model, example, path):
+    torch.onnx.export(model, example, path, input_names=['input'], output_names=['logits'],
+                      dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}}, opset_version=17)
+    return path
+
+
+def quantize_onnx(fp32_path, out_dir, calib_batches, modes):
+    """int8 ONNX models via onnxruntime.quantization. Returns {mode: path}."""
+    try:
+        from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                              quantize_dynamic, quantize_static)
+    except ImportError:
+        print("onnxruntime not installed; skipping int8 ONNX export (pip install onnxruntime)")
+        return {}
+
+    class _CalibrationReader(CalibrationDataReader):
+        def __init__(self, batches):
+            self._batches = iter([{'input': b.numpy()} for b in batches])
+
+        def get_next(self):
+            return next(self._batches, None)
+
+    paths = {}
+    if 'dynamic' in modes:
+        path = os.path.join(out_dir, f"{ARTIFACT_PREFIX}_int8_dynamic.onnx")
+        quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+        paths['dynamic'] = path
+    if 'static' in modes:
+        path = os.path.join(out_dir, f"{ARTIFACT_PREFIX}_int8_static.onnx")
+        quantize_static(fp32_path, path, _CalibrationReader(calib_batches), quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+        paths['static'] = path
+    return paths
+
+
+def onnx_runner(path, threads=None):
+    """Wrap an ONNX model as a callable taking/returning torch tensors."""
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+    session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def run(inputs):
+        return torch.from_numpy(session.run(None, {'input': inputs.numpy()})[0])
+    return run
+
+
+def evaluate_accuracy(run, dataset, batch_size=64, max_samples=None):
+    """Top-1 accuracy (%) and predictions of run() over (a prefix of) the dataset."""
+    indices = list(range(len(dataset) if not max_samples else min(max_samples, len(dataset))))
+    loader = DataLoader(Subset(dataset, indices), batch_size=batch_size, shuffle=False)
+    correct = 0
+    total = 0
+    predictions = []
+    with torch.no_grad():
+        for inputs, labels in loader:
+            predicted = run(inputs).argmax(dim=1)
+            predictions.append(predicted)
+            correct += (predicted == labels).sum().item()
+            total += labels.size(0)
+    return 100.0 * correct / max(total, 1), torch.cat(predictions) if predictions else torch.zeros(0)
+
+
+def benchmark(run, example, batch_size=32, warmup=10, runs=100):
+    """
+    CPU latency of single-image inference (median / p95 ms) and batched
+    throughput (images/s).
+    """
+    single = example[:1]
+    batch = example[:1].repeat(batch_size, 1, 1, 1)
+    with torch.no_grad():
+        for _ in range(warmup):
+            run(single)
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            run(single)
+            times.append(time.perf_counter() - start)
+        for _ in range(max(1, warmup // 5)):
+            run(batch)
+        batch_runs = max(3, runs // 10)
+        start = time.perf_counter()
+        for _ in range(batch_runs):
+            run(batch)
+        batch_time = time.perf_counter() - start
+    times_ms = np.array(times) * 1000.0
+    return {
+        'latency_ms_median': float(np.median(times_ms)),
+        'latency_ms_p95': float(np.percentile(times_ms, 95)),
+        'throughput_img_s': float(batch_size * batch_runs / batch_time),
+        'batch_size': batch_size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export WeaponCNN as int8-quantized TorchScript/ONNX and benchmark it on CPU')
+    parser.add_argument('--model_path', type=str, default='weapon_classifier.pth', help='Trained float model (state_dict)')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--data_dir', type=str, help='Training image folders (used for calibration and accuracy)')
+    source.add_argument('--tensor_store', type=str, help='Training tensor store (used for calibration and accuracy)')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Preprocessed tensor cache for --data_dir / --eval_dir')
+    held_out = parser.add_mutually_exclusive_group()
+    held_out.add_argument('--eval_dir', type=str, help='Held-out image folders for the accuracy comparison')
+    held_out.add_argument('--eval_tensor_store', type=str, help='Held-out tensor store for the accuracy comparison')
+    parser.add_argument('--eval_fraction', type=float, default=0.2, help='Held-out fraction of the dumps without --eval_dir/--eval_tensor_store or a checkpoint split (default: 0.2)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the held-out split and calibration subset (default: 0)')
+    parser.add_argument('--out_dir', type=str, default='exported_model', help='Output directory for the artifacts and report')
+    parser.add_argument('--modes', type=str, default='dynamic,static', help="Quantization modes: 'dynamic', 'static' or both (comma-separated)")
+    parser.add_argument('--formats', type=str, default='torchscript,onnx', help="Artifact formats: 'torchscript', 'onnx' or both (comma-separated)")
+    parser.add_argument('--backend', type=str, default='x86', choices=['x86', 'fbgemm', 'qnnpack'], help="Quantized engine: 'qnnpack' for ARM/Raspberry Pi, 'x86' or 'fbgemm' for PCs (default: x86)")
+    parser.add_argument('--calib_samples', type=int, default=256, help='Training samples used for static calibration (default: 256)')
+    parser.add_argument('--eval_samples', type=int, default=None, help='Samples used for the accuracy comparison (default: all)')
+    parser.add_argument('--threads', type=int, default=None, help='CPU threads for the benchmark (default: torch default)')
+    parser.add_argument('--bench_runs', type=int, default=100, help='Timed single-image runs per model (default: 100)')
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+    formats = [f.strip() for f in args.formats.split(',') if f.strip()]
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.backends.quantized.engine = args.backend
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    model, classes = load_model(args.model_path)
+    dataset = build_dataset(args.data_dir, args.tensor_store, args.cache_dir,
+                            input_mode=model.meta['input_mode'], depth=model.meta['depth'])
+    if dataset.classes != classes:
+        print(f"Warning: dataset classes {dataset.classes} differ from model classes {classes}; accuracy compares label indices")
+    if args.eval_dir or args.eval_tensor_store:
+        calib_set = dataset
+        eval_set = build_dataset(args.eval_dir, args.eval_tensor_store, args.cache_dir,
+                                 input_mode=model.meta['input_mode'], depth=model.meta['depth'])
+        eval_source = args.eval_dir or args.eval_tensor_store
+    else:
+        calib_idx, eval_idx, eval_source = held_out_split(dataset, args.model_path, args.eval_fraction, args.seed)
+        calib_set, eval_set = Subset(dataset, calib_idx), Subset(dataset, eval_idx)
+    print(f"Calibrating on {len(calib_set)} samples, evaluating on {len(eval_set)} held-out samples ({eval_source})")
+
+    print(f"Collecting {args.calib_samples} calibration samples...")
+    calib = calibration_batches(calib_set, args.calib_samples, seed=args.seed)
+    example = calib[0][:1]
+
+    # name -> callable taking a (B, 1, 100, 100) float tensor, returning logits
+    runners = {'fp32': model}
+    artifacts = {}
+
+    if 'dynamic' in modes:
+        print("Quantizing (dynamic int8)...")
+        runners['int8_dynamic'] = quantize_dynamic_torch(model)
+    if 'static' in modes:
+        print(f"Quantizing (static int8, {args.backend}, {len(calib)} calibration batches)...")
+        runners['int8_static'] = quantize_static_torch(model, calib, args.backend)
+
+    if 'torchscript' in formats:
+        for name in list(runners):
+            path = save_torchscript(runners[name], example, os.path.join(args.out_dir, f"{ARTIFACT_PREFIX}_{name}.pt"))
+            artifacts[f"torchscript_{name}"] = path
+            # Benchmark the scripted artifact, which is what the Pi will load
+            runners[f"torchscript_{name}"] = torch.jit.load(path)
+
+    if 'onnx' in formats:
+        try:
+            fp32_onnx = export_onnx(model, example, os.path.join(args.out_dir, f"{ARTIFACT_PREFIX}_fp32.onnx"))
+            artifacts['onnx_fp32'] = fp32_onnx
+            for mode, path in quantize_onnx(fp32_onnx, args.out_dir, calib, modes).items():
+                artifacts[f"onnx_int8_{mode}"] = path
+            for name in [n for n in artifacts if n.startswith('onnx_')]:
+                try:
+                    runners[name] = onnx_runner(artifacts[name], args.threads)
+                except ImportError:
+                    print(f"onnxruntime not installed; not benchmarking {name}")
+        except Exception as e:
+            print(f"ONNX export failed: {e}")
+
+    # Each artifact gets the class mapping and input description next to it, like the .pth
+    for suffix in ('.classes', '.json'):
+        if os.path.exists(args.model_path + suffix):
+            for path in artifacts.values():
+                shutil.copyfile(args.model_path + suffix, path + suffix)
+
+    print("Benchmarking...")
+    report = {'model_path': args.model_path, 'backend': args.backend, 'threads': torch.get_num_threads(),
+              'classes': classes, 'artifacts': artifacts, 'eval_source': eval_source,
+              'calib_samples': min(args.calib_samples, len(calib_set)), 'eval_samples': len(eval_set), 'results': {}}
+    fp32_acc, fp32_pred = evaluate_accuracy(model, eval_set, max_samples=args.eval_samples)
+    for name, run in runners.items():
+        acc, pred = (fp32_acc, fp32_pred) if name == 'fp32' else evaluate_accuracy(run, eval_set, max_samples=args.eval_samples)
+        result = benchmark(run, example, runs=args.bench_runs)
+        result.update({
+            'accuracy': acc,
+            'accuracy_delta': acc - fp32_acc,
+            # Fraction of samples where the quantized model disagrees with the float model
+            'disagreement': float((pred != fp32_pred).float().mean().item()) if len(pred) else 0.0,
+        })
+        if name in artifacts:
+            result['size_mb'] = os.path.getsize(artifacts[name]) / 1024 ** 2
+        report['results'][name] = result
+        print(f"  {name:24s} {result['latency_ms_median']:7.3f} ms (p95 {result['latency_ms_p95']:7.3f})  "
+              f"{result['throughput_img_s']:8.1f} img/s  acc {acc:6.2f}% ({result['accuracy_delta']:+.2f})")
+
+    report_path = os.path.join(args.out_dir, 'export_report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved artifacts and report to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
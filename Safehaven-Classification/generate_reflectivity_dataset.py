@@ -1,8 +1,23 @@
 import os
 import cv2
+import json
+import time
 import numpy as np
 import argparse
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+# Batch mode (directory input) walks the class folders recursively and mirrors
+# them under --output, processing images on a pool of worker processes.
+# Outputs that are newer than their inputs are skipped, so regenerating the
+# dataset after adding a few dumps only processes the new images.
+# <output>/reflectivity_manifest.json records every output (processed or up to
+# date) and the target size; changing --size regenerates everything. Outputs
+# the manifest does not know (e.g. no manifest yet) only count as up to date if
+# they already have the target size.
+
+VALID_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff'}
+MANIFEST_FILE = 'reflectivity_manifest.json'
 
 def process_image(input_path, output_path, target_size=(100, 100)):
     """
@@ -41,11 +56,125 @@ def process_image(input_path, output_path, target_size=(100, 100)):
     cv2.imwrite(str(output_path), output_img)
     return True
 
+def _run_job(job):
+    """Worker: process one image into a temporary file, then rename it into place."""
+    process_fn, input_path, output_path, target_size = job
+    root, ext = os.path.splitext(output_path)
+    tmp_path = f"{root}.{os.getpid()}.partial{ext}" # keep the extension for cv2.imwrite
+    try:
+        ok = process_fn(input_path, tmp_path, target_size)
+        if ok is False or not os.path.exists(tmp_path):
+            return input_path, False, 'could not load image'
+        # An interrupted run never leaves a truncated output that looks up to date
+        os.replace(tmp_path, output_path)
+        return input_path, True, None
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return input_path, False, str(e)
+
+def find_images(input_dir, output_dir, prefix='ref_'):
+    """
+    [(input_path, output_path)] for every image below input_dir (class folders are
+    recursed and mirrored under output_dir). output_dir is skipped if it lies
+    inside input_dir.
+    """
+    input_dir = os.path.abspath(input_dir)
+    output_dir = os.path.abspath(output_dir)
+    pairs = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != output_dir)
+        rel = os.path.relpath(root, input_dir)
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in VALID_EXTENSIONS:
+                pairs.append((os.path.join(root, name), os.path.normpath(os.path.join(output_dir, rel, prefix + name))))
+    return pairs
+
+def _up_to_date(input_path, output_path, known, target_size):
+    """Output newer than the input, and either recorded in the manifest (known) or already target_size."""
+    try:
+        if os.stat(output_path).st_mtime_ns < os.stat(input_path).st_mtime_ns:
+            return False
+    except OSError:
+        return False
+    if known:
+        return True
+    img = cv2.imread(output_path, cv2.IMREAD_UNCHANGED)
+    return img is not None and img.shape[:2] == (target_size[1], target_size[0])
+
+def _manifest_entry(input_path, output_path, output_dir):
+    return {'output': os.path.relpath(output_path, output_dir), 'input_mtime_ns': os.stat(input_path).st_mtime_ns}
+
+def process_tree(input_dir, output_dir, target_size=(100, 100), workers=None, force=False, prefix='ref_', process_fn=process_image):
+    """
+    Incremental, parallel batch processing of an image tree with process_fn(input, output, target_size).
+    Returns a summary dict (processed, skipped, failed, seconds, images_per_s).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    manifest = {'version': 1, 'size': list(target_size), 'files': {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous.get('size') == list(target_size):
+            manifest['files'] = previous.get('files', {})
+        else:
+            print(f"Target size changed ({previous.get('size')} -> {list(target_size)}); regenerating all images")
+            force = True
+
+    pairs = find_images(input_dir, output_dir, prefix)
+    known = manifest['files']
+    todo = []
+    manifest['files'] = {}
+    for i, o in pairs:
+        key = os.path.relpath(i, input_dir)
+        entry = known.get(key)
+        is_known = entry is not None and entry.get('output') == os.path.relpath(o, output_dir)
+        if force or not _up_to_date(i, o, is_known, target_size):
+            todo.append((i, o))
+        else:
+            # Up-to-date outputs are recorded too (inputs removed since the last run drop out)
+            manifest['files'][key] = _manifest_entry(i, o, output_dir)
+
+    start = time.perf_counter()
+    failed = []
+    if todo:
+        for out_dir in {os.path.dirname(o) for _, o in todo}:
+            os.makedirs(out_dir, exist_ok=True)
+        jobs = [(process_fn, i, o, tuple(target_size)) for i, o in todo]
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        print(f"Processing {len(todo)} of {len(pairs)} images on {workers} workers ({len(pairs) - len(todo)} up to date)...")
+        outputs = dict(todo)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for input_path, ok, error in pool.map(_run_job, jobs, chunksize=max(1, min(64, len(jobs) // (workers * 4)))):
+                if not ok:
+                    print(f"Warning: {input_path}: {error}")
+                    failed.append(input_path)
+                    continue
+                manifest['files'][os.path.relpath(input_path, input_dir)] = _manifest_entry(input_path, outputs[input_path], output_dir)
+    elapsed = time.perf_counter() - start
+
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+    processed = len(todo) - len(failed)
+    return {'processed': processed, 'skipped': len(pairs) - len(todo), 'failed': len(failed),
+            'seconds': elapsed, 'images_per_s': processed / elapsed if elapsed > 0 else 0.0}
+
+def print_summary(summary, output_dir):
+    print(f"\nBatch processing complete. {summary['processed']} images processed "
+          f"({summary['images_per_s']:.1f} images/s), {summary['skipped']} up to date, {summary['failed']} failed.")
+    print(f"Manifest: {os.path.join(output_dir, MANIFEST_FILE)}")
+
 def main():
     parser = argparse.ArgumentParser(description='Convert images to Reflectivity-Added format (100x100, Normalized Grayscale).')
     parser.add_argument('input', type=str, help='Input image file or directory containing images')
     parser.add_argument('--output', type=str, default='reflectivity_output', help='Output directory for processed images')
     parser.add_argument('--size', type=int, default=100, help='Target grid size (default: 100 for 100x100)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes for directory input (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='Regenerate all images, even those that are up to date')
     
     args = parser.parse_args()
     
@@ -65,16 +194,9 @@ def main():
             print(f"Processed: {input_path} -> {output_path}")
             
     elif input_path.is_dir():
-        # Process directory
-        valid_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff'}
-        count = 0
-        for file_path in input_path.iterdir():
-            if file_path.suffix.lower() in valid_extensions:
-                output_path = output_dir / f"ref_{file_path.name}"
-                if process_image(file_path, output_path, target_size):
-                    print(f"Processed: {file_path.name}")
-                    count += 1
-        print(f"\nBatch processing complete. {count} images processed.")
+        # Process the directory tree (class folders are mirrored under the output)
+        summary = process_tree(str(input_path), str(output_dir), target_size, workers=args.workers, force=args.force)
+        print_summary(summary, str(output_dir))
     else:
         print(f"Error: Input path '{input_path}' not found.")
 
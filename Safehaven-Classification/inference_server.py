@@ -0,0 +1,446 @@
+import os
+import json
+import time
+import queue
+import socket
+import struct
+import argparse
+import threading
+import socketserver
+from collections import deque
+import numpy as np
+import torch
+
+from weapon_classifier import generate_reflectivity_image, input_channels, load_model, predict_tensors
+
+# Local classification service with dynamic micro-batching.
+#
+# The batch pipeline, the streaming reconstructor and the frontend would each
+# load weapon_classifier.pth and run batch-size-1 predictions. Here the models
+# are loaded (and warmed up) once, and producers send preprocessed slices over
+# a TCP or Unix socket. Every model has one batcher thread: it takes the
+# oldest request, then keeps collecting requests until max_batch samples are
+# queued or the oldest one has waited max_wait_ms (the latency budget spent
+# on batching), and classifies all of them in one forward pass.
+#
+# Protocol (both directions): 4-byte big-endian header length, JSON header,
+# then header['nbytes'] bytes of payload.
+#   classify: {'op': 'classify', 'model': name, 'shape': [N, (C,) H, W]} + float32 slices
+#             -> {'ok': True, 'shape': [N, num_classes], 'classes', 'queue_ms',
+#                 'inference_ms', 'batch_samples'} + float32 probabilities
+#   stats:    {'op': 'stats'} -> {'ok': True, 'models': {name: stats}}
+#   models:   {'op': 'models'} -> {'ok': True, 'models': {name: {'classes', 'input_shape'}}}
+# Errors are answered with {'ok': False, 'error': message}.
+
+DEFAULT_PORT = 8765
+LATENCY_WINDOW = 10000 # Requests kept for the latency percentiles
+
+
+def _recv_exactly(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError('Connection closed')
+        data += chunk
+    return bytes(data)
+
+
+def send_message(sock, header, payload=b''):
+    header = dict(header, nbytes=len(payload))
+    encoded = json.dumps(header).encode('utf-8')
+    sock.sendall(struct.pack('>I', len(encoded)) + encoded + payload)
+
+
+def recv_message(sock):
+    length = struct.unpack('>I', _recv_exactly(sock, 4))[0]
+    header = json.loads(_recv_exactly(sock, length).decode('utf-8'))
+    payload = _recv_exactly(sock, header.get('nbytes', 0)) if header.get('nbytes') else b''
+    return header, payload
+
+
+def _percentiles(values):
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    values = np.asarray(values)
+    return {'p50': float(np.percentile(values, 50)), 'p95': float(np.percentile(values, 95)),
+            'p99': float(np.percentile(values, 99))}
+
+
+class _Request:
+    def __init__(self, tensors):
+        self.tensors = tensors
+        self.arrival = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Micro-batches classify() calls of many threads for one warm model.
+    classify(tensors) blocks until the probabilities of its (N, C, H, W)
+    slices are ready and returns (probabilities, info).
+    """
+
+    def __init__(self, model, classes, max_batch=64, max_wait_ms=5.0, device='cpu'):
+        self.model = model
+        self.classes = classes
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.device = device
+        self.input_shape = (input_channels(model.meta['input_mode'], model.meta['depth']), 100, 100)
+        self.queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._queued_samples = 0
+        self._max_queued_samples = 0
+        self._requests = 0
+        self._samples = 0
+        self._batches = 0
+        self._latency_ms = deque(maxlen=LATENCY_WINDOW)
+        self._queue_ms = deque(maxlen=LATENCY_WINDOW)
+        self._inference_ms = deque(maxlen=LATENCY_WINDOW)
+        self._warmup()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _warmup(self):
+        # First forward passes allocate buffers / pick kernels; keep that off the first requests
+        for n in sorted({1, self.max_batch}):
+            predict_tensors(self.model, np.zeros((n,) + self.input_shape, dtype=np.float32), batch_size=n, device=self.device)
+
+    def classify(self, tensors):
+        tensors = np.asarray(tensors, dtype=np.float32)
+        if tensors.ndim == 3:
+            tensors = tensors[:, None]
+        if tensors.shape[1:] != self.input_shape:
+            raise ValueError(f"Expected slices of shape {list(self.input_shape)}, got {list(tensors.shape[1:])}")
+        request = _Request(tensors)
+        with self._lock:
+            self._queued_samples += len(tensors)
+            self._max_queued_samples = max(self._max_queued_samples, self._queued_samples)
+        self.queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise RuntimeError(request.error)
+        return request.result
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = [first]
+            samples = len(first.tensors)
+            deadline = first.arrival + self.max_wait
+            stop = False
+            while samples < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+                samples += len(request.tensors)
+            self._classify_batch(batch, samples)
+            if stop:
+                return
+
+    def _classify_batch(self, batch, samples):
+        start = time.perf_counter()
+        with self._lock:
+            self._queued_samples -= samples
+        try:
+            probabilities = predict_tensors(self.model, np.concatenate([r.tensors for r in batch]),
+                                            batch_size=max(self.max_batch, samples), device=self.device)
+        except Exception as e:
+            for request in batch:
+                request.error = f"{type(e).__name__}: {e}"
+                request.done.set()
+            return
+        done = time.perf_counter()
+        inference_ms = (done - start) * 1000.0
+        offset = 0
+        with self._lock:
+            self._batches += 1
+            self._inference_ms.append(inference_ms)
+            for request in batch:
+                n = len(request.tensors)
+                queue_ms = (start - request.arrival) * 1000.0
+                request.result = (probabilities[offset:offset + n],
+                                  {'queue_ms': queue_ms, 'inference_ms': inference_ms, 'batch_samples': samples})
+                offset += n
+                self._requests += 1
+                self._samples += n
+                self._queue_ms.append(queue_ms)
+                self._latency_ms.append((done - request.arrival) * 1000.0)
+        for request in batch:
+            request.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'samples': self._samples,
+                'batches': self._batches,
+                'mean_batch_samples': self._samples / self._batches if self._batches else 0.0,
+                'queue_depth_requests': self.queue.qsize(),
+                'queue_depth_samples': self._queued_samples,
+                'max_queue_depth_samples': self._max_queued_samples,
+                'latency_ms': _percentiles(list(self._latency_ms)),
+                'queue_ms': _percentiles(list(self._queue_ms)),
+                'inference_ms': _percentiles(list(self._inference_ms)),
+            }
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        batchers = self.server.batchers
+        while True:
+            try:
+                header, payload = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                op = header.get('op')
+                if op == 'classify':
+                    name = header.get('model') or next(iter(batchers))
+                    if name not in batchers:
+                        raise ValueError(f"Unknown model: {name} (serving {list(batchers)})")
+                    tensors = np.frombuffer(payload, dtype=np.float32).reshape(header['shape'])
+                    probabilities, info = batchers[name].classify(tensors)
+                    send_message(self.request, dict(info, ok=True, model=name, shape=list(probabilities.shape),
+                                                    classes=batchers[name].classes),
+                                 np.ascontiguousarray(probabilities, dtype=np.float32).tobytes())
+                elif op == 'stats':
+                    send_message(self.request, {'ok': True, 'models': {n: b.stats() for n, b in batchers.items()}})
+                elif op == 'models':
+                    send_message(self.request, {'ok': True, 'models': {n: {'classes': b.classes, 'input_shape': list(b.input_shape)}
+                                                                      for n, b in batchers.items()}})
+                else:
+                    raise ValueError(f"Unknown op: {op}")
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                send_message(self.request, {'ok': False, 'error': f"{type(e).__name__}: {e}"})
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class InferenceClient:
+    """
+    Connection to a running inference server (TCP host/port, or unix_path).
+
+        with InferenceClient() as client:
+            probabilities, classes, info = client.classify(slices)
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, unix_path=None, timeout=None):
+        if unix_path:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(unix_path)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(timeout)
+
+    def _call(self, header, payload=b''):
+        send_message(self.sock, header, payload)
+        header, payload = recv_message(self.sock)
+        if not header.get('ok'):
+            raise RuntimeError(header.get('error', 'Inference server error'))
+        return header, payload
+
+    def classify(self, tensors, model=None):
+        """
+        Classifies preprocessed (N, 100, 100) reflectivity slices (or (N, C, 100, 100)
+        volumetric inputs). Returns (probabilities, classes, info).
+        """
+        tensors = np.ascontiguousarray(tensors, dtype=np.float32)
+        header, payload = self._call({'op': 'classify', 'model': model, 'shape': list(tensors.shape)}, tensors.tobytes())
+        probabilities = np.frombuffer(payload, dtype=np.float32).reshape(header['shape'])
+        info = {k: header[k] for k in ('model', 'queue_ms', 'inference_ms', 'batch_samples')}
+        return probabilities, header['classes'], info
+
+    def stats(self):
+        return self._call({'op': 'stats'})[0]['models']
+
+    def models(self):
+        return self._call({'op': 'models'})[0]['models']
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _model_specs(specs):
+    """'path' or 'name=path' -> {name: path}; the name defaults to the file name without extension."""
+    models = {}
+    for spec in specs:
+        name, _, path = spec.rpartition('=')
+        models[name or os.path.splitext(os.path.basename(path))[0]] = path
+    return models
+
+
+def _print_stats(stats):
+    for name, s in stats.items():
+        print(f"  {name}: {s['requests']} requests, {s['samples']} slices in {s['batches']} batches "
+              f"(mean {s['mean_batch_samples']:.1f}), queue {s['queue_depth_samples']} slices (max {s['max_queue_depth_samples']}), "
+              f"latency p50 {s['latency_ms']['p50']:.2f} / p95 {s['latency_ms']['p95']:.2f} / p99 {s['latency_ms']['p99']:.2f} ms")
+
+
+def serve(args):
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    batchers = {}
+    for name, path in _model_specs(args.model).items():
+        model, classes = load_model(path, device=args.device)
+        batchers[name] = MicroBatcher(model, classes, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms, device=args.device)
+        print(f"Loaded {name} ({model.meta['arch']}, {model.meta['input_mode']}) from {path}: {classes}")
+
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.remove(args.unix)
+        server = _UnixServer(args.unix, _Handler)
+        address = args.unix
+    else:
+        server = _TCPServer((args.host, args.port), _Handler)
+        address = f"{args.host}:{args.port}"
+    server.batchers = batchers
+    print(f"Serving {list(batchers)} on {address} (max batch {args.max_batch}, max wait {args.max_wait_ms} ms, "
+          f"{torch.get_num_threads()} threads)")
+
+    if args.stats_interval > 0:
+        def report():
+            while True:
+                time.sleep(args.stats_interval)
+                _print_stats({n: b.stats() for n, b in batchers.items()})
+        threading.Thread(target=report, daemon=True).start()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for batcher in batchers.values():
+            batcher.close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+        _print_stats({n: b.stats() for n, b in batchers.items()})
+
+
+def _client(args):
+    return InferenceClient(args.host, args.port, unix_path=args.unix)
+
+
+def bench(args):
+    """Concurrent clients sending single slices: throughput and client-side latency."""
+    with _client(args) as client:
+        models = client.models()
+    input_shape = models[args.name or next(iter(models))]['input_shape']
+    slices = np.random.default_rng(0).random([args.clients] + input_shape, dtype=np.float32)
+    latencies = [[] for _ in range(args.clients)]
+
+    def worker(i):
+        with _client(args) as client:
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                client.classify(slices[i:i + 1], model=args.name)
+                latencies[i].append((time.perf_counter() - start) * 1000.0)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    total = args.clients * args.requests
+    latency = _percentiles([ms for per_client in latencies for ms in per_client])
+    print(f"{total} requests from {args.clients} clients in {elapsed:.2f} s ({total / elapsed:.1f} slices/s), "
+          f"client latency p50 {latency['p50']:.2f} / p95 {latency['p95']:.2f} / p99 {latency['p99']:.2f} ms")
+    with _client(args) as client:
+        _print_stats(client.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-batching classification server for SAR slices')
+    subparsers = parser.add_subparsers(dest='command', help='Command to run')
+
+    def add_address(p):
+        p.add_argument('--host', type=str, default='127.0.0.1', help='Server host (default: 127.0.0.1)')
+        p.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Server port (default: {DEFAULT_PORT})')
+        p.add_argument('--unix', type=str, default=None, help='Unix socket path instead of TCP')
+
+    serve_parser = subparsers.add_parser('serve', help='Load the models and serve classifications')
+    serve_parser.add_argument('--model', type=str, action='append', required=True, help="Model to serve, 'path' or 'name=path' (repeatable; the first one is the default)")
+    add_address(serve_parser)
+    serve_parser.add_argument('--max_batch', type=int, default=64, help='Maximum slices per forward pass (default: 64)')
+    serve_parser.add_argument('--max_wait_ms', type=float, default=5.0, help='Latency budget: how long the oldest request waits for a batch to fill (default: 5)')
+    serve_parser.add_argument('--threads', type=int, default=None, help='torch.set_num_threads (default: torch default)')
+    serve_parser.add_argument('--device', type=str, default='cpu', help='Torch device (default: cpu)')
+    serve_parser.add_argument('--stats_interval', type=float, default=0, help='Print queue depth and latency percentiles every N seconds (default: 0, only on exit)')
+
+    classify_parser = subparsers.add_parser('classify', help='Classify images with a running server')
+    classify_parser.add_argument('images', nargs='+', help='Slice images')
+    classify_parser.add_argument('--name', type=str, default=None, help='Model name (default: the server default)')
+    add_address(classify_parser)
+
+    stats_parser = subparsers.add_parser('stats', help='Queue depth and latency percentiles of a running server')
+    stats_parser.add_argument('--json', action='store_true', help='Print the raw JSON')
+    add_address(stats_parser)
+
+    bench_parser = subparsers.add_parser('bench', help='Load test a running server with concurrent single-slice clients')
+    bench_parser.add_argument('--clients', type=int, default=8, help='Concurrent clients (default: 8)')
+    bench_parser.add_argument('--requests', type=int, default=100, help='Requests per client (default: 100)')
+    bench_parser.add_argument('--name', type=str, default=None, help='Model name (default: the server default)')
+    add_address(bench_parser)
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        serve(args)
+    elif args.command == 'classify':
+        tensors = np.stack([generate_reflectivity_image(path, target_size=(100, 100)) for path in args.images])
+        with _client(args) as client:
+            probabilities, classes, info = client.classify(tensors, model=args.name)
+        for path, probs in zip(args.images, probabilities):
+            idx = int(np.argmax(probs))
+            print(f"{path}: {classes[idx]} (Confidence: {probs[idx]:.2f})")
+        print(f"Model {info['model']}: queued {info['queue_ms']:.2f} ms, batch of {info['batch_samples']} in {info['inference_ms']:.2f} ms")
+    elif args.command == 'stats':
+        with _client(args) as client:
+            stats = client.stats()
+        if args.json:
+            print(json.dumps(stats, indent=2))
+        else:
+            _print_stats(stats)
+    elif args.command == 'bench':
+        bench(args)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
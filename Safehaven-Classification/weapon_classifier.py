@@ -5,11 +5,17 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, Subset
 from torchvision import transforms
 from PIL import Image
 import argparse
 import glob
+import random
+import re
+import json
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # ==========================================
 # Phase 1: Reflectivity Added Image Generation
@@ -79,6 +85,13 @@ def generate_reflectivity_image(input_path, output_path=None, target_size=(100,
         
     return rho_resized
 
+def write_reflectivity_image(input_path, output_path, target_size=(100, 100)):
+    """
+    Batch-mode worker for `preprocess` on a directory (no per-image logging).
+    """
+    rho_resized = generate_reflectivity_image(input_path, target_size=target_size)
+    return cv2.imwrite(output_path, (rho_resized * 255).astype(np.uint8))
+
 # ==========================================
 # Phase 3: CNN Classifier Architecture
 # ==========================================
@@ -95,14 +108,18 @@ class WeaponCNN(nn.Module):
     - Flatten
     - Dense Layer 1: 64 neurons, ReLU
     - Output Layer: 3 classes (Softmax implied by CrossEntropyLoss in training)
+
+    in_channels > 1 gives the volumetric variant: a whole dump in one forward
+    pass, either as a depth-resampled z-stack (one channel per depth) or as its
+    three MIPs (see stack_to_input).
     """
-    def __init__(self, num_classes=3):
+    def __init__(self, num_classes=3, in_channels=1):
         super(WeaponCNN, self).__init__()
         
-        # Input shape: (Batch, 1, 100, 100) - Assuming grayscale input
+        # Input shape: (Batch, in_channels, 100, 100) - 1 channel for a grayscale slice
         
         # Layer 1
-        self.conv1 = nn.Conv2d(in_channels=1, out_channels=32, kernel_size=3, padding=1)
+        self.conv1 = nn.Conv2d(in_channels=in_channels, out_channels=32, kernel_size=3, padding=1)
         self.pool = nn.MaxPool2d(kernel_size=2, stride=2)
         
         # Layer 2
@@ -141,8 +158,8 @@ class WeaponCNN(nn.Module):
         # Layer 3
         x = F.relu(self.conv3(x))
         
-        # Flatten
-        x = x.view(-1, self.flatten_size)
+        # Flatten (reshape: a channels_last activation can't be viewed as (N, C*H*W))
+        x = x.reshape(-1, self.flatten_size)
         
         # Dense 1
         x = F.relu(self.fc1(x))
@@ -152,6 +169,221 @@ class WeaponCNN(nn.Module):
         # Note: Softmax is usually applied in the Loss function (CrossEntropyLoss) in PyTorch
         return x
 
+class WeaponCNNLite(nn.Module):
+    """
+    Lightweight variant of WeaponCNN for CPU/edge inference.
+
+    WeaponCNN flattens 64x25x25 = 40,000 features into fc1 (2.56M of its ~2.6M
+    parameters). This variant keeps the receptive field but replaces the dense
+    head with global average pooling, and uses depthwise-separable convolutions:
+    - Conv 3x3, 16 filters, BN, ReLU, Max Pooling            (100 -> 50)
+    - Depthwise-separable 3x3, 32 filters, Max Pooling       (50 -> 25)
+    - Depthwise-separable 3x3, 64 filters, Max Pooling       (25 -> 12)
+    - Depthwise-separable 3x3, 128 filters
+    - Global Average Pooling -> Linear(128, num_classes)
+    About 13k parameters; the input size is not fixed.
+    """
+    def __init__(self, num_classes=3, in_channels=1):
+        super(WeaponCNNLite, self).__init__()
+        self.stem = nn.Sequential(
+            nn.Conv2d(in_channels, 16, kernel_size=3, padding=1, bias=False),
+            nn.BatchNorm2d(16),
+            nn.ReLU(inplace=True),
+        )
+        self.block1 = self._separable(16, 32)
+        self.block2 = self._separable(32, 64)
+        self.block3 = self._separable(64, 128)
+        self.pool = nn.MaxPool2d(kernel_size=2, stride=2)
+        self.gap = nn.AdaptiveAvgPool2d(1)
+        self.fc = nn.Linear(128, num_classes)
+
+    @staticmethod
+    def _separable(in_channels, out_channels):
+        # Depthwise 3x3 (one filter per channel) followed by a pointwise 1x1 mix
+        return nn.Sequential(
+            nn.Conv2d(in_channels, in_channels, kernel_size=3, padding=1, groups=in_channels, bias=False),
+            nn.BatchNorm2d(in_channels),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(in_channels, out_channels, kernel_size=1, bias=False),
+            nn.BatchNorm2d(out_channels),
+            nn.ReLU(inplace=True),
+        )
+
+    def forward(self, x):
+        x = self.pool(self.stem(x))
+        x = self.pool(self.block1(x))
+        x = self.pool(self.block2(x))
+        x = self.block3(x)
+        x = self.gap(x).flatten(1)
+        return self.fc(x)
+
+# Architectures selectable with train --arch; the name is stored in <model>.json
+ARCHITECTURES = {'WeaponCNN': WeaponCNN, 'WeaponCNNLite': WeaponCNNLite}
+
+def build_model(arch='WeaponCNN', num_classes=3, in_channels=1):
+    if arch not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture: {arch} (choose from {list(ARCHITECTURES)})")
+    return ARCHITECTURES[arch](num_classes=num_classes, in_channels=in_channels)
+
+def count_parameters(model):
+    return sum(p.numel() for p in model.parameters())
+
+class WeaponHeatmapNet(nn.Module):
+    """
+    Fully-convolutional view of a trained classifier for localization.
+
+    One forward pass over a full-size image (any size >= 100x100) gives class
+    logits for every `window` x `window` pixel window at a stride of `stride` pixels, i.e. a
+    (num_classes, rows, cols) map instead of one label per image. The trained
+    weights are reused, nothing is retrained:
+    - WeaponCNN: fc1 (64*25*25 -> 64) becomes a 25x25 convolution over the
+      conv3 features (a 1x1 convolution per window, applied at every position)
+      and fc2 a 1x1 convolution; stride 4
+    - WeaponCNNLite: the fc after global average pooling becomes a 1x1
+      convolution followed by a 12x12 average pool (pooling and fc commute);
+      stride 8, and windows are 96x96 (the three poolings drop the last 4
+      rows/columns of a 100x100 crop)
+    For a 100x100 input the map is 1x1 and equals the model's output. Inside
+    larger images, windows see their real neighbours instead of the zero
+    padding at a crop's border, so cells differ slightly from running the
+    model on the crop.
+    """
+    def __init__(self, model):
+        super(WeaponHeatmapNet, self).__init__()
+        if isinstance(model, WeaponCNN):
+            self.stride, self.window = 4, 100
+            self.features = nn.Sequential(model.conv1, nn.ReLU(), model.pool,
+                                          model.conv2, nn.ReLU(), model.pool,
+                                          model.conv3, nn.ReLU())
+            channels, side = model.fc1.in_features // (25 * 25), 25
+            fc1 = nn.Conv2d(channels, model.fc1.out_features, kernel_size=side)
+            fc1.weight.data.copy_(model.fc1.weight.data.view(model.fc1.out_features, channels, side, side))
+            fc1.bias.data.copy_(model.fc1.bias.data)
+            fc2 = nn.Conv2d(model.fc2.in_features, model.fc2.out_features, kernel_size=1)
+            fc2.weight.data.copy_(model.fc2.weight.data.view(model.fc2.out_features, model.fc2.in_features, 1, 1))
+            fc2.bias.data.copy_(model.fc2.bias.data)
+            self.head = nn.Sequential(fc1, nn.ReLU(), fc2)
+        elif isinstance(model, WeaponCNNLite):
+            self.stride, self.window = 8, 96
+            self.features = nn.Sequential(model.stem, model.pool, model.block1, model.pool,
+                                          model.block2, model.pool, model.block3)
+            fc = nn.Conv2d(model.fc.in_features, model.fc.out_features, kernel_size=1)
+            fc.weight.data.copy_(model.fc.weight.data.view(model.fc.out_features, model.fc.in_features, 1, 1))
+            fc.bias.data.copy_(model.fc.bias.data)
+            self.head = nn.Sequential(fc, nn.AvgPool2d(kernel_size=12, stride=1))
+        else:
+            raise ValueError(f"No fully-convolutional variant for {type(model).__name__}")
+        self.meta = getattr(model, 'meta', None)
+
+    def forward(self, x):
+        return self.head(self.features(x))
+
+def heatmap_to_image(heatmap, image_shape, stride, window):
+    """
+    Resamples a (rows, cols) window map to image pixels: every cell is placed at
+    its window's centre, the borders (less than half a window) repeat the edge.
+    """
+    rows, cols = heatmap.shape
+    up = cv2.resize(np.asarray(heatmap, dtype=np.float32), (cols * stride, rows * stride), interpolation=cv2.INTER_LINEAR)
+    offset = (window - stride) // 2
+    bottom = max(0, image_shape[0] - offset - up.shape[0])
+    right = max(0, image_shape[1] - offset - up.shape[1])
+    return cv2.copyMakeBorder(up, offset, bottom, offset, right, cv2.BORDER_REPLICATE)[:image_shape[0], :image_shape[1]]
+
+def predict_heatmap(model, image_path, classes, target_size=(200, 200), noise_class='Noise', device='cpu'):
+    """
+    Class-probability heatmap of a full-size slice (or MIP image) in one forward pass.
+
+    The image is preprocessed like training images but resized to target_size
+    (width, height) instead of 100x100, so a 100x100 window covers
+    100 / width x 100 / height of the slice. Returns a dict with the
+    reflectivity image, the (num_classes, rows, cols) probabilities, the
+    stride, the per-class peak (probability and window centre in pixels and
+    as a fraction of the image) and a weapon map (1 - P(noise_class), or the
+    maximum class probability without a noise class) at image resolution.
+    """
+    if min(target_size) < 100:
+        raise ValueError(f"target_size must be at least 100x100 (the training image size), got {target_size}")
+    net = model if isinstance(model, WeaponHeatmapNet) else WeaponHeatmapNet(model)
+    net.to(device).eval()
+    rho = generate_reflectivity_image(image_path, target_size=tuple(target_size))
+    with torch.no_grad():
+        logits = net(torch.from_numpy(rho).float()[None, None].to(device))
+        probs = F.softmax(logits, dim=1)[0].cpu().numpy()
+
+    peaks = {}
+    half = net.window / 2.0
+    for idx, name in enumerate(classes):
+        row, col = np.unravel_index(int(np.argmax(probs[idx])), probs[idx].shape)
+        x, y = col * net.stride + half, row * net.stride + half
+        peaks[name] = {'probability': float(probs[idx, row, col]), 'x': x, 'y': y,
+                       'x_fraction': x / rho.shape[1], 'y_fraction': y / rho.shape[0]}
+    if noise_class in classes:
+        weapon = 1.0 - probs[classes.index(noise_class)]
+    else:
+        weapon = probs.max(axis=0)
+    return {'image': rho, 'probabilities': probs, 'stride': net.stride, 'peaks': peaks,
+            'weapon_map': heatmap_to_image(weapon, rho.shape, net.stride, net.window)}
+
+def write_heatmap_overlay(result, output_path):
+    """
+    Saves the reflectivity image with the weapon map blended on top (JET colormap).
+    """
+    gray = cv2.cvtColor((result['image'] * 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+    heat = cv2.applyColorMap((np.clip(result['weapon_map'], 0, 1) * 255).astype(np.uint8), cv2.COLORMAP_JET)
+    return cv2.imwrite(output_path, cv2.addWeighted(gray, 0.5, heat, 0.5, 0))
+
+# ==========================================
+# Volumetric (whole-dump) input
+# ==========================================
+
+INPUT_MODES = ('slice', 'stack', 'mips')
+
+def input_channels(input_mode, depth=16):
+    """
+    Number of CNN input channels for an input mode.
+    """
+    return {'slice': 1, 'stack': depth, 'mips': 3}[input_mode]
+
+def slice_sort_key(path):
+    """
+    Orders dump images by depth (sar_z<z>.png), falling back to the file name.
+    """
+    match = re.search(r'z(-?\d+(?:\.\d+)?)', os.path.basename(path))
+    return (0, float(match.group(1)), path) if match else (1, 0.0, path)
+
+def stack_to_input(volume, input_mode='stack', depth=16):
+    """
+    Turns a dump's (Z, 100, 100) reflectivity stack into one (C, 100, 100) CNN input.
+
+    - 'stack': linear resampling along Z to `depth` slices (one channel each),
+      so sweeps of any length/step give the same input size
+    - 'mips':  the three Maximum Intensity Projections (X-Y, X-Z, Y-Z), the X-Z
+      and Y-Z ones resized to 100x100
+    """
+    volume = np.asarray(volume, dtype=np.float32)
+    if input_mode == 'stack':
+        positions = np.linspace(0, len(volume) - 1, depth)
+        lo = np.floor(positions).astype(int)
+        hi = np.minimum(lo + 1, len(volume) - 1)
+        frac = (positions - lo).astype(np.float32)[:, None, None]
+        return volume[lo] * (1 - frac) + volume[hi] * frac
+    if input_mode == 'mips':
+        height, width = volume.shape[1:]
+        mip_xy = volume.max(axis=0)
+        mip_xz = cv2.resize(volume.max(axis=1), (width, height), interpolation=cv2.INTER_LINEAR)
+        mip_yz = cv2.resize(volume.max(axis=2), (width, height), interpolation=cv2.INTER_LINEAR)
+        return np.stack([mip_xy, mip_xz, mip_yz])
+    raise ValueError(f"Unknown volumetric input mode: {input_mode}")
+
+def load_dump_stack(image_paths, threads=None):
+    """
+    Preprocesses a dump's slice images (any order) into a depth-sorted (Z, 100, 100) stack.
+    """
+    image_paths = sorted(image_paths, key=slice_sort_key)
+    with ThreadPoolExecutor(max_workers=threads or min(8, os.cpu_count() or 1)) as pool:
+        return np.stack(list(pool.map(lambda p: generate_reflectivity_image(p, target_size=(100, 100)), image_paths)))
+
 # ==========================================
 # Helper for Inference
 # ==========================================
@@ -181,18 +413,235 @@ def predict_weapon(model, image_path, classes=['Knife', 'MetalPlate', 'Noise', '
     
     return class_name, conf_score
 
+DEFAULT_CLASSES = ['Knife', 'MetalPlate', 'Noise', 'Scissors']
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+def load_classes(model_path):
+    """
+    Reads the <model_path>.classes mapping written by train_model.
+    """
+    classes_file = model_path + ".classes"
+    if os.path.exists(classes_file):
+        with open(classes_file, 'r') as f:
+            return [line.strip() for line in f.readlines()]
+    print("Warning: Class mapping file not found. Using default classes.")
+    return list(DEFAULT_CLASSES)
+
+def load_model_meta(model_path):
+    """
+    Reads <model_path>.json (input mode, depth, ...) written by train_model.
+    Models without it are per-slice WeaponCNNs.
+    """
+    meta = {'arch': 'WeaponCNN', 'input_mode': 'slice', 'depth': 1}
+    if os.path.exists(model_path + ".json"):
+        with open(model_path + ".json", 'r', encoding='utf-8') as f:
+            meta.update(json.load(f))
+    return meta
+
+def load_model(model_path, device='cpu'):
+    """
+    Loads a trained WeaponCNN (or another architecture named in <model>.json)
+    and its classes once, ready for inference.
+    The returned model carries its metadata as model.meta.
+    """
+    classes = load_classes(model_path)
+    meta = load_model_meta(model_path)
+    model = build_model(meta['arch'], num_classes=len(classes), in_channels=input_channels(meta['input_mode'], meta['depth']))
+    model.load_state_dict(torch.load(model_path, map_location=device))
+    model.to(device).eval()
+    model.meta = meta
+    return model, classes
+
+def predict_tensors(model, tensors, batch_size=64, device='cpu'):
+    """
+    Runs batched inference on preprocessed (N, 100, 100) reflectivity images
+    (or (N, C, 100, 100) volumetric inputs).
+    Returns an (N, num_classes) numpy array of softmax probabilities.
+    """
+    model.eval()
+    probabilities = []
+    with torch.no_grad():
+        for start in range(0, len(tensors), batch_size):
+            batch = torch.from_numpy(np.asarray(tensors[start:start + batch_size], dtype=np.float32))
+            if batch.dim() == 3:
+                batch = batch.unsqueeze(1)
+            outputs = model(batch.to(device))
+            probabilities.append(F.softmax(outputs, dim=1).cpu().numpy())
+    if not probabilities:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.concatenate(probabilities)
+
+def _import_sar_module(name):
+    """
+    Imports a module from ../Safehaven-Lua (SAR volume store / tensor helpers).
+    """
+    import importlib
+    import sys
+    lua_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Safehaven-Lua')
+    if lua_dir not in sys.path:
+        sys.path.append(lua_dir)
+    return importlib.import_module(name)
+
+def collect_prediction_inputs(source):
+    """
+    Expands a predict_batch input into a list of (dump, item, loader) entries.
+
+    source can be
+    - an image directory (searched recursively; the dump is the image's folder, e.g. images31),
+    - a glob pattern such as 'output_images/images*/sar_z3*.png',
+    - a SAR volume store (*.sarvol, --save_volume); slices are normalized like
+      --tensor_store exports, without the PNG round trip.
+    loader() returns the (100, 100) reflectivity image.
+    """
+    if os.path.isdir(source) and os.path.exists(os.path.join(source, 'meta.json')):
+        volume = _import_sar_module('sar_volume_store').SARVolume(source)
+        reflectivity_tensor = _import_sar_module('sar_tensor_store').reflectivity_tensor
+        dump = os.path.basename(os.path.normpath(source))
+        return [(dump, f"z={z_mm:g}mm", lambda i=i: reflectivity_tensor(volume.get_slice(i)))
+                for i, z_mm in enumerate(volume.z_values)]
+
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+    else:
+        paths = [p for p in glob.glob(source, recursive=True) if p.lower().endswith(IMAGE_EXTENSIONS)]
+    # Per folder, in depth order (sar_z300 before sar_z1000)
+    paths.sort(key=lambda p: (os.path.dirname(os.path.abspath(p)), slice_sort_key(p)))
+    return [(os.path.basename(os.path.dirname(os.path.abspath(p))), p,
+             lambda p=p: generate_reflectivity_image(p, target_size=(100, 100)))
+            for p in paths]
+
+def predict_batch(model, classes, source, batch_size=64, threads=None):
+    """
+    Classifies every slice of a directory, glob or SAR volume store with one loaded model.
+
+    Images are decoded/preprocessed on a thread pool (cv2 releases the GIL) one
+    batch ahead of inference. Returns (slice_rows, dump_rows):
+    - slice_rows: one dict per slice (dump, item, prediction, confidence, p_<class>)
+    - dump_rows: one dict per dump with the verdict (argmax of the mean class
+      probabilities), per-class slice votes and the most confident non-Noise slice
+    """
+    if threads:
+        torch.set_num_threads(threads)
+    entries = collect_prediction_inputs(source)
+
+    def load(entry):
+        try:
+            return entry[2]()
+        except Exception as e:
+            print(f"Error loading {entry[1]}: {e}")
+            return np.zeros((100, 100), dtype=np.float32)
+
+    meta = getattr(model, 'meta', {'input_mode': 'slice'})
+    if meta['input_mode'] != 'slice':
+        return _predict_dumps_volumetric(model, classes, entries, load, meta, batch_size, threads)
+    print(f"Classifying {len(entries)} slices from {source}...")
+
+    slice_rows = []
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=threads or min(8, os.cpu_count() or 1)) as pool:
+        batches = [entries[i:i + batch_size] for i in range(0, len(entries), batch_size)]
+        pending = pool.map(load, batches[0]) if batches else None
+        for b, batch in enumerate(batches):
+            tensors = np.stack(list(pending))
+            # Start decoding the next batch while this one runs through the model
+            pending = pool.map(load, batches[b + 1]) if b + 1 < len(batches) else None
+            probs = predict_tensors(model, tensors, batch_size=batch_size)
+            for (dump, item, _), p in zip(batch, probs):
+                row = {'dump': dump, 'item': item, 'prediction': classes[int(np.argmax(p))], 'confidence': float(np.max(p))}
+                row.update({f"p_{cls_name}": float(v) for cls_name, v in zip(classes, p)})
+                slice_rows.append(row)
+    elapsed = time.time() - start_time
+    if slice_rows:
+        print(f"Classified {len(slice_rows)} slices in {elapsed:.2f}s ({len(slice_rows) / max(elapsed, 1e-9):.1f} slices/s)")
+
+    dump_rows = []
+    for dump in sorted({row['dump'] for row in slice_rows}):
+        rows = [row for row in slice_rows if row['dump'] == dump]
+        mean_probs = np.mean([[row[f"p_{c}"] for c in classes] for row in rows], axis=0)
+        candidates = [row for row in rows if row['prediction'] != 'Noise'] or rows
+        peak = max(candidates, key=lambda row: row['confidence'])
+        dump_row = {'dump': dump, 'slices': len(rows), 'verdict': classes[int(np.argmax(mean_probs))],
+                    'verdict_confidence': float(np.max(mean_probs)),
+                    'peak_prediction': peak['prediction'], 'peak_confidence': peak['confidence'], 'peak_item': peak['item']}
+        dump_row.update({f"votes_{c}": sum(1 for row in rows if row['prediction'] == c) for c in classes})
+        dump_rows.append(dump_row)
+    return slice_rows, dump_rows
+
+def _predict_dumps_volumetric(model, classes, entries, load, meta, batch_size, threads):
+    """
+    predict_batch for volumetric models: one forward pass per dump. Returns
+    ([], dump_rows) with the dump verdict and class probabilities.
+    """
+    dumps = {}
+    for entry in entries:
+        dumps.setdefault(entry[0], []).append(entry)
+    print(f"Classifying {len(dumps)} dumps ({len(entries)} slices, {meta['input_mode']} input) ...")
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=threads or min(8, os.cpu_count() or 1)) as pool:
+        inputs = [stack_to_input(np.stack(list(pool.map(load, dump_entries))), meta['input_mode'], meta['depth'])
+                  for dump_entries in dumps.values()]
+    probs = predict_tensors(model, np.stack(inputs), batch_size=batch_size) if inputs else []
+    elapsed = time.time() - start_time
+    print(f"Classified {len(dumps)} dumps in {elapsed:.2f}s")
+
+    dump_rows = []
+    for (dump, dump_entries), p in zip(dumps.items(), probs):
+        row = {'dump': dump, 'slices': len(dump_entries), 'verdict': classes[int(np.argmax(p))],
+               'verdict_confidence': float(np.max(p))}
+        row.update({f"p_{cls_name}": float(v) for cls_name, v in zip(classes, p)})
+        dump_rows.append(row)
+    return [], dump_rows
+
+def write_predictions(slice_rows, dump_rows, output_path):
+    """
+    Writes predict_batch results. '.json' -> one file with 'slices' and 'dumps';
+    otherwise CSV: per-slice rows to output_path and per-dump rows to <stem>_dumps.csv.
+    """
+    import csv
+    out_dir = os.path.dirname(output_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    if output_path.lower().endswith('.json'):
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump({'slices': slice_rows, 'dumps': dump_rows}, f, indent=2)
+        return [output_path]
+
+    stem, _ = os.path.splitext(output_path)
+    written = []
+    for path, rows in ((output_path, slice_rows), (stem + '_dumps.csv', dump_rows)):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) if rows else ['dump'])
+            writer.writeheader()
+            writer.writerows(rows)
+        written.append(path)
+    return written
+
 # ==========================================
 # Phase 4: Training Logic
 # ==========================================
 
+CACHE_DTYPES = ('float16', 'uint8')
+
 class SARDataset(Dataset):
-    def __init__(self, root_dir):
+    def __init__(self, root_dir, cache_dir=None, cache_dtype='float16'):
         """
         Args:
             root_dir (string): Directory with all the images.
                                Structure: root_dir/class_name/image_files
+            cache_dir (string, optional): Directory for the preprocessed tensor cache.
+                               All images are run through generate_reflectivity_image()
+                               once and stored as one (N, 100, 100) array that is
+                               memory-mapped afterwards, so epochs do no image decoding.
+            cache_dtype (string): 'float16' or 'uint8' (rho * 255) cache storage.
         """
         self.root_dir = root_dir
+        self.cache_dir = cache_dir
+        self.cache_dtype = cache_dtype
+        self.cache_path = None
+        self._cache = None
         # Find classes based on subdirectories
         self.classes = sorted([d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d))])
         if not self.classes:
@@ -214,11 +663,96 @@ class SARDataset(Dataset):
                         count += 1
             print(f"  Class '{cls_name}': {count} images")
 
+        if cache_dir:
+            if cache_dtype not in CACHE_DTYPES:
+                raise ValueError(f"Unknown cache dtype: {cache_dtype} (choose from {CACHE_DTYPES})")
+            self._build_cache()
+
+    def _build_cache(self):
+        """
+        Create or update the preprocessed cache for this root_dir.
+
+        The cache index (<name>.json) records path, size and mtime of every source
+        image. Rows of unchanged images are reused, new or modified images are
+        preprocessed (on a thread pool; cv2 releases the GIL), and the array is
+        rewritten only if anything changed.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        root_key = hashlib.sha1(os.path.abspath(self.root_dir).encode('utf-8')).hexdigest()[:12]
+        name = f"sar_dataset_{root_key}_{self.cache_dtype}"
+        self.cache_path = os.path.join(self.cache_dir, name + '.npy')
+        index_path = os.path.join(self.cache_dir, name + '.json')
+
+        stamps = []
+        for img_path, label in self.images:
+            st = os.stat(img_path)
+            stamps.append([os.path.abspath(img_path), st.st_size, st.st_mtime_ns, label])
+
+        old_rows = {}
+        old_array = None
+        if os.path.exists(index_path) and os.path.exists(self.cache_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                old_index = json.load(f)
+            if old_index.get('entries') == stamps:
+                print(f"Using preprocessed cache {self.cache_path}")
+                return
+            old_array = np.load(self.cache_path, mmap_mode='r')
+            old_rows = {tuple(entry[:3]): row for row, entry in enumerate(old_index.get('entries', []))}
+
+        todo = [i for i, stamp in enumerate(stamps) if tuple(stamp[:3]) not in old_rows]
+        print(f"Preprocessing {len(todo)} of {len(stamps)} images into {self.cache_path}...")
+        array = np.zeros((len(stamps), 100, 100), dtype=self.cache_dtype)
+        for i, stamp in enumerate(stamps):
+            row = old_rows.get(tuple(stamp[:3]))
+            if row is not None:
+                array[i] = old_array[row]
+
+        def load(i):
+            try:
+                return i, generate_reflectivity_image(self.images[i][0], target_size=(100, 100))
+            except Exception as e:
+                print(f"Error loading {self.images[i][0]}: {e}")
+                return i, np.zeros((100, 100), dtype=np.float32)
+
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as pool:
+            for i, rho in pool.map(load, todo):
+                if self.cache_dtype == 'uint8':
+                    array[i] = np.clip(np.rint(rho * 255), 0, 255).astype(np.uint8)
+                else:
+                    array[i] = rho
+        del old_array
+
+        # Atomic replace: workers of another run never see a half-written cache
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, self.cache_path)
+        tmp_index = index_path + '.tmp'
+        with open(tmp_index, 'w', encoding='utf-8') as f:
+            json.dump({'root_dir': os.path.abspath(self.root_dir), 'classes': self.classes,
+                       'dtype': self.cache_dtype, 'entries': stamps}, f)
+        os.replace(tmp_index, index_path)
+
+    def __getstate__(self):
+        # DataLoader workers (spawned on Windows) reopen the memmap instead of
+        # receiving a pickled copy of the whole cache
+        state = self.__dict__.copy()
+        state['_cache'] = None
+        return state
+
     def __len__(self):
         return len(self.images)
 
     def __getitem__(self, idx):
         img_path, label = self.images[idx]
+
+        if self.cache_path:
+            if self._cache is None:
+                self._cache = np.load(self.cache_path, mmap_mode='r')
+            processed_img = np.array(self._cache[idx], dtype=np.float32)
+            if self.cache_dtype == 'uint8':
+                processed_img /= 255.0
+            return torch.from_numpy(processed_img).unsqueeze(0), label
         
         # Use the preprocessing function
         # generate_reflectivity_image returns a numpy array (100, 100) float32 0-1
@@ -235,62 +769,451 @@ class SARDataset(Dataset):
         
         return img_tensor, label
 
-def train_model(data_dir, num_epochs=20, batch_size=16, learning_rate=0.001, save_path='weapon_classifier.pth'):
-    print(f"Starting training with data from {data_dir}")
+class SARTensorDataset(Dataset):
+    def __init__(self, store_dir):
+        """
+        Args:
+            store_dir (string): Training tensor store written by the SAR reconstruction
+                                (mainSARneuronauts2py_rev3_2.py --tensor_store or
+                                batch_process_dumps.py --tensor_store).
+                                Structure: store_dir/<shard>.npy (N, 100, 100) float
+                                reflectivity tensors + store_dir/<shard>.json with the
+                                shard's label, Z values and dump provenance.
+        """
+        self.store_dir = store_dir
+        shards = []
+        for name in sorted(os.listdir(store_dir)):
+            npy_path = os.path.join(store_dir, name[:-len('.json')] + '.npy')
+            if name.endswith('.json') and os.path.exists(npy_path):
+                with open(os.path.join(store_dir, name), 'r', encoding='utf-8') as f:
+                    shards.append((npy_path, json.load(f)))
+        if not shards:
+            raise ValueError(f"No tensor shards found in {store_dir}")
+
+        self.classes = sorted({meta['label'] for _, meta in shards})
+        self.class_to_idx = {cls_name: i for i, cls_name in enumerate(self.classes)}
+        # Memory-mapped, read-only: DataLoader workers share the page cache
+        self.shard_paths = [npy_path for npy_path, _ in shards]
+        self.arrays = [np.load(npy_path, mmap_mode='r') for npy_path in self.shard_paths]
+        # One (shard, row, label) entry per tensor, plus provenance for reporting
+        self.samples = []
+        self.provenance = []
+        print(f"Found classes: {self.classes}")
+        for shard_idx, (npy_path, meta) in enumerate(shards):
+            label = self.class_to_idx[meta['label']]
+            for row, z_mm in enumerate(meta['z_values'][:len(self.arrays[shard_idx])]):
+                self.samples.append((shard_idx, row, label))
+                self.provenance.append({'shard': os.path.basename(npy_path), 'z_mm': z_mm, **meta.get('provenance', {})})
+        for cls_name in self.classes:
+            count = sum(1 for _, _, label in self.samples if label == self.class_to_idx[cls_name])
+            print(f"  Class '{cls_name}': {count} tensors")
+
+    def __getstate__(self):
+        # Workers reopen the memmaps (see SARDataset.__getstate__)
+        state = self.__dict__.copy()
+        state['arrays'] = None
+        return state
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        if self.arrays is None:
+            self.arrays = [np.load(npy_path, mmap_mode='r') for npy_path in self.shard_paths]
+        shard_idx, row, label = self.samples[idx]
+        # Copy out of the memmap (float16 shards are widened to float32)
+        img_tensor = torch.from_numpy(np.array(self.arrays[shard_idx][row], dtype=np.float32)).unsqueeze(0)
+        return img_tensor, label
+
+class SARStackDataset(Dataset):
+    def __init__(self, root_dir=None, tensor_store=None, input_mode='stack', depth=16):
+        """
+        One sample per dump for the volumetric classifier.
+
+        Args:
+            root_dir (string): Same structure as SARDataset; every folder of images
+                               below a class folder is one dump
+                               (root_dir/class_name/images31/sar_z*.png).
+            tensor_store (string): Alternatively a training tensor store; every
+                               shard is one dump.
+            input_mode (string): 'stack' (depth-resampled z-stack) or 'mips'.
+            depth (int): Number of z channels for 'stack'.
+
+        All dumps are preprocessed once here (a few hundred KB each); see
+        share_inputs() for handing them to other processes.
+        """
+        if input_mode not in ('stack', 'mips'):
+            raise ValueError(f"SARStackDataset input_mode must be 'stack' or 'mips', got {input_mode}")
+        self.input_mode = input_mode
+        self.depth = depth
+        dumps = [] # (name, class name, loader returning the (Z, 100, 100) stack)
+
+        if tensor_store:
+            for name in sorted(os.listdir(tensor_store)):
+                npy_path = os.path.join(tensor_store, name[:-len('.json')] + '.npy')
+                if name.endswith('.json') and os.path.exists(npy_path):
+                    with open(os.path.join(tensor_store, name), 'r', encoding='utf-8') as f:
+                        meta = json.load(f)
+                    order = np.argsort(meta['z_values'])
+                    dumps.append((name[:-len('.json')], meta['label'],
+                                  lambda p=npy_path, o=order: np.asarray(np.load(p, mmap_mode='r')[o], dtype=np.float32)))
+            self.classes = sorted({label for _, label, _ in dumps})
+        else:
+            self.classes = sorted([d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d))])
+            for cls_name in self.classes:
+                for root, dirs, files in os.walk(os.path.join(root_dir, cls_name)):
+                    images = [os.path.join(root, f) for f in files if f.lower().endswith(IMAGE_EXTENSIONS)]
+                    if images:
+                        dumps.append((os.path.relpath(root, root_dir), cls_name, lambda images=images: load_dump_stack(images)))
+        if not dumps:
+            raise ValueError(f"No dumps found in {tensor_store or root_dir}")
+
+        self.class_to_idx = {cls_name: i for i, cls_name in enumerate(self.classes)}
+        print(f"Found classes: {self.classes}")
+        print(f"Preprocessing {len(dumps)} dumps ({input_mode} input)...")
+        self.dump_names = [name for name, _, _ in dumps]
+        self.labels = [self.class_to_idx[cls_name] for _, cls_name, _ in dumps]
+        self.inputs = np.stack([stack_to_input(loader(), input_mode, depth) for _, _, loader in dumps])
+        self.inputs_path = None
+        for cls_name in self.classes:
+            print(f"  Class '{cls_name}': {self.labels.count(self.class_to_idx[cls_name])} dumps")
+
+    def __len__(self):
+        return len(self.labels)
+
+    def share_inputs(self, path):
+        """
+        Write the preprocessed inputs to a .npy file and memory-map it, so
+        pickled copies (process pool workers) carry the path instead of the
+        whole array and all processes share one page cache copy.
+        """
+        tmp_path = path + '.tmp.npy'
+        np.save(tmp_path, self.inputs)
+        os.replace(tmp_path, path)
+        self.inputs = np.load(path, mmap_mode='r')
+        self.inputs_path = path
+
+    def __getstate__(self):
+        # Workers reopen the memmap (see SARDataset.__getstate__)
+        state = self.__dict__.copy()
+        if self.inputs_path:
+            state['inputs'] = None
+        return state
+
+    def __getitem__(self, idx):
+        if self.inputs is None:
+            self.inputs = np.load(self.inputs_path, mmap_mode='r')
+        # Copy: memmap rows are read-only
+        return torch.from_numpy(np.array(self.inputs[idx])), self.labels[idx]
+
+def build_dataset(data_dir=None, tensor_store=None, cache_dir=None, cache_dtype='float16', input_mode='slice', depth=16):
+    """
+    Dataset for training/evaluation: a tensor store skips image decoding and 8-bit
+    quantization entirely; cache_dir preprocesses the image folders once into a
+    memmapped cache. input_mode 'stack'/'mips' gives one sample per dump.
+    """
+    if input_mode != 'slice':
+        return SARStackDataset(data_dir, tensor_store, input_mode=input_mode, depth=depth)
+    if tensor_store:
+        return SARTensorDataset(tensor_store)
+    return SARDataset(data_dir, cache_dir=cache_dir, cache_dtype=cache_dtype)
+
+def dataset_labels(dataset):
+    """Class index of every sample of a build_dataset() dataset."""
+    if isinstance(dataset, SARStackDataset):
+        return list(dataset.labels)
+    if isinstance(dataset, SARTensorDataset):
+        return [label for _, _, label in dataset.samples]
+    return [label for _, label in dataset.images]
+
+def dataset_groups(dataset):
+    """
+    Dump of every sample (image folder or tensor-store shard). Slices of one dump
+    are near-duplicates, so splits keep a dump on one side.
+    """
+    if isinstance(dataset, SARStackDataset):
+        return list(dataset.dump_names)
+    if isinstance(dataset, SARTensorDataset):
+        return [os.path.basename(dataset.shard_paths[shard_idx]) for shard_idx, _, _ in dataset.samples]
+    return [os.path.dirname(path) for path, _ in dataset.images]
+
+def stratified_folds(labels, num_folds, groups=None, seed=0):
+    """
+    Splits sample indices into num_folds folds with (about) the class balance of
+    the whole set. With groups, all samples of a group (dump) land in the same
+    fold and the groups of each class are dealt out largest first, each to the
+    fold with the fewest samples of that class, then the fewest samples
+    overall (remaining ties at random). A class with fewer groups than folds
+    is split by sample instead, with a warning.
+    Returns a list of num_folds index arrays.
+    """
+    if num_folds < 2:
+        raise ValueError(f"num_folds must be >= 2, got {num_folds}")
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels)
+    groups = np.asarray(groups) if groups is not None else np.arange(len(labels))
+    folds = [[] for _ in range(num_folds)]
+    totals = np.zeros(num_folds, dtype=np.int64)
+    for label in np.unique(labels):
+        members = {}
+        for idx in np.flatnonzero(labels == label):
+            members.setdefault(groups[idx], []).append(idx)
+        units = list(members.values())
+        if len(units) < num_folds and sum(len(unit) for unit in units) > len(units):
+            print(f"Warning: class {label} has {len(units)} dumps for {num_folds} folds; splitting it by sample")
+            units = [[idx] for unit in units for idx in unit]
+        rng.shuffle(units)
+        units.sort(key=len, reverse=True)
+        class_counts = np.zeros(num_folds, dtype=np.int64)
+        for unit in units:
+            target = min(range(num_folds), key=lambda f, r=rng.random(num_folds): (class_counts[f], totals[f], r[f]))
+            folds[target].extend(unit)
+            class_counts[target] += len(unit)
+            totals[target] += len(unit)
+    return [np.sort(np.array(fold, dtype=np.int64)) for fold in folds]
+
+def train_epoch(model, dataloader, criterion, optimizer, device='cpu', memory_format=None, bf16=False):
+    """
+    One training pass over dataloader. model may be a torch.compile wrapper.
+    Returns (mean loss, accuracy in %, samples/s).
+    """
+    memory_format = memory_format or torch.contiguous_format
+    model.train()
+    running_loss = 0.0
+    correct = 0
+    total = 0
+    start = time.perf_counter()
+    
+    for i, (inputs, labels) in enumerate(dataloader):
+        inputs = inputs.to(device, non_blocking=True, memory_format=memory_format)
+        labels = labels.to(device, non_blocking=True)
+        
+        # Zero the parameter gradients
+        optimizer.zero_grad(set_to_none=True)
+        
+        # Forward + Backward + Optimize
+        # (bf16 has the float32 exponent range, so no gradient scaling is needed)
+        with torch.autocast(device_type=torch.device(device).type, dtype=torch.bfloat16, enabled=bf16):
+            outputs = model(inputs)
+            loss = criterion(outputs, labels)
+        loss.backward()
+        optimizer.step()
+        
+        # Statistics
+        running_loss += loss.item()
+        _, predicted = torch.max(outputs.data, 1)
+        total += labels.size(0)
+        correct += (predicted == labels).sum().item()
+    
+    elapsed = time.perf_counter() - start
+    return running_loss / max(len(dataloader), 1), 100 * correct / max(total, 1), total / max(elapsed, 1e-9)
+
+def evaluate_epoch(model, dataloader, criterion, device='cpu', memory_format=None, bf16=False):
+    """
+    One pass over a validation loader. Returns (mean loss, accuracy in %).
+    """
+    memory_format = memory_format or torch.contiguous_format
+    model.eval()
+    running_loss = 0.0
+    correct = 0
+    total = 0
+    with torch.no_grad():
+        for inputs, labels in dataloader:
+            inputs = inputs.to(device, non_blocking=True, memory_format=memory_format)
+            labels = labels.to(device, non_blocking=True)
+            with torch.autocast(device_type=torch.device(device).type, dtype=torch.bfloat16, enabled=bf16):
+                outputs = model(inputs)
+                loss = criterion(outputs, labels)
+            running_loss += loss.item()
+            _, predicted = torch.max(outputs.data, 1)
+            total += labels.size(0)
+            correct += (predicted == labels).sum().item()
+    return running_loss / max(len(dataloader), 1), 100 * correct / max(total, 1)
+
+def _rng_state(loader_generator):
+    return {'torch': torch.get_rng_state(), 'numpy': np.random.get_state(), 'python': random.getstate(),
+            'loader': loader_generator.get_state()}
+
+def _set_rng_state(state, loader_generator):
+    torch.set_rng_state(state['torch'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['python'])
+    loader_generator.set_state(state['loader'])
+
+def cpu_bf16_supported():
+    """Whether this CPU runs bfloat16 natively (AVX512-BF16/AMX); elsewhere bf16 autocast is emulated and slower."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+def save_checkpoint(path, checkpoint):
+    """Atomic torch.save, so an interrupt during the write keeps the previous checkpoint."""
+    tmp_path = path + '.tmp'
+    torch.save(checkpoint, tmp_path)
+    os.replace(tmp_path, path)
+
+def save_model(model, save_path, classes, meta):
+    """
+    Weights plus the <save_path>.classes / .json metadata load_model reads.
+    The weights are written first (atomically), so metadata never exists
+    without a usable model next to it.
+    """
+    save_checkpoint(save_path, model.state_dict())
+    with open(save_path + ".classes", "w") as f:
+        f.write("\n".join(classes))
+    with open(save_path + ".json", "w") as f:
+        json.dump(meta, f, indent=2)
+
+def train_model(data_dir, num_epochs=20, batch_size=16, learning_rate=0.001, save_path='weapon_classifier.pth', tensor_store=None,
+                cache_dir=None, cache_dtype='float16', num_workers=0, input_mode='slice', depth=16, arch='WeaponCNN',
+                pin_memory=False, prefetch_factor=2, channels_last=False, bf16=False, compile_model=False, num_threads=None,
+                val_fraction=0.0, patience=0, min_delta=0.0, checkpoint_path=None, resume=False, seed=0, split_by='dump'):
+    """
+    Throughput options (all off by default, i.e. the original training loop):
+      num_workers/prefetch_factor  DataLoader worker processes (kept alive across
+                                   epochs) and batches prefetched per worker
+      pin_memory                   page-locked batches for faster host-to-GPU copies (CUDA only)
+      channels_last                NHWC memory format for model and inputs (faster CPU convolutions)
+      bf16                         bfloat16 autocast for the forward pass (CPUs with AVX512-BF16/AMX)
+      compile_model                torch.compile the model (first epoch includes compilation)
+      num_threads                  torch.set_num_threads for the intra-op thread pool
+    Samples/s is reported per epoch so settings can be compared.
+
+    Validation and checkpoints:
+      val_fraction     hold out this fraction of the dumps (stratified by class) for validation;
+                       save_path then holds the model with the lowest validation loss. The
+                       split is fold 0 of round(1 / val_fraction) folds, so the real fraction
+                       is 1 / folds (0.3 -> 33%)
+      split_by         'dump' keeps the slices of a dump on one side; 'sample' splits
+                       single samples
+      patience         stop after this many epochs without a validation loss
+                       improvement of more than min_delta (0 = never)
+      checkpoint_path  written after every epoch (model, optimizer, epoch, RNG state,
+                       split, best model); default <save_path>.ckpt
+      resume           continue from checkpoint_path
+    """
+    print(f"Starting training with data from {tensor_store or data_dir}")
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    checkpoint_path = checkpoint_path or save_path + ".ckpt"
+    checkpoint = None
+    if resume:
+        if not os.path.exists(checkpoint_path):
+            raise FileNotFoundError(f"No checkpoint to resume from: {checkpoint_path}")
+        # Our own file: it holds numpy/python RNG state, not only tensors
+        checkpoint = torch.load(checkpoint_path, map_location='cpu', weights_only=False)
+        meta = checkpoint['meta']
+        arch, input_mode, depth = meta['arch'], meta['input_mode'], meta['depth']
+        val_fraction, seed = checkpoint['val_fraction'], checkpoint['seed']
+        split_by = checkpoint.get('split_by', 'dump')
+        print(f"Resuming from {checkpoint_path} after epoch {checkpoint['epoch'] + 1} ({arch}, {input_mode} input)")
+    torch.manual_seed(seed)
     
     # 1. Setup Dataset and DataLoader
-    dataset = SARDataset(data_dir)
-    dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
+    dataset = build_dataset(data_dir, tensor_store, cache_dir, cache_dtype, input_mode, depth)
+    if checkpoint is not None and checkpoint['classes'] != dataset.classes:
+        raise ValueError(f"Dataset classes {dataset.classes} differ from the checkpoint's {checkpoint['classes']}")
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    loader_args = {'num_workers': num_workers, 'pin_memory': pin_memory and device.type == 'cuda'}
+    if num_workers > 0:
+        loader_args.update(persistent_workers=True, prefetch_factor=prefetch_factor)
+
+    # Validation split: whole dumps by default, so near-identical neighbouring slices don't leak into it
+    train_set, val_loader, split = dataset, None, None
+    if val_fraction > 0:
+        if checkpoint is not None:
+            split = checkpoint['split']
+        else:
+            folds = stratified_folds(dataset_labels(dataset), max(2, int(round(1.0 / val_fraction))),
+                                     groups=dataset_groups(dataset) if split_by == 'dump' else None, seed=seed)
+            split = {'val': folds[0].tolist(), 'train': np.sort(np.concatenate(folds[1:])).tolist()}
+        if not split['val'] or not split['train']:
+            raise ValueError(f"Not enough {split_by}s for a {val_fraction:.0%} validation split")
+        train_set = Subset(dataset, split['train'])
+        val_loader = DataLoader(Subset(dataset, split['val']), batch_size=batch_size, shuffle=False, **loader_args)
+        print(f"Validation split: {len(split['train'])} train / {len(split['val'])} validation samples "
+              f"({len(split['val']) / len(dataset):.0%}, by {split_by})")
+    loader_generator = torch.Generator().manual_seed(seed)
+    dataloader = DataLoader(train_set, batch_size=batch_size, shuffle=True, generator=loader_generator, **loader_args)
     
     num_classes = len(dataset.classes)
     print(f"Training for {num_classes} classes...")
     
     # 2. Initialize Model
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    print(f"Using device: {device}")
+    print(f"Using device: {device} ({torch.get_num_threads()} threads, {num_workers} workers"
+          f"{', channels_last' if channels_last else ''}{', bf16 autocast' if bf16 else ''}{', compiled' if compile_model else ''})")
     
-    model = WeaponCNN(num_classes=num_classes).to(device)
+    model = build_model(arch, num_classes=num_classes, in_channels=input_channels(input_mode, depth)).to(device)
+    print(f"Architecture: {arch} ({count_parameters(model):,} parameters)")
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    model = model.to(memory_format=memory_format)
+    # The compiled wrapper shares the parameters; the plain model is what gets saved
+    forward = torch.compile(model) if compile_model else model
     
     # 3. Loss and Optimizer
     criterion = nn.CrossEntropyLoss()
     optimizer = optim.Adam(model.parameters(), lr=learning_rate)
+
+    # Input description for load_model (volumetric models need it); written by
+    # save_model next to every weights file, with the class mapping
+    meta = {'arch': arch, 'input_mode': input_mode, 'depth': depth if input_mode == 'stack' else 1}
+
+    start_epoch = 0
+    best_val_loss = float('inf')
+    best_val_acc = 0.0
+    best_epoch = None
+    epochs_without_improvement = 0
+    if checkpoint is not None:
+        model.load_state_dict(checkpoint['model'])
+        optimizer.load_state_dict(checkpoint['optimizer'])
+        _set_rng_state(checkpoint['rng'], loader_generator)
+        start_epoch = checkpoint['epoch'] + 1
+        best_val_loss, best_val_acc = checkpoint['best_val_loss'], checkpoint['best_val_acc']
+        best_epoch = checkpoint['best_epoch']
+        epochs_without_improvement = checkpoint['epochs_without_improvement']
     
     # 4. Training Loop
-    for epoch in range(num_epochs):
-        running_loss = 0.0
-        correct = 0
-        total = 0
-        
-        for i, (inputs, labels) in enumerate(dataloader):
-            inputs, labels = inputs.to(device), labels.to(device)
-            
-            # Zero the parameter gradients
-            optimizer.zero_grad()
-            
-            # Forward + Backward + Optimize
-            outputs = model(inputs)
-            loss = criterion(outputs, labels)
-            loss.backward()
-            optimizer.step()
-            
-            # Statistics
-            running_loss += loss.item()
-            _, predicted = torch.max(outputs.data, 1)
-            total += labels.size(0)
-            correct += (predicted == labels).sum().item()
-            
-        epoch_loss = running_loss / len(dataloader)
-        epoch_acc = 100 * correct / total
-        print(f"Epoch [{epoch+1}/{num_epochs}] Loss: {epoch_loss:.4f} Accuracy: {epoch_acc:.2f}%")
+    for epoch in range(start_epoch, num_epochs):
+        epoch_loss, epoch_acc, samples_per_s = train_epoch(forward, dataloader, criterion, optimizer, device, memory_format, bf16)
+        status = f"Epoch [{epoch+1}/{num_epochs}] Loss: {epoch_loss:.4f} Accuracy: {epoch_acc:.2f}%"
+        stop = False
+        if val_loader is not None:
+            val_loss, val_acc = evaluate_epoch(forward, val_loader, criterion, device, memory_format, bf16)
+            status += f" | Val Loss: {val_loss:.4f} | Val Acc: {val_acc:.2f}%"
+            if val_loss < best_val_loss - min_delta:
+                best_val_loss, best_val_acc, best_epoch = val_loss, val_acc, epoch
+                epochs_without_improvement = 0
+                save_model(model, save_path, dataset.classes, meta)
+                status += " (best, saved)"
+            else:
+                epochs_without_improvement += 1
+                stop = patience > 0 and epochs_without_improvement >= patience
+        print(f"{status} ({samples_per_s:.1f} samples/s)")
+
+        save_checkpoint(checkpoint_path, {
+            'epoch': epoch, 'model': model.state_dict(), 'optimizer': optimizer.state_dict(),
+            'rng': _rng_state(loader_generator), 'meta': meta, 'classes': dataset.classes,
+            'val_fraction': val_fraction, 'seed': seed, 'split': split, 'split_by': split_by,
+            'best_val_loss': best_val_loss, 'best_val_acc': best_val_acc, 'best_epoch': best_epoch,
+            'epochs_without_improvement': epochs_without_improvement,
+        })
+        if stop:
+            print(f"Early stopping: no validation loss improvement for {patience} epochs")
+            break
         
     # 5. Save Model
-    torch.save(model.state_dict(), save_path)
-    print(f"Finished Training. Model saved to {save_path}")
-    
-    # Save class mapping
-    with open(save_path + ".classes", "w") as f:
-        f.write("\n".join(dataset.classes))
-    print(f"Class mapping saved to {save_path}.classes")
+    if val_loader is None:
+        save_model(model, save_path, dataset.classes, meta)
+        print(f"Finished Training. Model saved to {save_path}")
+    elif best_epoch is not None:
+        print(f"Finished Training. Best model (epoch {best_epoch + 1}, Val Loss: {best_val_loss:.4f}, "
+              f"Val Acc: {best_val_acc:.2f}%) saved to {save_path}")
+    else:
+        # No epoch improved on inf (e.g. NaN validation losses): keep the last weights
+        save_model(model, save_path, dataset.classes, meta)
+        print(f"Warning: no validation improvement in any epoch; saved the last weights to {save_path}")
+    print(f"Class mapping saved to {save_path}.classes, checkpoint at {checkpoint_path}")
 
 # ==========================================
 # Main Execution Block
@@ -302,48 +1225,143 @@ if __name__ == "__main__":
     
     # Train Command
     train_parser = subparsers.add_parser('train', help='Train the model')
-    train_parser.add_argument('--data_dir', type=str, required=True, help='Path to dataset directory (must contain class subfolders)')
+    train_source = train_parser.add_mutually_exclusive_group(required=True)
+    train_source.add_argument('--data_dir', type=str, help='Path to dataset directory (must contain class subfolders)')
+    train_source.add_argument('--tensor_store', type=str, help='Path to a training tensor store exported by the SAR reconstruction (--tensor_store)')
     train_parser.add_argument('--epochs', type=int, default=20, help='Number of epochs')
     train_parser.add_argument('--batch_size', type=int, default=16, help='Batch size')
     train_parser.add_argument('--lr', type=float, default=0.001, help='Learning rate')
     train_parser.add_argument('--save_path', type=str, default='weapon_classifier.pth', help='Path to save trained model')
+    train_parser.add_argument('--cache_dir', type=str, default=None, help='Preprocess --data_dir images once into a memmapped tensor cache in this directory')
+    train_parser.add_argument('--cache_dtype', type=str, default='float16', choices=list(CACHE_DTYPES), help='Storage dtype of --cache_dir (default: float16)')
+    train_parser.add_argument('--workers', type=int, default=None, help='DataLoader worker processes (default: 0, or min(4, CPU count) with --throughput)')
+    train_parser.add_argument('--input_mode', type=str, default='slice', choices=list(INPUT_MODES), help="'slice' (one image per sample), 'stack' (whole dump as a depth-resampled z-stack) or 'mips' (whole dump as its 3 MIPs)")
+    train_parser.add_argument('--depth', type=int, default=16, help="Z channels for --input_mode stack (default: 16)")
+    train_parser.add_argument('--arch', type=str, default='WeaponCNN', choices=list(ARCHITECTURES), help="'WeaponCNN' (paper architecture) or 'WeaponCNNLite' (depthwise-separable + global average pooling, ~200x fewer parameters)")
+    train_parser.add_argument('--throughput', action='store_true', help='CPU throughput preset: channels_last, bf16 autocast (if the CPU supports bfloat16) and min(4, CPU count) workers unless --workers is given')
+    train_parser.add_argument('--prefetch', type=int, default=2, help='Batches prefetched per DataLoader worker (default: 2)')
+    train_parser.add_argument('--pin_memory', action='store_true', help='Pin DataLoader batches in page-locked memory (only used with CUDA)')
+    train_parser.add_argument('--channels_last', action='store_true', help='Use the channels_last memory format for model and inputs')
+    train_parser.add_argument('--bf16', action='store_true', help='bfloat16 autocast for the forward pass')
+    train_parser.add_argument('--compile', action='store_true', help='torch.compile the model')
+    train_parser.add_argument('--threads', type=int, default=None, help='torch.set_num_threads for training (default: torch default)')
+    train_parser.add_argument('--val_fraction', type=float, default=0.0, help='Hold out this fraction of the dumps for validation (rounded to 1/folds, e.g. 0.3 -> 33%%); the best model by validation loss is saved (default: 0, no validation)')
+    train_parser.add_argument('--split_by', type=str, default='dump', choices=['dump', 'sample'], help="Keep the slices of a dump on one side of --val_fraction ('dump', default) or split single samples")
+    train_parser.add_argument('--patience', type=int, default=0, help='Early stopping: epochs without validation loss improvement (default: 0, disabled)')
+    train_parser.add_argument('--min_delta', type=float, default=0.0, help='Minimum validation loss decrease that counts as an improvement (default: 0)')
+    train_parser.add_argument('--checkpoint', type=str, default=None, help='Per-epoch checkpoint file (default: <save_path>.ckpt)')
+    train_parser.add_argument('--resume', action='store_true', help='Resume training from the checkpoint')
+    train_parser.add_argument('--seed', type=int, default=0, help='Seed for the split, initialization and shuffling (default: 0)')
     
     # Predict Command
     predict_parser = subparsers.add_parser('predict', help='Predict class for an image')
-    predict_parser.add_argument('--image', type=str, required=True, help='Path to image file')
+    predict_parser.add_argument('--image', type=str, required=True, help='Path to image file (dump folder or *.sarvol for stack/mips models)')
     predict_parser.add_argument('--model_path', type=str, default='weapon_classifier.pth', help='Path to trained model')
     
+    # Batch Predict Command
+    batch_parser = subparsers.add_parser('predict_batch', help='Classify a directory, glob or SAR volume store with one model load')
+    batch_parser.add_argument('--input', type=str, required=True, help="Image directory (recursive), glob (e.g. 'output_images/images*/*.png') or *.sarvol volume store")
+    batch_parser.add_argument('--model_path', type=str, default='weapon_classifier.pth', help='Path to trained model')
+    batch_parser.add_argument('--batch_size', type=int, default=64, help='Inference batch size')
+    batch_parser.add_argument('--threads', type=int, default=None, help='Torch intra-op threads and image loader threads (default: torch/CPU default)')
+    batch_parser.add_argument('--output', type=str, default='predictions.csv', help="Per-slice CSV (per-dump verdicts go to <name>_dumps.csv) or a .json file with both")
+
+    # Heatmap Command
+    heatmap_parser = subparsers.add_parser('heatmap', help='Class-probability heatmap of a full-size slice in one forward pass')
+    heatmap_parser.add_argument('--image', type=str, required=True, help='Full-size slice or MIP image')
+    heatmap_parser.add_argument('--model_path', type=str, default='weapon_classifier.pth', help='Path to trained (per-slice) model')
+    heatmap_parser.add_argument('--size', type=int, nargs=2, default=[200, 200], metavar=('WIDTH', 'HEIGHT'), help='Resize the image to this size; a window is 100x100 (default: 200 200)')
+    heatmap_parser.add_argument('--output', type=str, default=None, help='Save the image with the weapon heatmap overlaid (PNG)')
+    heatmap_parser.add_argument('--json', type=str, default=None, help='Save the per-class probability maps and peaks as JSON')
+
     # Preprocess Command
     process_parser = subparsers.add_parser('preprocess', help='Generate reflectivity image only')
-    process_parser.add_argument('--input', type=str, required=True, help='Input image')
-    process_parser.add_argument('--output', type=str, required=True, help='Output image')
+    process_parser.add_argument('--input', type=str, required=True, help='Input image, or a dataset directory (class folders are recursed)')
+    process_parser.add_argument('--output', type=str, required=True, help='Output image, or output directory for a directory input')
+    process_parser.add_argument('--workers', type=int, default=None, help='Worker processes for a directory input (default: CPU count)')
+    process_parser.add_argument('--force', action='store_true', help='Regenerate all images of a directory input, even those that are up to date')
 
     args = parser.parse_args()
     
     if args.command == 'train':
-        train_model(args.data_dir, num_epochs=args.epochs, batch_size=args.batch_size, learning_rate=args.lr, save_path=args.save_path)
+        workers = args.workers
+        if args.throughput and workers is None:
+            workers = min(4, os.cpu_count() or 1)
+        bf16 = args.bf16
+        if args.throughput and not bf16:
+            bf16 = cpu_bf16_supported()
+            if not bf16:
+                print("--throughput: CPU has no native bfloat16 support; training in float32 (force with --bf16)")
+        train_model(args.data_dir, num_epochs=args.epochs, batch_size=args.batch_size, learning_rate=args.lr, save_path=args.save_path, tensor_store=args.tensor_store,
+                    cache_dir=args.cache_dir, cache_dtype=args.cache_dtype, num_workers=workers or 0,
+                    input_mode=args.input_mode, depth=args.depth, arch=args.arch,
+                    pin_memory=args.pin_memory, prefetch_factor=args.prefetch,
+                    channels_last=args.channels_last or args.throughput, bf16=bf16,
+                    compile_model=args.compile, num_threads=args.threads,
+                    val_fraction=args.val_fraction, patience=args.patience, min_delta=args.min_delta,
+                    checkpoint_path=args.checkpoint, resume=args.resume, seed=args.seed, split_by=args.split_by)
         
     elif args.command == 'predict':
         if not os.path.exists(args.model_path):
             print(f"Error: Model file {args.model_path} not found. Train the model first.")
         else:
-            # Load classes
-            classes_file = args.model_path + ".classes"
-            if os.path.exists(classes_file):
-                with open(classes_file, 'r') as f:
-                    classes = [line.strip() for line in f.readlines()]
-            else:
-                print("Warning: Class mapping file not found. Using default classes.")
-                classes = ['Knife', 'MetalPlate', 'Noise', 'Scissors']
-                
-            model = WeaponCNN(num_classes=len(classes))
-            model.load_state_dict(torch.load(args.model_path))
+            # Load model and classes
+            model, classes = load_model(args.model_path)
             
-            label, conf = predict_weapon(model, args.image, classes=classes)
-            print(f"Prediction: {label} (Confidence: {conf:.2f})")
+            if model.meta['input_mode'] != 'slice':
+                # Volumetric model: --image is a dump folder or volume store
+                _, dump_rows = predict_batch(model, classes, args.image)
+                for row in dump_rows:
+                    print(f"Prediction for {row['dump']}: {row['verdict']} (Confidence: {row['verdict_confidence']:.2f})")
+            else:
+                label, conf = predict_weapon(model, args.image, classes=classes)
+                print(f"Prediction: {label} (Confidence: {conf:.2f})")
+
+    elif args.command == 'predict_batch':
+        if not os.path.exists(args.model_path):
+            print(f"Error: Model file {args.model_path} not found. Train the model first.")
+        else:
+            model, classes = load_model(args.model_path)
+            slice_rows, dump_rows = predict_batch(model, classes, args.input, batch_size=args.batch_size, threads=args.threads)
+            for row in dump_rows:
+                peak = f"peak {row['peak_prediction']} {row['peak_confidence']:.2f} at {row['peak_item']}, " if 'peak_item' in row else ""
+                print(f"{row['dump']}: {row['verdict']} (confidence {row['verdict_confidence']:.2f}, {peak}{row['slices']} slices)")
+            for path in write_predictions(slice_rows, dump_rows, args.output):
+                print(f"Saved predictions to {path}")
             
+    elif args.command == 'heatmap':
+        if not os.path.exists(args.model_path):
+            print(f"Error: Model file {args.model_path} not found. Train the model first.")
+        else:
+            model, classes = load_model(args.model_path)
+            if model.meta['input_mode'] != 'slice':
+                parser.error(f"heatmap needs a per-slice model; {args.model_path} is a '{model.meta['input_mode']}' model")
+            net = WeaponHeatmapNet(model)
+            start = time.perf_counter()
+            result = predict_heatmap(net, args.image, classes, target_size=args.size)
+            elapsed = (time.perf_counter() - start) * 1000.0
+            rows, cols = result['probabilities'].shape[1:]
+            print(f"{rows}x{cols} windows (stride {result['stride']} px) in {elapsed:.1f} ms")
+            for name, peak in result['peaks'].items():
+                print(f"  {name:12s} peak {peak['probability']:.2f} at x={peak['x_fraction']:.2f}, y={peak['y_fraction']:.2f} of the image")
+            if args.output:
+                write_heatmap_overlay(result, args.output)
+                print(f"Saved heatmap overlay to {args.output}")
+            if args.json:
+                with open(args.json, 'w', encoding='utf-8') as f:
+                    json.dump({'classes': classes, 'size': args.size, 'stride': result['stride'], 'window': net.window,
+                               'peaks': result['peaks'], 'probabilities': result['probabilities'].tolist()}, f, indent=2)
+                print(f"Saved heatmap to {args.json}")
+
     elif args.command == 'preprocess':
-        generate_reflectivity_image(args.input, args.output)
+        if os.path.isdir(args.input):
+            # Parallel, incremental: only images newer than their output are processed
+            from generate_reflectivity_dataset import process_tree, print_summary
+            summary = process_tree(args.input, args.output, workers=args.workers, force=args.force,
+                                   prefix='', process_fn=write_reflectivity_image)
+            print_summary(summary, args.output)
+        else:
+            generate_reflectivity_image(args.input, args.output)
         
     else:
         parser.print_help()
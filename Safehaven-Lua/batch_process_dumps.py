@@ -1,48 +1,323 @@
-import subprocess
 import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
 import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from sar_slice_cache import dump_content_hash
 
-# Set up argument parser
-parser = argparse.ArgumentParser(description="Batch process SAR dumps.")
-parser.add_argument("--dump", type=int, help="Dump ID to process (e.g., 65)")
-args = parser.parse_args()
-
-# List of dump IDs to process
-if args.dump is not None:
-    dump_ids = [args.dump]
-else:
-    dump_ids = [31]
-
-# Base command parameters
-script_name = "mainSARneuronauts2py_rev3_2.py"
-z_start = "300"
-z_end = "400"
-z_step = "1"
-
-for dump_id in dump_ids:
-    folder_name = f"dumps{dump_id}"
-    output_dir = f"../Safehaven-Classification/output_images/images{dump_id}"
-    
-    print(f"Processing {folder_name}...")
-    
-    command = [
-        "uv", "run", script_name,
-        "--folder", folder_name,
-        "--z_start", z_start,
-        "--z_end", z_end,
-        "--zstep", z_step,
-        "--sar_dump", output_dir,
-        "--silent"
-    ]
-    
+# Batch SAR reconstruction of many dumpsN folders.
+#
+# Each dump is reconstructed in-process (no `uv run` per dump) on a pool of
+# worker processes and its Z-slices are written with SARDumpWriter, exactly
+# like `mainSARneuronauts2py_rev3_2.py --sar_dump ... --silent`.
+#
+# Completed work is recorded in <output_root>/batch_manifest.json, keyed by
+# the SHA-256 of the dump's scan*_Raw_0.bin files plus the reconstruction
+# parameters. Reruns skip dumps whose data and parameters are unchanged;
+# dumps that were interrupted (or failed) are processed again. Slices are
+# written to images<N>.partial and only renamed to images<N> once complete.
+# images<N> and the tensor shard are shared by all parameter sets of a dump,
+# so both are stamped with the manifest key that produced them; a done entry
+# only counts if its outputs still carry its key (a later run with other
+# parameters overwrites them).
+
+MANIFEST_FILE = 'batch_manifest.json'
+OUTPUT_STAMP_FILE = '.batch_job.json'
+DUMP_DIR_PATTERN = re.compile(r'^dumps(\d+)$')
+
+
+def discover_dumps(root, dump_ids=None):
+    """
+    Return [(dump_id, folder_path)] for the dumpsN folders under root, sorted by N.
+    If dump_ids is given, only those dumps are returned (missing ones are reported).
+    """
+    found = {}
+    if os.path.isdir(root):
+        for name in os.listdir(root):
+            match = DUMP_DIR_PATTERN.match(name)
+            if match and os.path.isdir(os.path.join(root, name)):
+                found[int(match.group(1))] = os.path.join(root, name)
+
+    if dump_ids:
+        for dump_id in dump_ids:
+            if dump_id not in found:
+                print(f"Warning: dumps{dump_id} not found in {root}")
+        return [(dump_id, found[dump_id]) for dump_id in dump_ids if dump_id in found]
+    return sorted(found.items())
+
+
+def params_key(params):
+    """Stable short hash of the reconstruction/output parameters."""
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {'version': 1, 'jobs': {}, 'hashes': {}}
+
+
+def save_manifest(manifest, path):
+    """Atomic rewrite so an interrupted batch never leaves a truncated manifest."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
     try:
-        # shell=True might be needed on Windows if uv is a batch file or similar, 
-        # but usually subprocess handles executables fine. 
-        # On Windows 'uv' might need 'uv.exe' or shell=True if it's not in PATH directly as an exe.
-        # Assuming 'uv' works as it did in the user's terminal.
-        subprocess.run(command, check=True)
-        print(f"Successfully processed {folder_name}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error processing {folder_name}: {e}")
-
-print("Batch processing complete.")
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _outputs_exist(key, entry):
+    """
+    True if everything a finished manifest entry produced is still on disk and
+    was not overwritten since by a run with other parameters.
+    """
+    params = entry.get('params', {})
+    if params.get('images', True):
+        stamp = _read_json(os.path.join(entry.get('output_dir', ''), OUTPUT_STAMP_FILE))
+        if not stamp or stamp.get('key') != key:
+            return False
+    if params.get('tensor_store'):
+        shard = _read_json(os.path.join(params['tensor_store'], f"dumps{entry['dump_id']}_{params['algo']}.json"))
+        if not shard or shard.get('provenance', {}).get('batch_key') != key:
+            return False
+    return True
+
+
+def process_dump(job):
+    """
+    Worker: reconstruct one dump and write its slices. Runs in a pool process.
+    Returns a summary dict for the manifest.
+    """
+    # Imported here so the parent process does not need the reconstruction stack
+    from sar_stream import SARStreamSink
+    from sar_dump_writer import SARDumpWriter
+    from sar_slice_cache import SARSliceCache
+    from sar_tensor_store import SARTensorShardWriter
+    from mainSARneuronauts2py_rev3_2 import resolve_z_values, load_raw_data_fft, iter_sar_slices, reconstruction_config
+
+    params = job['params']
+    start = time.time()
+
+    z_values, _ = resolve_z_values(params['zindex'], params['zstart'], params['zend'], params['zstep'])
+    raw_data = {}
+
+    def compute_slices(zs):
+        # Raw data is loaded lazily: a fully cached dump never reads its scan files
+        if 'fft' not in raw_data:
+            raw_data['fft'] = load_raw_data_fft(job['folder'], params['frames_in_x'], params['frames_in_y'])
+        return iter_sar_slices(raw_data['fft'], zs, params['algo'], params['fista_iters'], params['fista_lambda'])
+
+    if job['slice_cache']:
+        slice_cache = SARSliceCache(job['slice_cache'], max_bytes=job['slice_cache_gb'] * 1024 ** 3)
+        config = reconstruction_config(params['algo'], params['fista_iters'], params['fista_lambda'],
+                                       params['frames_in_x'], params['frames_in_y'])
+        slice_source = slice_cache.iter_slices(job['content_hash'], config, z_values, compute_slices)
+    else:
+        slice_source = compute_slices(z_values)
+
+    tensor_writer = None
+    if params['tensor_store']:
+        tensor_writer = SARTensorShardWriter(
+            params['tensor_store'], name=f"dumps{job['dump_id']}_{params['algo']}", label=params['tensor_label'],
+            provenance={'source': os.path.abspath(job['folder']), 'dump_id': job['dump_id'],
+                        'dump_hash': job['content_hash'], 'batch_key': job['key'], **reconstruction_config(
+                            params['algo'], params['fista_iters'], params['fista_lambda'],
+                            params['frames_in_x'], params['frames_in_y'])},
+            dtype=params['tensor_dtype'])
+
+    # Without images, slices only pass through (no stack is kept)
+    sink = SARStreamSink(spill_dir=job['spill_dir']) if params['images'] else None
+    n_slices = 0
+    for z_mm, sar_slice, _, _ in slice_source:
+        if sink is not None:
+            sink.add_slice(z_mm, sar_slice)
+        if tensor_writer is not None:
+            tensor_writer.add_slice(z_mm, sar_slice)
+        n_slices += 1
+    raw_data.clear()
+
+    if tensor_writer is not None:
+        tensor_writer.close()
+
+    global_max = None
+    if sink is not None:
+        # Global max is only known after the sweep, so slices are written afterwards
+        partial_dir = job['output_dir'] + '.partial'
+        if os.path.exists(partial_dir):
+            shutil.rmtree(partial_dir)
+        sar_stack = sink.volume()
+        with SARDumpWriter(partial_dir, sink.global_max, fmt=params['dump_format'],
+                           encoder=job['dump_encoder'], workers=job['dump_workers']) as dump_writer:
+            for i, z_val in enumerate(sink.z_values):
+                dump_writer.write(z_val, sar_stack[i])
+        with open(os.path.join(partial_dir, OUTPUT_STAMP_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'key': job['key'], 'params': params}, f, indent=2, sort_keys=True)
+        sink.close()
+        global_max = sink.global_max
+
+        if os.path.exists(job['output_dir']):
+            shutil.rmtree(job['output_dir'])
+        os.replace(partial_dir, job['output_dir'])
+    return {
+        'slices': n_slices,
+        'global_max': global_max,
+        'seconds': round(time.time() - start, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch process SAR dumps.")
+    parser.add_argument("--dump", type=int, nargs='+', default=None, help="Dump ID(s) to process (e.g., 65 66). Default: every dumpsN folder in --root")
+    parser.add_argument("--root", type=str, default='.', help="Directory containing the dumpsN folders (default: current directory)")
+    parser.add_argument("--output_root", type=str, default='../Safehaven-Classification/output_images', help="Slices go to <output_root>/images<N>; the manifest is stored here too")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel dump reconstructions (default: min(4, CPU count)). Each worker holds one range-FFT cube in RAM")
+    parser.add_argument("--dump_workers", type=int, default=2, help="Image-writer threads per worker (default: 2)")
+    parser.add_argument("--spill_dir", type=str, default=None, help="Spill each worker's Z-stack to a subdirectory of this path instead of RAM")
+    parser.add_argument("--slice_cache", type=str, default=None, help="Shared slice cache directory (see mainSARneuronauts2py_rev3_2.py --slice_cache)")
+    parser.add_argument("--slice_cache_gb", type=float, default=4.0, help="Size cap of --slice_cache in GB (default: 4)")
+    parser.add_argument("--no_images", action='store_true', help="Don't write images<N> slice images (e.g. with --tensor_store only)")
+    parser.add_argument("--tensor_store", type=str, default=None, help="Also export 100x100 training tensors of each dump to this tensor store")
+    parser.add_argument("--labels", type=str, default=None, help="JSON file mapping dump id to class label for --tensor_store, e.g. {\"31\": \"Knife\"}")
+    parser.add_argument("--tensor_dtype", type=str, default='float32', choices=['float32', 'float16'], help="Storage dtype for --tensor_store (default: float32)")
+    parser.add_argument("--force", action='store_true', help="Reprocess dumps even if the manifest marks them done")
+    parser.add_argument("--dry_run", action='store_true', help="Only list what would be processed")
+    # Reconstruction parameters (part of the manifest key)
+    parser.add_argument("--zindex", type=str, default=None)
+    parser.add_argument("--z_start", "--zstart", dest='zstart', type=str, default="300")
+    parser.add_argument("--z_end", "--zend", dest='zend', type=str, default="400")
+    parser.add_argument("--zstep", type=str, default="1")
+    parser.add_argument("--algo", type=str, default='mf', choices=['mf', 'fista', 'bpa'])
+    parser.add_argument("--fista_iters", type=int, default=20)
+    parser.add_argument("--fista_lambda", type=float, default=0.05)
+    parser.add_argument("--frames_in_x", type=int, default=800)
+    parser.add_argument("--frames_in_y", type=int, default=40)
+    parser.add_argument("--dump_format", type=str, default='png', choices=['png', 'png16', 'npy', 'npz'])
+    parser.add_argument("--dump_encoder", type=str, default='auto', choices=['auto', 'cv2', 'numpy', 'matplotlib'])
+    args = parser.parse_args()
+
+    if args.no_images and not args.tensor_store:
+        parser.error("--no_images requires --tensor_store (nothing would be written)")
+    labels = {}
+    if args.tensor_store:
+        if not args.labels:
+            parser.error("--tensor_store requires --labels")
+        with open(args.labels, 'r', encoding='utf-8') as f:
+            # Accept "31" or "dumps31" as keys
+            labels = {int(str(k).replace('dumps', '')): v for k, v in json.load(f).items()}
+
+    root = args.root
+    if not os.path.isdir(root):
+        print(f"Error: dump root {root} does not exist")
+        sys.exit(1)
+    dumps = discover_dumps(root, args.dump)
+    if not dumps:
+        print(f"No dumpsN folders found in {os.path.abspath(root)}")
+        return
+
+    params = {
+        'zindex': args.zindex, 'zstart': args.zstart, 'zend': args.zend, 'zstep': args.zstep,
+        'algo': args.algo, 'fista_iters': args.fista_iters, 'fista_lambda': args.fista_lambda,
+        'frames_in_x': args.frames_in_x, 'frames_in_y': args.frames_in_y,
+        'dump_format': args.dump_format, 'images': not args.no_images,
+        'tensor_store': os.path.abspath(args.tensor_store) if args.tensor_store else None,
+        'tensor_dtype': args.tensor_dtype,
+    }
+
+    os.makedirs(args.output_root, exist_ok=True)
+    manifest_path = os.path.join(args.output_root, MANIFEST_FILE)
+    manifest = load_manifest(manifest_path)
+
+    # Hash dumps in parallel (I/O bound, hashlib releases the GIL)
+    print(f"Hashing {len(dumps)} dump folder(s)...")
+    with ThreadPoolExecutor(max_workers=min(8, len(dumps))) as pool:
+        hashes = list(pool.map(lambda d: dump_content_hash(d[1], manifest['hashes']), dumps))
+
+    jobs = []
+    for (dump_id, folder), content_hash in zip(dumps, hashes):
+        job_params = dict(params, tensor_label=labels.get(dump_id))
+        if args.tensor_store and job_params['tensor_label'] is None:
+            print(f"Warning: no label for dumps{dump_id} in {args.labels}; not exporting its training tensors")
+            if args.no_images:
+                continue
+            job_params['tensor_store'] = None
+        key = f"dumps{dump_id}-{content_hash[:16]}-{params_key(job_params)}"
+        output_dir = os.path.join(args.output_root, f"images{dump_id}")
+        entry = manifest['jobs'].get(key)
+        if entry and entry.get('status') == 'done' and _outputs_exist(key, entry) and not args.force:
+            print(f"Skipping dumps{dump_id}: already processed ({entry['slices']} slices)")
+            continue
+        if entry and entry.get('status') == 'running':
+            print(f"Resuming dumps{dump_id}: previous run was interrupted")
+        jobs.append({
+            'key': key,
+            'dump_id': dump_id,
+            'folder': folder,
+            'content_hash': content_hash,
+            'output_dir': output_dir,
+            'params': job_params,
+            'spill_dir': os.path.join(args.spill_dir, f"dumps{dump_id}") if args.spill_dir else None,
+            'dump_encoder': args.dump_encoder,
+            'dump_workers': args.dump_workers,
+            'slice_cache': args.slice_cache,
+            'slice_cache_gb': args.slice_cache_gb,
+        })
+
+    if args.dry_run or not jobs:
+        for job in jobs:
+            print(f"Would process dumps{job['dump_id']} -> {job['output_dir']}")
+        save_manifest(manifest, manifest_path)
+        print("Batch processing complete.")
+        return
+
+    workers = max(1, min(args.workers or min(4, os.cpu_count() or 1), len(jobs)))
+    print(f"Processing {len(jobs)} dump(s) on {workers} worker(s)...")
+
+    # Mark jobs as running up front: a crash leaves them 'running', and they are redone next time
+    for job in jobs:
+        manifest['jobs'][job['key']] = {
+            'status': 'running', 'dump_id': job['dump_id'], 'folder': os.path.abspath(job['folder']),
+            'content_hash': job['content_hash'], 'params': job['params'], 'output_dir': job['output_dir'],
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+    save_manifest(manifest, manifest_path)
+
+    batch_start = time.time()
+    failures = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_dump, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            entry = manifest['jobs'][job['key']]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures += 1
+                entry.update({'status': 'failed', 'error': repr(e)})
+                print(f"Error processing dumps{job['dump_id']}: {e}")
+            else:
+                entry.update({'status': 'done', 'finished': time.strftime('%Y-%m-%dT%H:%M:%S'), **result})
+                entry.pop('error', None)
+                print(f"Successfully processed dumps{job['dump_id']}: {result['slices']} slices in {result['seconds']:.1f}s")
+            # Persist after every dump so finished work survives an interrupted batch
+            save_manifest(manifest, manifest_path)
+
+    elapsed = time.time() - batch_start
+    print(f"Batch processing complete: {len(jobs) - failures} done, {failures} failed in {elapsed:.1f}s")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
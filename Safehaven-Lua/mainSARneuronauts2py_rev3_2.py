@@ -1,9 +1,18 @@
 import os
 import argparse
+import json
 import numpy as np
 import matplotlib.pyplot as plt
-from matplotlib.widgets import Slider
 from scipy.fft import fft, fft2, ifft2, fftshift
+from sar_stream import SARStreamSink
+from sar_volume_store import SARVolume, SARVolumeWriter
+from sar_scatter_export import export_scatter3d
+from sar_slice_viewer import export_slice_viewer, serve_slice_viewer, wait_for_slice_viewer
+from sar_dump_writer import SARDumpWriter, DUMP_FORMATS, DUMP_ENCODERS
+from sar_raster_view import SliceInspector, show_raster
+from sar_slice_cache import SARSliceCache, dump_content_hash
+from sar_tensor_store import SARTensorShardWriter, TENSOR_DTYPES
+from sar_early_stop import SweepEarlyStopper
 
 
 def load_data_cube(filename, samples, X, Y, option):
@@ -524,29 +533,11 @@ def get_unique_filename(base_name):
         counter += 1
 
 
-def main():
-    parser = argparse.ArgumentParser(description='SAR Reconstruction (rev3)')
-    parser.add_argument('--folder', type=str, default='dumps', help='Folder containing scan data')
-    parser.add_argument('--zindex', type=str, default=None, help="Single Z slice to process (e.g., '300', '300mm', '0.3m')")
-    parser.add_argument('--zstep', type=str, default=None, help="Step size for Z sweep (e.g., '3', '3mm', '0.003m')")
-    parser.add_argument('--zstart', '--z_start', dest='zstart', type=str, default=None, help="Start Z value for sweep (e.g., '300', '300mm', '0.3m')")
-    parser.add_argument('--zend', '--z_end', dest='zend', type=str, default=None, help="End Z value for sweep (e.g., '800', '800mm', '0.8m')")
-    parser.add_argument('--xyonly', action='store_true', help='Only generate the X-Y image; skip X-Z and Y-Z heatmaps')
-    parser.add_argument('--3d_scatter', dest='scatter3d', action='store_true', help='Generate interactive 3D scatter plot')
-    parser.add_argument('--3d_scatter_intensity', dest='scatter3d_intensity', type=float, default=95.0, help='Initial percentile threshold for 3D scatter plot (0-100)')
-    parser.add_argument('--plotly', action='store_true', help='Generate interactive Plotly HTML with Z-slider instead of Matplotlib window')
-    parser.add_argument('--mat_plot_lib', action='store_true', help='Force use of Matplotlib for visualization, overriding --plotly')
-    parser.add_argument('--sar_dump', type=str, default=None, help='Directory to dump processed SAR images (Z-slices)')
-    parser.add_argument('--silent', action='store_true', help='Suppress all graphical output and heatmap generation')
-    parser.add_argument('--algo', type=str, default='mf', choices=['mf', 'fista', 'bpa'], help="Reconstruction algorithm: 'mf' (Matched Filter), 'fista' (Fast Iterative Shrinkage-Thresholding), or 'bpa' (Back Projection)")
-    parser.add_argument('--fista_iters', type=int, default=20, help="Number of FISTA iterations")
-    parser.add_argument('--fista_lambda', type=float, default=0.05, help="FISTA regularization ratio (0.0 to 1.0)")
-    parser.add_argument('--frames_in_x', type=int, default=800, help='Number of frames in X dimension (default: 800)')
-    parser.add_argument('--frames_in_y', type=int, default=40, help='Number of frames in Y dimension (default: 40)')
-    args = parser.parse_args()
-
-    # Configuration
-    data_dir = args.folder
+def resolve_data_dir(folder):
+    """
+    Resolve the scan data folder, falling back to a path relative to this script.
+    """
+    data_dir = folder
 
     # Robust directory check
     if not os.path.exists(data_dir):
@@ -559,40 +550,30 @@ def main():
         else:
             # If still not found, we'll let the subsequent code fail with a clear error or handle it there
             pass
+    return data_dir
 
-    X = args.frames_in_x
-    Y = args.frames_in_y
-    samples = 512
 
+def load_raw_data_fft(data_dir, X, Y, samples=512, n_fft_time=1024):
+    """
+    Load all scan rows from data_dir and return the range FFT (n_fft_time, Y, X).
+    """
     def filename_fn(y):
         return f"scan{y}_Raw_0.bin"
         
     print("Loading data...")
     raw_data = stack(samples, X, Y, 1, data_dir, filename_fn)
 
-    # Parameters
-    n_fft_time = 1024
-    # z0 will be iterated
-    # dx = 290/400
-    # dy = 205/100 # Note: As per original MATLAB code
-    
-
-    #This is our config 12-07
-    dx = 18 * 0.018  # = 0.324 mm (Speed * Periodicity)
-    dy = 1.0
-    n_fft_space = 1024
-
-
-    c = 299792458.0
-    fS = 9121e3
-    Ts = 1/fS
-    K = 63.343e12
-
     # Range FFT
     print("Processing Range FFT...")
     # MATLAB: fft(rawData, nFFTtime) -> operates on first dimension (samples)
-    raw_data_fft = fft(raw_data, n=n_fft_time, axis=0)
+    return fft(raw_data, n=n_fft_time, axis=0)
 
+
+def resolve_z_values(zindex=None, zstart=None, zend=None, zstep=None):
+    """
+    Turn the --zindex/--zstart/--zend/--zstep strings into the array of Z values (mm)
+    to reconstruct. Returns (z_values, z_step_mm).
+    """
     # Z-axis iteration parameters
     # Original code used z0 = 323mm. We sweep around this value.
     z_start_mm = 300
@@ -600,23 +581,23 @@ def main():
     z_step_mm = 3 # Default step (mm)
 
     # If the user passed a single zindex, override the sweep
-    z_index_val = parse_z_value(args.zindex) if args.zindex is not None else None
+    z_index_val = parse_z_value(zindex) if zindex is not None else None
     # zstart/zend overrides, parse and validate if present
-    if args.zstart is not None:
-        z_start_parsed = parse_z_value(args.zstart)
+    if zstart is not None:
+        z_start_parsed = parse_z_value(zstart)
         if z_start_parsed is None:
-            raise ValueError(f"Invalid zstart value: {args.zstart}")
+            raise ValueError(f"Invalid zstart value: {zstart}")
         z_start_mm = z_start_parsed
-    if args.zend is not None:
-        z_end_parsed = parse_z_value(args.zend)
+    if zend is not None:
+        z_end_parsed = parse_z_value(zend)
         if z_end_parsed is None:
-            raise ValueError(f"Invalid zend value: {args.zend}")
+            raise ValueError(f"Invalid zend value: {zend}")
         z_end_mm = z_end_parsed
     if z_start_mm >= z_end_mm:
         raise ValueError(f"zstart ({z_start_mm}mm) must be less than zend ({z_end_mm}mm)")
     # If the user passed a zstep value, override default z_step_mm
-    if args.zstep is not None:
-        z_step_val = parse_z_value(args.zstep)
+    if zstep is not None:
+        z_step_val = parse_z_value(zstep)
         if z_step_val <= 0:
             raise ValueError(f"Invalid zstep: {z_step_val}. Must be > 0.")
         z_step_mm = z_step_val
@@ -626,14 +607,58 @@ def main():
     else:
         z_values = np.arange(z_start_mm, z_end_mm + z_step_mm, z_step_mm)
         print(f"Starting Z-sweep from {z_start_mm}mm to {z_end_mm}mm with {z_step_mm}mm step...")
-    if args.xyonly:
-        print("XY-only flag set; skipping X-Z and Y-Z heatmap generation.")
+    return z_values, z_step_mm
 
-    sar_stack = []
 
-    # Variables to hold axis info (assuming constant across Z)
-    x_axis = None
-    y_axis = None
+# Scan/reconstruction geometry used by iter_sar_slices
+# z0 will be iterated
+# dx = 290/400
+# dy = 205/100 # Note: As per original MATLAB code
+SCAN_GEOMETRY = {
+    #This is our config 12-07
+    'dx': 18 * 0.018,  # = 0.324 mm (Speed * Periodicity)
+    'dy': 1.0,
+    'n_fft_space': 1024,
+    # Use scan dimensions for axis alignment
+    'scan_width_x': 280,
+    'scan_height_y': 40,
+    # Use a larger display size to see the full reconstruction (beyond the scan area)
+    'display_width_x': 400,
+    'display_height_y': 300,
+}
+
+
+def reconstruction_config(algo='mf', fista_iters=20, fista_lambda=0.05, frames_in_x=800, frames_in_y=40,
+                          samples=512, n_fft_time=1024):
+    """
+    Everything that determines a reconstructed slice's pixels (besides the raw data
+    and Z). Used as the slice cache key.
+    """
+    config = {'algo': algo, 'frames_in_x': frames_in_x, 'frames_in_y': frames_in_y,
+              'samples': samples, 'n_fft_time': n_fft_time, 'geometry': SCAN_GEOMETRY}
+    if algo == 'fista':
+        config.update(fista_iters=fista_iters, fista_lambda=fista_lambda)
+    return config
+
+
+def iter_sar_slices(raw_data_fft, z_values, algo='mf', fista_iters=20, fista_lambda=0.05, n_fft_time=1024):
+    """
+    Reconstruct one Z slice at a time.
+    Yields (z_mm, magnitude_slice (Y, X), x_axis, y_axis); out-of-range Z values are skipped.
+    """
+    dx = SCAN_GEOMETRY['dx']
+    dy = SCAN_GEOMETRY['dy']
+    n_fft_space = SCAN_GEOMETRY['n_fft_space']
+
+    c = 299792458.0
+    fS = 9121e3
+    Ts = 1/fS
+    K = 63.343e12
+
+    scan_width_x = SCAN_GEOMETRY['scan_width_x']
+    scan_height_y = SCAN_GEOMETRY['scan_height_y']
+    display_width_x = SCAN_GEOMETRY['display_width_x']
+    display_height_y = SCAN_GEOMETRY['display_height_y']
 
     for z_mm in z_values:
         z0 = z_mm * 1e-3
@@ -658,32 +683,195 @@ def main():
         
         # Create SAR Image
         # print("Reconstructing SAR Image...")
-        
-        # Use scan dimensions for axis alignment
-        scan_width_x = 280
-        scan_height_y = 40
-        
-        # Use a larger display size to see the full reconstruction (beyond the scan area)
-        display_width_x = 400
-        display_height_y = 300
-        
-        if args.algo == 'fista':
-             sar_image, x_axis, y_axis = reconstruct_sar_image_fista(sar_data, matched_filter, dx, dy, display_width_x, display_height_y, args.fista_iters, args.fista_lambda)
-        elif args.algo == 'bpa':
+        if algo == 'fista':
+             sar_image, x_axis, y_axis = reconstruct_sar_image_fista(sar_data, matched_filter, dx, dy, display_width_x, display_height_y, fista_iters, fista_lambda)
+        elif algo == 'bpa':
              sar_image, x_axis, y_axis = reconstruct_sar_image_bpa(raw_data_fft, dx, dy, z_mm, scan_width_x, scan_height_y, display_width_x, display_height_y)
         else:
              sar_image, x_axis, y_axis = reconstruct_sar_image(sar_data, matched_filter, dx, dy, display_width_x, display_height_y)
         
         # Shift axes so that (0,0) corresponds to the bottom-left of the physical scan area
-        if args.algo != 'bpa': # BPA already returns centered axes
+        if algo != 'bpa': # BPA already returns centered axes
             x_axis += scan_width_x / 2
             y_axis += scan_height_y / 2
         
         # Store magnitude
         # MATLAB: fliplr(sarImage)
-        sar_stack.append(np.abs(np.fliplr(sar_image)))
+        yield z_mm, np.abs(np.fliplr(sar_image)), x_axis, y_axis
 
-    sar_stack = np.array(sar_stack) # Shape (N_z, Y, X)
+
+def main():
+    parser = argparse.ArgumentParser(description='SAR Reconstruction (rev3)')
+    parser.add_argument('--folder', type=str, default='dumps', help='Folder containing scan data')
+    parser.add_argument('--zindex', type=str, default=None, help="Single Z slice to process (e.g., '300', '300mm', '0.3m')")
+    parser.add_argument('--zstep', type=str, default=None, help="Step size for Z sweep (e.g., '3', '3mm', '0.003m')")
+    parser.add_argument('--zstart', '--z_start', dest='zstart', type=str, default=None, help="Start Z value for sweep (e.g., '300', '300mm', '0.3m')")
+    parser.add_argument('--zend', '--z_end', dest='zend', type=str, default=None, help="End Z value for sweep (e.g., '800', '800mm', '0.8m')")
+    parser.add_argument('--xyonly', action='store_true', help='Only generate the X-Y image; skip X-Z and Y-Z heatmaps')
+    parser.add_argument('--3d_scatter', dest='scatter3d', action='store_true', help='Generate interactive 3D scatter plot')
+    parser.add_argument('--3d_scatter_intensity', dest='scatter3d_intensity', type=float, default=95.0, help='Initial percentile threshold for 3D scatter plot (0-100)')
+    parser.add_argument('--3d_scatter_lod', dest='scatter3d_lod', type=str, default='1,2,4', help="Comma-separated voxel downsampling factors for the 3D scatter detail slider (default: '1,2,4')")
+    parser.add_argument('--3d_scatter_max_points', dest='scatter3d_max_points', type=int, default=200000, help='Point budget used to pick the initial 3D scatter detail level (default: 200000)')
+    parser.add_argument('--plotly', action='store_true', help='Generate interactive Plotly HTML with Z-slider instead of Matplotlib window')
+    parser.add_argument('--mat_plot_lib', action='store_true', help='Force use of Matplotlib for visualization, overriding --plotly')
+    parser.add_argument('--slice_viewer', type=str, default=None, help='Export a compact binary slice viewer (quantized slices + static HTML/JS) to this directory')
+    parser.add_argument('--slice_viewer_bits', type=int, default=8, choices=[8, 16], help='Quantization depth for --slice_viewer slices (default: 8)')
+    parser.add_argument('--slice_viewer_serve', action='store_true', help='Serve the --slice_viewer export on localhost and open it in the browser')
+    parser.add_argument('--sar_dump', type=str, default=None, help='Directory to dump processed SAR images (Z-slices)')
+    parser.add_argument('--dump_format', type=str, default='png', choices=list(DUMP_FORMATS), help="Format for --sar_dump: 'png' (8-bit gray, classifier default), 'png16', 'npy' or 'npz' (default: png)")
+    parser.add_argument('--dump_encoder', type=str, default='auto', choices=list(DUMP_ENCODERS), help="PNG encoder for --sar_dump: 'auto' (cv2 if installed), 'cv2', 'numpy' or 'matplotlib' (legacy plt.imsave)")
+    parser.add_argument('--dump_workers', type=int, default=None, help='Threads used by --sar_dump (default: min(8, CPU count))')
+    parser.add_argument('--silent', action='store_true', help='Suppress all graphical output and heatmap generation')
+    parser.add_argument('--algo', type=str, default='mf', choices=['mf', 'fista', 'bpa'], help="Reconstruction algorithm: 'mf' (Matched Filter), 'fista' (Fast Iterative Shrinkage-Thresholding), or 'bpa' (Back Projection)")
+    parser.add_argument('--fista_iters', type=int, default=20, help="Number of FISTA iterations")
+    parser.add_argument('--fista_lambda', type=float, default=0.05, help="FISTA regularization ratio (0.0 to 1.0)")
+    parser.add_argument('--frames_in_x', type=int, default=800, help='Number of frames in X dimension (default: 800)')
+    parser.add_argument('--frames_in_y', type=int, default=40, help='Number of frames in Y dimension (default: 40)')
+    parser.add_argument('--spill_dir', type=str, default=None, help='Spill reconstructed Z-slices to this directory instead of holding the full stack in RAM')
+    parser.add_argument('--save_volume', type=str, default=None, help='Write the float SAR volume to this chunked store directory (e.g. dumps18.sarvol)')
+    parser.add_argument('--volume_dtype', type=str, default='float32', choices=['float32', 'float16'], help='Storage dtype for --save_volume (default: float32)')
+    parser.add_argument('--volume_chunk', type=int, default=16, help='Z-slices per chunk file for --save_volume (default: 16)')
+    parser.add_argument('--slice_cache', type=str, default=None, help='Directory of cached reconstructed slices; overlapping Z sweeps of the same dump reuse them')
+    parser.add_argument('--slice_cache_gb', type=float, default=4.0, help='Size cap of --slice_cache in GB; least recently used slices are evicted (default: 4)')
+    parser.add_argument('--tensor_store', type=str, default=None, help='Export 100x100 float reflectivity tensors of every slice to this training tensor store (no PNG round trip)')
+    parser.add_argument('--tensor_label', type=str, default=None, help='Class label of this scan for --tensor_store (e.g. Knife)')
+    parser.add_argument('--tensor_dtype', type=str, default='float32', choices=list(TENSOR_DTYPES), help='Storage dtype for --tensor_store (default: float32)')
+    parser.add_argument('--load_volume', type=str, default=None, help='Re-analyze a stored SAR volume instead of loading raw data and reconstructing')
+    parser.add_argument('--early_stop_model', type=str, default=None, help='Classify each slice during the sweep with this per-slice weapon_classifier model (.pth) and stop at the decisive depth')
+    parser.add_argument('--early_stop_confidence', type=float, default=0.9, help='Confidence at which a weapon class stops the sweep (default: 0.9)')
+    parser.add_argument('--early_stop_noise_confidence', type=float, default=0.9, help="Confidence a slice needs to count towards the 'Noise' window (default: 0.9)")
+    parser.add_argument('--early_stop_noise_window', type=int, default=10, help="Consecutive confident 'Noise' slices that stop the sweep (default: 10)")
+    parser.add_argument('--early_stop_report', type=str, default=None, help='Write the early-stop decision and per-slice predictions as JSON')
+    args = parser.parse_args()
+    if args.tensor_store and not args.tensor_label:
+        parser.error('--tensor_store requires --tensor_label')
+
+    dump_hash = None
+    if args.load_volume:
+        # Re-analyze a stored volume: no raw data loading or reconstruction
+        print(f"Loading stored SAR volume from {args.load_volume}...")
+        stored_volume = SARVolume(args.load_volume)
+        z_step_mm = stored_volume.z_step or 1.0
+        slice_source = stored_volume.iter_slices()
+    else:
+        z_values, z_step_mm = resolve_z_values(args.zindex, args.zstart, args.zend, args.zstep)
+        data_dir = resolve_data_dir(args.folder)
+        # Content hash of the raw dump (cache key and tensor provenance); hashed once
+        if args.slice_cache or args.tensor_store:
+            dump_hash = dump_content_hash(data_dir)
+        if args.slice_cache:
+            # Reuse slices from earlier (overlapping) sweeps; raw data is only
+            # loaded if at least one Z has to be reconstructed
+            slice_cache = SARSliceCache(args.slice_cache, max_bytes=args.slice_cache_gb * 1024 ** 3)
+            config = reconstruction_config(args.algo, args.fista_iters, args.fista_lambda, args.frames_in_x, args.frames_in_y)
+            raw_data = {}
+
+            def compute_slices(missing_z):
+                if 'fft' not in raw_data:
+                    raw_data['fft'] = load_raw_data_fft(data_dir, args.frames_in_x, args.frames_in_y)
+                return iter_sar_slices(raw_data['fft'], missing_z, args.algo, args.fista_iters, args.fista_lambda)
+
+            slice_source = slice_cache.iter_slices(dump_hash, config, z_values, compute_slices)
+        else:
+            raw_data_fft = load_raw_data_fft(data_dir, args.frames_in_x, args.frames_in_y)
+            slice_source = iter_sar_slices(raw_data_fft, z_values, args.algo, args.fista_iters, args.fista_lambda)
+    if args.xyonly:
+        print("XY-only flag set; skipping X-Z and Y-Z heatmap generation.")
+
+    # Streaming sink: MIPs, global max/min and histogram are updated per slice.
+    # With --spill_dir the slices themselves go to disk (constant memory).
+    sink = SARStreamSink(spill_dir=args.spill_dir)
+
+    # Optional persistent float volume, written chunk by chunk during the sweep
+    volume_writer = None
+    if args.save_volume:
+        volume_path = get_unique_filename(args.save_volume)
+        volume_writer = SARVolumeWriter(
+            volume_path,
+            dtype=args.volume_dtype,
+            chunk_depth=args.volume_chunk,
+            attrs={'folder': args.folder, 'algo': args.algo,
+                   'fista_iters': args.fista_iters, 'fista_lambda': args.fista_lambda,
+                   'frames_in_x': args.frames_in_x, 'frames_in_y': args.frames_in_y}
+        )
+
+    # Optional training tensors, computed per slice (no global max needed)
+    tensor_writer = None
+    if args.tensor_store:
+        source = args.load_volume or args.folder
+        tensor_writer = SARTensorShardWriter(
+            args.tensor_store,
+            name=f"{os.path.basename(os.path.normpath(source))}_{args.algo}",
+            label=args.tensor_label,
+            provenance={'source': os.path.abspath(source), 'algo': args.algo,
+                        'fista_iters': args.fista_iters, 'fista_lambda': args.fista_lambda,
+                        'frames_in_x': args.frames_in_x, 'frames_in_y': args.frames_in_y,
+                        'dump_hash': dump_hash},
+            dtype=args.tensor_dtype
+        )
+
+    # Optional classifier-driven early termination of the sweep
+    early_stopper = None
+    if args.early_stop_model:
+        print(f"Early stopping with classifier {args.early_stop_model}...")
+        early_stopper = SweepEarlyStopper(
+            args.early_stop_model,
+            weapon_threshold=args.early_stop_confidence,
+            noise_threshold=args.early_stop_noise_confidence,
+            noise_window=args.early_stop_noise_window
+        )
+
+    # Variables to hold axis info (assuming constant across Z)
+    x_axis = None
+    y_axis = None
+
+    try:
+        for z_mm, sar_slice, x_axis, y_axis in slice_source:
+            sink.add_slice(z_mm, sar_slice)
+            if volume_writer is not None:
+                volume_writer.add_slice(z_mm, sar_slice, x_axis, y_axis)
+            if tensor_writer is not None:
+                tensor_writer.add_slice(z_mm, sar_slice)
+            if early_stopper is not None:
+                decision = early_stopper.update(z_mm, sar_slice)
+                if decision is not None:
+                    print(f"Early stop at Z = {decision['z_mm']} mm: {decision['label']} "
+                          f"(confidence {decision['confidence']:.3f}, {decision['slices']} slices)")
+                    break
+    finally:
+        # Close even on Ctrl-C so the completed chunks stay readable
+        if volume_writer is not None:
+            volume_writer.close()
+            print(f"Saved SAR volume ({len(volume_writer.z_values)} slices, {args.volume_dtype}) to {volume_writer.path}")
+
+    if tensor_writer is not None and tensor_writer.z_values:
+        tensor_path = tensor_writer.close()
+        print(f"Saved {len(tensor_writer.z_values)} training tensors (label '{args.tensor_label}') to {tensor_path}")
+
+    if early_stopper is not None:
+        decision = early_stopper.decision or early_stopper.summary()
+        if early_stopper.decision is None and decision is not None:
+            print(f"No decisive depth; most confident slice: Z = {decision['z_mm']} mm, "
+                  f"{decision['label']} ({decision['confidence']:.3f})")
+        if args.early_stop_report:
+            with open(args.early_stop_report, 'w', encoding='utf-8') as f:
+                json.dump({'model': args.early_stop_model, 'decision': decision,
+                           'predictions': [{'z_mm': z, 'label': label, 'confidence': conf}
+                                           for z, label, conf in early_stopper.predictions]}, f, indent=2)
+            print(f"Saved early-stop report to {args.early_stop_report}")
+
+    if args.slice_cache and not args.load_volume:
+        print(f"Slice cache: {slice_cache.hits} hits, {slice_cache.misses} reconstructed ({slice_cache.size_bytes() / 1024 ** 2:.1f} MB in {args.slice_cache})")
+
+    # Only Z values that produced a slice (out-of-range ones were skipped)
+    z_values = np.array(sink.z_values)
+    sar_stack = sink.volume() # Shape (N_z, Y, X); np.memmap when spilling
+    if len(z_values) == 0:
+        print("No Z slices were reconstructed; nothing to output.")
+        return
+    print(f"Volume stats: {len(z_values)} slices, max={sink.global_max:.4g}, ~p99={sink.percentile(99):.4g}")
+    if sink.spill_path:
+        print(f"Spilled SAR stack to {sink.spill_path}")
 
     # Dump images if requested
     if args.sar_dump:
@@ -691,20 +879,29 @@ def main():
         os.makedirs(args.sar_dump, exist_ok=True)
         
         # Normalize for image saving (0-255)
-        # Using global max to preserve relative intensity across Z-slices
-        stack_max = np.max(sar_stack)
-        if stack_max > 0:
-            norm_stack = (sar_stack / stack_max * 255).astype(np.uint8)
-        else:
-            norm_stack = sar_stack.astype(np.uint8)
-
-        for i, z_val in enumerate(z_values):
-            out_path = os.path.join(args.sar_dump, f"sar_z{z_val}.png")
-            # Save as grayscale
-            plt.imsave(out_path, norm_stack[i], cmap='gray')
+        # Using global max (tracked by the sink) to preserve relative intensity across Z-slices.
+        # Slices are normalized and encoded on a thread pool; the default 8-bit PNGs
+        # are pixel-identical to the original plt.imsave(..., cmap='gray') output.
+        with SARDumpWriter(args.sar_dump, sink.global_max, fmt=args.dump_format,
+                           encoder=args.dump_encoder, workers=args.dump_workers) as dump_writer:
+            for i, z_val in enumerate(z_values):
+                dump_writer.write(z_val, sar_stack[i])
         
         print(f"Saved {len(z_values)} slices to {args.sar_dump}")
 
+    # Compact binary slice viewer (lazy-loading alternative to --plotly frames).
+    # It is served from a background thread so the heatmaps, scatter export and
+    # inspector below still run; the process stays alive for it at the end.
+    viewer_server = None
+    if args.slice_viewer:
+        print(f"Exporting binary slice viewer to {args.slice_viewer}...")
+        index_path = export_slice_viewer(sar_stack, z_values, x_axis, y_axis, args.slice_viewer, bits=args.slice_viewer_bits)
+        print(f"Saved slice viewer to {index_path}")
+        if args.slice_viewer_serve and not args.silent:
+            viewer_server = serve_slice_viewer(args.slice_viewer, background=True)
+        else:
+            print(f"View with: python -m http.server -d \"{args.slice_viewer}\" then open http://localhost:8000/index.html")
+
     if args.silent:
         return
 
@@ -714,45 +911,44 @@ def main():
     # 1. Maximum Intensity Projection along Y axis (View X vs Z)
     # sar_stack is (Z, Y, X). Max over axis 1 (Y). Result (Z, X).
     if not args.xyonly:
-        mip_xz = np.max(sar_stack, axis=1)
+        mip_xz = sink.mip_xz
 
         plt.figure(figsize=(10, 6))
-        # pcolormesh expects X, Y. Here X is x_axis, Y is z_values.
-        # mip_xz shape is (Z, X).
-        plt.pcolormesh(x_axis, z_values, mip_xz, cmap='jet', shading='gouraud')
+        # Rows are Z, columns are X. mip_xz shape is (Z, X).
+        # imshow on the regular grid replaces the much slower gouraud pcolormesh.
+        im = show_raster(plt.gca(), mip_xz, x_axis, z_values, cmap='jet')
         plt.xlabel('Horizontal (mm)')
         plt.ylabel('Depth Z (mm)')
         plt.title('SAR X-Z Maximum Intensity Projection')
-        plt.colorbar(label='Intensity')
+        plt.colorbar(im, label='Intensity')
         plt.savefig('sar_heatmap_xz.png')
         print("Saved X-Z heatmap to sar_heatmap_xz.png")
 
     # 2. Maximum Intensity Projection along X axis (View Y vs Z)
     # sar_stack is (Z, Y, X). Max over axis 2 (X). Result (Z, Y).
     if not args.xyonly:
-        mip_yz = np.max(sar_stack, axis=2)
+        mip_yz = sink.mip_yz
 
         plt.figure(figsize=(10, 6))
-        # pcolormesh expects X, Y. Here X is y_axis, Y is z_values.
-        plt.pcolormesh(y_axis, z_values, mip_yz, cmap='jet', shading='gouraud')
+        # Rows are Z, columns are Y. mip_yz shape is (Z, Y).
+        im = show_raster(plt.gca(), mip_yz, y_axis, z_values, cmap='jet')
         plt.xlabel('Vertical (mm)')
         plt.ylabel('Depth Z (mm)')
         plt.title('SAR Y-Z Maximum Intensity Projection')
-        plt.colorbar(label='Intensity')
+        plt.colorbar(im, label='Intensity')
         plt.savefig('sar_heatmap_yz.png')
         print("Saved Y-Z heatmap to sar_heatmap_yz.png")
 
     # 3. Best Focus Image (Max over Z)
     # Max over axis 0 (Z). Result (Y, X).
-    mip_xy = np.max(sar_stack, axis=0)
+    mip_xy = sink.mip_xy
 
     plt.figure(figsize=(10, 6))
-    plt.pcolormesh(x_axis, y_axis, mip_xy, cmap='jet', shading='gouraud')
+    im = show_raster(plt.gca(), mip_xy, x_axis, y_axis, cmap='jet', aspect='equal')
     plt.xlabel('Horizontal (mm)')
     plt.ylabel('Vertical (mm)')
     plt.title('SAR X-Y Maximum Intensity Projection (All Z)')
-    plt.axis('equal')
-    plt.colorbar(label='Intensity')
+    plt.colorbar(im, label='Intensity')
     plt.savefig('sar_heatmap_xy_max.png')
     print("Saved X-Y max projection to sar_heatmap_xy_max.png")
 
@@ -764,115 +960,14 @@ def main():
         except ImportError:
             print("Error: plotly not found. Please install it with 'pip install plotly' or 'uv pip install plotly'")
         else:
-            # Create meshgrid for 3D plotting
-            # sar_stack is (Z, Y, X)
-            # We need coordinates corresponding to indices
-            # Z: z_values
-            # Y: y_axis
-            # X: x_axis
-            
-            # meshgrid indexing='ij' produces grids matching the array indexing (Z, Y, X)
-            Z_grid, Y_grid, X_grid = np.meshgrid(z_values, y_axis, x_axis, indexing='ij')
-            
-            # Flatten arrays for scatter plot
-            xs = X_grid.flatten()
-            ys = Y_grid.flatten()
-            zs = Z_grid.flatten()
-            vals = sar_stack.flatten()
-            
-            # Initial Thresholding
-            initial_percentile = args.scatter3d_intensity
-            
-            # Base data (using the lowest threshold to ensure all points are available if we were using transforms, 
-            # but here we are using restyle with explicit arrays, so we just need the source data)
-            # Actually, for the initial plot, we use the first percentile.
-            
-            # We will create a slider that goes from initial_percentile up to 99.9%
-            # To do this efficiently in a standalone HTML, we can pre-generate the subsets for each slider step.
-            # However, storing many copies of the data can be heavy.
-            
-            # Dynamic step count based on data size to prevent browser crashes
-            threshold_0_val = np.percentile(vals, initial_percentile)
-            mask_0 = vals > threshold_0_val
-            num_points = np.sum(mask_0)
-            
-            print(f"Filtering data: keeping points > {initial_percentile} percentile ({num_points} points)")
-            
-            if num_points > 200000:
-                print("WARNING: High point count (>200k). Reducing slider steps to 5 to prevent browser crash.")
-                num_steps = 5
-            elif num_points > 50000:
-                print("Notice: Moderate point count (>50k). Reducing slider steps to 10.")
-                num_steps = 10
-            else:
-                num_steps = 20
-            
-            percentiles = np.linspace(initial_percentile, 99.9, num_steps)
-            
-            # Recalculate threshold_0 based on the first step of the linspace (which is initial_percentile)
-            threshold_0 = np.percentile(vals, percentiles[0])
-            mask_0 = vals > threshold_0
-
-            # Create Plotly Figure
-            fig = go.Figure()
-
-            # Add the initial trace
-            fig.add_trace(go.Scatter3d(
-                x=xs[mask_0],
-                y=ys[mask_0],
-                z=zs[mask_0],
-                mode='markers',
-                marker=dict(
-                    size=3,
-                    color=vals[mask_0],
-                    colorscale='Jet',
-                    opacity=0.3,
-                    colorbar=dict(title='Intensity')
-                ),
-                name='SAR Data'
-            ))
-
-            # Create Slider Steps
-            steps = []
-            print("Generating slider steps...")
-            for p in percentiles:
-                thresh = np.percentile(vals, p)
-                mask = vals > thresh
-                
-                # We update x, y, z, and marker.color
-                step = dict(
-                    method="restyle",
-                    args=[{
-                        "x": [xs[mask]],
-                        "y": [ys[mask]],
-                        "z": [zs[mask]],
-                        "marker.color": [vals[mask]]
-                    }],
-                    label=f"{p:.1f}%"
-                )
-                steps.append(step)
-
-            sliders = [dict(
-                active=0,
-                currentvalue={"prefix": "Intensity Threshold: "},
-                pad={"t": 50},
-                steps=steps
-            )]
-
-            fig.update_layout(
-                title='3D SAR Reconstruction',
-                scene=dict(
-                    xaxis_title='Horizontal (mm)',
-                    yaxis_title='Vertical (mm)',
-                    zaxis_title='Depth Z (mm)',
-                    aspectmode='data' # Preserve aspect ratio
-                ),
-                margin=dict(l=0, r=0, b=0, t=40),
-                sliders=sliders
-            )
-
+            # One sort of voxel intensities per detail level; every slider threshold
+            # is a prefix of that order, so the HTML embeds each point only once.
+            lod_factors = [int(f) for f in args.scatter3d_lod.split(',') if f.strip()]
             output_file = get_unique_filename('sar_3d_scatter.html')
-            fig.write_html(output_file)
+            export_scatter3d(sar_stack, z_values, y_axis, x_axis, output_file,
+                             initial_percentile=args.scatter3d_intensity,
+                             lod_factors=lod_factors,
+                             max_points=args.scatter3d_max_points)
             print(f"Saved interactive 3D plot to {output_file}")
             
             # Attempt to open in browser
@@ -889,6 +984,7 @@ def main():
             import plotly.graph_objects as go
         except ImportError:
             print("Error: plotly not found. Please install it with 'pip install plotly' or 'uv pip install plotly'")
+            wait_for_slice_viewer(viewer_server)
             return
 
         # Create frames for each Z slice
@@ -896,8 +992,8 @@ def main():
         steps = []
         
         # Determine global min/max for consistent color scaling
-        cmin = np.min(sar_stack)
-        cmax = np.max(sar_stack)
+        cmin = sink.global_min
+        cmax = sink.global_max
 
         # Initial data (middle slice)
         initial_idx = len(z_values) // 2
@@ -971,52 +1067,13 @@ def main():
     else:
         print("Opening interactive inspector (Matplotlib)...")
 
-        single_z_mode = (len(z_values) == 1)
-
-        fig_int, ax_int = plt.subplots(figsize=(10, 8))
-        plt.subplots_adjust(bottom=0.25)
-
-        # If a single Z was selected, just display that single image without a slider
-        if single_z_mode:
-            idx = 0
-            mesh = ax_int.pcolormesh(x_axis, y_axis, sar_stack[idx], cmap='jet', shading='gouraud')
-            ax_int.set_xlabel('Horizontal (mm)')
-            ax_int.set_ylabel('Vertical (mm)')
-            title_obj = ax_int.set_title(f'SAR Image at Z = {z_values[idx]} mm')
-            ax_int.axis('equal')
-            fig_int.colorbar(mesh, ax=ax_int, label='Intensity')
-            plt.show()
-        else:
-            initial_idx = len(z_values) // 2
-            # Note: pcolormesh with gouraud shading
-            mesh = ax_int.pcolormesh(x_axis, y_axis, sar_stack[initial_idx], cmap='jet', shading='gouraud')
-            ax_int.set_xlabel('Horizontal (mm)')
-            ax_int.set_ylabel('Vertical (mm)')
-            title_obj = ax_int.set_title(f'SAR Image at Z = {z_values[initial_idx]} mm')
-            ax_int.axis('equal')
-            fig_int.colorbar(mesh, ax=ax_int, label='Intensity')
-
-            ax_slider = plt.axes([0.25, 0.1, 0.65, 0.03])
-            slider = Slider(
-                ax=ax_slider,
-                label='Depth Z (mm)',
-                valmin=z_values[0],
-                valmax=z_values[-1],
-                valinit=z_values[initial_idx],
-                valstep=z_step_mm
-            )
+        # imshow of LUT-colormapped, cached slice images with blitted slider updates.
+        # A single Z (--zindex) shows just that image without a slider.
+        inspector = SliceInspector(sar_stack, z_values, x_axis, y_axis, z_step_mm,
+                                   vmin=sink.global_min, vmax=sink.global_max, cmap='jet')
+        inspector.show()
 
-            def update(val):
-                # Find nearest index in z_values to the slider's current value
-                z_selected = slider.val
-                idx = int(np.argmin(np.abs(z_values - z_selected)))
-                # Update data
-                mesh.set_array(sar_stack[idx].ravel())
-                title_obj.set_text(f'SAR Image at Z = {z_values[idx]} mm')
-                fig_int.canvas.draw_idle()
-
-            slider.on_changed(update)
-            plt.show()
+    wait_for_slice_viewer(viewer_server)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,181 @@
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Parallel --sar_dump writer.
+#
+# Formats:
+#   png    8-bit grayscale, pixel-identical to the legacy
+#          plt.imsave(norm_slice, cmap='gray') dumps used for the classifier
+#          datasets (cv2.imread/PIL decode to the same gray values)
+#   png16  16-bit grayscale, slice / global_max * 65535 (no 8-bit quantization)
+#   npy    float32 slice (np.save)
+#   npz    compressed float32 slice plus z_mm and global_max (np.savez_compressed)
+#
+# Encoders (png/png16 only):
+#   cv2         cv2.imencode, releases the GIL so the thread pool scales
+#   numpy       built-in zlib PNG writer, no extra dependencies
+#   matplotlib  the original plt.imsave path (RGBA PNG), kept for exact legacy bytes
+#   auto        cv2 if installed, otherwise numpy
+
+DUMP_FORMATS = ('png', 'png16', 'npy', 'npz')
+DUMP_ENCODERS = ('auto', 'cv2', 'numpy', 'matplotlib')
+
+
+def legacy_uint8_slice(sar_slice, stack_max):
+    """
+    The 0-255 normalization --sar_dump has always used: global max, truncating cast.
+    """
+    if stack_max > 0:
+        return (np.asarray(sar_slice) / stack_max * 255).astype(np.uint8)
+    return np.asarray(sar_slice).astype(np.uint8)
+
+
+def imsave_gray_table(vmin, vmax):
+    """
+    256-entry table mapping a uint8 value to the gray level plt.imsave(cmap='gray')
+    writes for an image whose data range is [vmin, vmax] (imsave autoscales).
+    Built with matplotlib's own norm + colormap so rounding matches exactly.
+    """
+    import matplotlib.cm as cm
+    sm = cm.ScalarMappable(cmap='gray')
+    sm.set_clim(vmin, vmax)
+    # R == G == B for the gray colormap; keep one channel
+    return sm.to_rgba(np.arange(256, dtype=np.uint8), bytes=True)[:, 0].copy()
+
+
+def imsave_gray_pixels(u8_slice):
+    """
+    Single-channel equivalent of plt.imsave(u8_slice, cmap='gray').
+    """
+    table = imsave_gray_table(u8_slice.min(), u8_slice.max())
+    return table[u8_slice]
+
+
+def encode_png_numpy(img, compress_level=6):
+    """
+    Minimal PNG encoder for 2D uint8 / uint16 grayscale arrays (zlib releases the GIL).
+    """
+    img = np.ascontiguousarray(img)
+    if img.ndim != 2 or img.dtype not in (np.uint8, np.uint16):
+        raise ValueError(f"encode_png_numpy expects a 2D uint8/uint16 array, got {img.dtype} {img.shape}")
+    height, width = img.shape
+    bit_depth = 8 if img.dtype == np.uint8 else 16
+    # PNG stores 16-bit samples big-endian; prepend filter byte 0 (None) to each row
+    rows = img.astype('>u2') if bit_depth == 16 else img
+    raw = np.zeros((height, rows.strides[0] + 1), dtype=np.uint8)
+    raw[:, 1:] = rows.view(np.uint8).reshape(height, -1)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', width, height, bit_depth, 0, 0, 0, 0) # color type 0 = grayscale
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw.tobytes(), compress_level))
+            + chunk(b'IEND', b''))
+
+
+def _resolve_encoder(encoder):
+    if encoder not in DUMP_ENCODERS:
+        raise ValueError(f"Unknown dump encoder: {encoder} (choose from {DUMP_ENCODERS})")
+    if encoder != 'auto':
+        return encoder
+    try:
+        import cv2 # noqa: F401
+        return 'cv2'
+    except ImportError:
+        return 'numpy'
+
+
+class SARDumpWriter:
+    """
+    Writes Z-slices to out_dir on a thread pool.
+
+    write(z_mm, sar_slice) normalizes and encodes one slice in a worker; close()
+    waits for all pending writes and re-raises the first failure.
+    """
+
+    def __init__(self, out_dir, stack_max, fmt='png', encoder='auto', workers=None):
+        if fmt not in DUMP_FORMATS:
+            raise ValueError(f"Unknown dump format: {fmt} (choose from {DUMP_FORMATS})")
+        self.out_dir = out_dir
+        self.stack_max = float(stack_max)
+        self.fmt = fmt
+        self.encoder = _resolve_encoder(encoder)
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        os.makedirs(out_dir, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._futures = deque()
+        self.written = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def path_for(self, z_mm):
+        """Output path for a slice; names match the legacy sar_z{z}.png scheme."""
+        ext = {'png': 'png', 'png16': 'png', 'npy': 'npy', 'npz': 'npz'}[self.fmt]
+        return os.path.join(self.out_dir, f"sar_z{z_mm}.{ext}")
+
+    def write(self, z_mm, sar_slice):
+        """Queue one slice. The slice is copied so callers may reuse their buffer."""
+        # Backpressure: bound the number of queued slice copies (constant memory)
+        while len(self._futures) >= 2 * self.workers:
+            self._futures.popleft().result()
+        sar_slice = np.array(sar_slice, copy=True)
+        self._futures.append(self._pool.submit(self._write_one, z_mm, sar_slice))
+
+    def _write_one(self, z_mm, sar_slice):
+        out_path = self.path_for(z_mm)
+        if self.fmt == 'npy':
+            np.save(out_path, sar_slice.astype(np.float32))
+        elif self.fmt == 'npz':
+            np.savez_compressed(out_path, slice=sar_slice.astype(np.float32), z_mm=float(z_mm), global_max=self.stack_max)
+        elif self.fmt == 'png':
+            u8 = legacy_uint8_slice(sar_slice, self.stack_max)
+            if self.encoder == 'matplotlib':
+                import matplotlib.pyplot as plt
+                plt.imsave(out_path, u8, cmap='gray')
+            else:
+                self._save_png(out_path, imsave_gray_pixels(u8))
+        else: # png16
+            if self.stack_max > 0:
+                scaled = np.rint(sar_slice / self.stack_max * 65535.0)
+            else:
+                scaled = np.zeros_like(sar_slice)
+            u16 = np.clip(scaled, 0, 65535).astype(np.uint16)
+            if self.encoder == 'matplotlib':
+                # matplotlib has no 16-bit grayscale PNG path; fall back to the numpy encoder
+                self._save_png(out_path, u16, encoder='numpy')
+            else:
+                self._save_png(out_path, u16)
+        self.written.append(out_path)
+        return out_path
+
+    def _save_png(self, out_path, img, encoder=None):
+        encoder = encoder or self.encoder
+        if encoder == 'cv2':
+            import cv2
+            ok, buf = cv2.imencode('.png', img)
+            if not ok:
+                raise IOError(f"cv2 failed to encode {out_path}")
+            data = buf.tobytes()
+        else:
+            data = encode_png_numpy(img)
+        with open(out_path, 'wb') as f:
+            f.write(data)
+
+    def close(self):
+        """Wait for all queued slices; re-raise the first error."""
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self._futures = deque()
+            self._pool.shutdown(wait=True)
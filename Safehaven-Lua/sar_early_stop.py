@@ -0,0 +1,77 @@
+import os
+import sys
+import numpy as np
+from sar_tensor_store import reflectivity_tensor
+
+# Classifier-driven early termination of the Z-sweep.
+#
+# Every reconstructed slice is classified with a trained per-slice WeaponCNN
+# (Safehaven-Classification/weapon_classifier.py) as soon as it comes out of
+# the sweep. The sweep stops at the first decisive depth:
+#   - weapon: any non-Noise class predicted with confidence >= weapon_threshold
+#   - noise:  noise_window consecutive slices predicted Noise with
+#             confidence >= noise_threshold
+# Slices are normalized exactly like --tensor_store exports (the classifier's
+# reflectivity image without the PNG round trip).
+
+CLASSIFIER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Safehaven-Classification')
+
+
+def _weapon_classifier():
+    # The classifier (and torch) are only needed when early stopping is used
+    if CLASSIFIER_DIR not in sys.path:
+        sys.path.append(CLASSIFIER_DIR)
+    import weapon_classifier
+    return weapon_classifier
+
+
+class SweepEarlyStopper:
+    """
+    update(z_mm, sar_slice) classifies one slice and returns a decision dict
+    (kind, label, confidence, z_mm, slices) once the sweep can stop, else None.
+    """
+
+    def __init__(self, model_path, weapon_threshold=0.9, noise_threshold=0.9, noise_window=10,
+                 noise_class='Noise'):
+        wc = _weapon_classifier()
+        self._predict = wc.predict_tensors
+        self.model, self.classes = wc.load_model(model_path)
+        if self.model.meta['input_mode'] != 'slice':
+            raise ValueError(f"Early stopping needs a per-slice model; {model_path} is a '{self.model.meta['input_mode']}' model")
+        self.weapon_threshold = weapon_threshold
+        self.noise_threshold = noise_threshold
+        self.noise_window = noise_window
+        self.noise_class = noise_class
+        self.predictions = [] # (z_mm, label, confidence) per classified slice
+        self.decision = None
+        self._noise_run = 0
+
+    def update(self, z_mm, sar_slice):
+        probs = self._predict(self.model, reflectivity_tensor(sar_slice)[None], batch_size=1)[0]
+        idx = int(np.argmax(probs))
+        label, confidence = self.classes[idx], float(probs[idx])
+        self.predictions.append((float(z_mm), label, confidence))
+
+        if label == self.noise_class and confidence >= self.noise_threshold:
+            self._noise_run += 1
+        else:
+            self._noise_run = 0
+        if label != self.noise_class and confidence >= self.weapon_threshold:
+            self.decision = {'kind': 'weapon', 'label': label, 'confidence': confidence}
+        elif self._noise_run >= self.noise_window:
+            window = self.predictions[-self.noise_window:]
+            self.decision = {'kind': 'noise', 'label': self.noise_class,
+                             'confidence': min(conf for _, _, conf in window),
+                             'window_start_mm': window[0][0]}
+        if self.decision is not None:
+            self.decision.update(z_mm=float(z_mm), slices=len(self.predictions))
+        return self.decision
+
+    def summary(self):
+        """Most confident non-Noise slice (or the last slice) when no early decision was made."""
+        if not self.predictions:
+            return None
+        weapons = [p for p in self.predictions if p[1] != self.noise_class]
+        z_mm, label, confidence = max(weapons, key=lambda p: p[2]) if weapons else self.predictions[-1]
+        return {'kind': 'undecided', 'label': label, 'confidence': confidence, 'z_mm': z_mm,
+                'slices': len(self.predictions)}
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.colors import Normalize
+from matplotlib.cm import ScalarMappable
+from matplotlib.widgets import Slider
+
+
+def colormap_lut(cmap='jet', n=256):
+    """
+    Precomputed (n, 4) uint8 RGBA lookup table for a Matplotlib colormap.
+    """
+    return plt.get_cmap(cmap, n)(np.arange(n), bytes=True)
+
+
+def raster_extent(x_axis, y_axis):
+    """
+    imshow extent that puts pixel centers on the axis coordinates
+    (same placement as pcolormesh with gouraud shading).
+    """
+    x_axis = np.asarray(x_axis, dtype=np.float64)
+    y_axis = np.asarray(y_axis, dtype=np.float64)
+    dx = (x_axis[-1] - x_axis[0]) / max(len(x_axis) - 1, 1) if len(x_axis) > 1 else 1.0
+    dy = (y_axis[-1] - y_axis[0]) / max(len(y_axis) - 1, 1) if len(y_axis) > 1 else 1.0
+    return [x_axis[0] - dx / 2, x_axis[-1] + dx / 2, y_axis[0] - dy / 2, y_axis[-1] + dy / 2]
+
+
+def show_raster(ax, data, x_axis, y_axis, cmap='jet', aspect='auto', vmin=None, vmax=None):
+    """
+    Drop-in replacement for ax.pcolormesh(x_axis, y_axis, data, shading='gouraud')
+    on the regular grids produced by the reconstruction: one texture, no triangulation.
+    Returns the AxesImage (usable with colorbar()).
+    """
+    return ax.imshow(np.asarray(data), extent=raster_extent(x_axis, y_axis), origin='lower',
+                     cmap=cmap, aspect=aspect, interpolation='bilinear', vmin=vmin, vmax=vmax)
+
+
+class SliceRasterCache:
+    """
+    LRU cache of colormapped RGBA images of the stack's Z-slices.
+
+    Each slice is mapped once through the LUT with a fixed (global) color range;
+    scrubbing back over a slice is then a dictionary lookup.
+    """
+
+    def __init__(self, sar_stack, vmin, vmax, cmap='jet', max_bytes=512 * 1024 * 1024):
+        self.sar_stack = sar_stack
+        self.vmin = float(vmin)
+        self.vmax = float(vmax)
+        self.lut = colormap_lut(cmap)
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._bytes = 0
+
+    def rgba(self, idx):
+        """Return the (Y, X, 4) uint8 image of slice idx."""
+        if idx in self._images:
+            self._images.move_to_end(idx)
+            return self._images[idx]
+
+        data = np.asarray(self.sar_stack[idx], dtype=np.float32)
+        span = self.vmax - self.vmin
+        n = len(self.lut)
+        if span > 0:
+            lut_idx = (data - self.vmin) * ((n - 1) / span)
+            np.clip(lut_idx, 0, n - 1, out=lut_idx)
+            image = self.lut[lut_idx.astype(np.intp)]
+        else:
+            image = np.broadcast_to(self.lut[0], data.shape + (4,)).copy()
+
+        self._images[idx] = image
+        self._bytes += image.nbytes
+        # Evict least recently used slices, always keeping the current one
+        while self._bytes > self.max_bytes and len(self._images) > 1:
+            _, old = self._images.popitem(last=False)
+            self._bytes -= old.nbytes
+        return image
+
+
+class SliceInspector:
+    """
+    Interactive Z-slice inspector: imshow of cached RGBA slices + a Z slider.
+
+    Slider moves only restore the saved background and redraw the image, the
+    title and the slider (blitting) instead of re-rendering the whole figure.
+    Falls back to draw_idle() on backends without blitting support.
+    """
+
+    def __init__(self, sar_stack, z_values, x_axis, y_axis, z_step_mm, vmin, vmax, cmap='jet'):
+        self.z_values = np.asarray(z_values)
+        self.cache = SliceRasterCache(sar_stack, vmin, vmax, cmap)
+
+        self.fig, self.ax = plt.subplots(figsize=(10, 8))
+        plt.subplots_adjust(bottom=0.25)
+
+        initial_idx = len(self.z_values) // 2
+        self.idx = initial_idx
+        self.image = self.ax.imshow(self.cache.rgba(initial_idx), extent=raster_extent(x_axis, y_axis),
+                                    origin='lower', aspect='equal', interpolation='bilinear', animated=True)
+        self.ax.set_xlabel('Horizontal (mm)')
+        self.ax.set_ylabel('Vertical (mm)')
+        self.title = self.ax.set_title(f'SAR Image at Z = {self.z_values[initial_idx]} mm', animated=True)
+
+        # The RGBA image carries no data, so the colorbar uses a standalone mappable
+        mappable = ScalarMappable(norm=Normalize(vmin=vmin, vmax=vmax), cmap=cmap)
+        self.fig.colorbar(mappable, ax=self.ax, label='Intensity')
+
+        self.slider = None
+        self.ax_slider = None
+        if len(self.z_values) > 1:
+            self.ax_slider = plt.axes([0.25, 0.1, 0.65, 0.03])
+            self.slider = Slider(
+                ax=self.ax_slider,
+                label='Depth Z (mm)',
+                valmin=self.z_values[0],
+                valmax=self.z_values[-1],
+                valinit=self.z_values[initial_idx],
+                valstep=z_step_mm
+            )
+            # Redraws are handled by blitting below
+            self.slider.drawon = False
+            self.ax_slider.set_animated(True)
+            self.slider.on_changed(self.update)
+
+        self._background = None
+        self._blit = self.fig.canvas.supports_blit
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _animated_artists(self):
+        artists = [self.image, self.title]
+        if self.ax_slider is not None:
+            artists.append(self.ax_slider)
+        return artists
+
+    def _on_draw(self, event):
+        """After a full redraw (resize, zoom), grab the static background."""
+        canvas = self.fig.canvas
+        self._background = canvas.copy_from_bbox(self.fig.bbox) if self._blit else None
+        for artist in self._animated_artists():
+            self.fig.draw_artist(artist)
+
+    def update(self, val):
+        # Find nearest index in z_values to the slider's current value
+        idx = int(np.argmin(np.abs(self.z_values - val)))
+        self.idx = idx
+        self.image.set_data(self.cache.rgba(idx))
+        self.title.set_text(f'SAR Image at Z = {self.z_values[idx]} mm')
+
+        canvas = self.fig.canvas
+        if self._blit and self._background is not None:
+            canvas.restore_region(self._background)
+            for artist in self._animated_artists():
+                self.fig.draw_artist(artist)
+            canvas.blit(self.fig.bbox)
+            canvas.flush_events()
+        else:
+            canvas.draw_idle()
+
+    def show(self):
+        plt.show()
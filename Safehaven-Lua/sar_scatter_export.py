@@ -0,0 +1,208 @@
+import base64
+import json
+import numpy as np
+
+
+def _percentile_from_sorted_tail(sorted_tail, tail_start, n_total, percentile):
+    """
+    np.percentile(vals, percentile) (linear interpolation) computed from the
+    ascending-sorted tail vals_sorted[tail_start:], valid as long as the
+    requested percentile lies inside the tail.
+    """
+    pos = percentile / 100.0 * (n_total - 1)
+    lo = int(np.floor(pos))
+    hi = min(lo + 1, n_total - 1)
+    frac = pos - lo
+    v_lo = sorted_tail[lo - tail_start]
+    v_hi = sorted_tail[hi - tail_start]
+    return v_lo + frac * (v_hi - v_lo)
+
+
+def _max_pool_volume(volume, z_values, y_axis, x_axis, factor):
+    """
+    Max-pool a (Z, Y, X) volume over factor x factor x factor voxel blocks.
+    Block coordinates are the mean of the member coordinates; the last block
+    along each axis may be smaller (np.maximum.reduceat handles ragged ends).
+    """
+    if factor == 1:
+        return volume, np.asarray(z_values, dtype=np.float64), np.asarray(y_axis, dtype=np.float64), np.asarray(x_axis, dtype=np.float64)
+
+    pooled = volume
+    pooled_axes = []
+    for axis, coords in enumerate((z_values, y_axis, x_axis)):
+        coords = np.asarray(coords, dtype=np.float64)
+        starts = np.arange(0, len(coords), factor)
+        pooled = np.maximum.reduceat(pooled, starts, axis=axis)
+        counts = np.diff(np.append(starts, len(coords)))
+        pooled_axes.append(np.add.reduceat(coords, starts) / counts)
+    return (pooled,) + tuple(pooled_axes)
+
+
+def build_scatter_levels(sar_stack, z_values, y_axis, x_axis, percentiles, lod_factors=(1, 2, 4)):
+    """
+    Build one point buffer per level-of-detail for the 3D scatter export.
+
+    For each LOD factor the volume is max-pooled, then the voxels above the
+    lowest requested percentile are sorted once by descending intensity. Every
+    higher percentile threshold is then just a prefix of that buffer, so each
+    slider step only needs a point count instead of its own copy of the data.
+
+    Returns a list of dicts with keys: factor, x, y, z, vals (float32, sorted
+    descending), counts (points per percentile step) and shape.
+    """
+    volume = np.asarray(sar_stack, dtype=np.float32)
+    lowest = float(np.min(percentiles))
+    levels = []
+
+    for factor in lod_factors:
+        pooled, zs, ys, xs = _max_pool_volume(volume, z_values, y_axis, x_axis, factor)
+        vals = pooled.ravel()
+        n = vals.size
+
+        # Partition once so only the tail above the lowest percentile is sorted
+        tail_start = int(np.floor(lowest / 100.0 * (n - 1)))
+        part = np.argpartition(vals, tail_start)[tail_start:]
+        tail_order = part[np.argsort(vals[part], kind='stable')]
+        sorted_tail = vals[tail_order]
+
+        # np.percentile thresholds straight from the sorted tail; "> thresh" is a prefix
+        # of the descending order, its length found by binary search
+        counts = []
+        for p in percentiles:
+            thresh = _percentile_from_sorted_tail(sorted_tail, tail_start, n, p)
+            counts.append(int(len(sorted_tail) - np.searchsorted(sorted_tail, thresh, side='right')))
+
+        # Keep only the largest prefix (lowest threshold), descending order
+        keep = tail_order[::-1][:max(counts)]
+        iz, iy, ix = np.unravel_index(keep, pooled.shape)
+        levels.append({
+            'factor': int(factor),
+            'x': xs[ix].astype(np.float32),
+            'y': ys[iy].astype(np.float32),
+            'z': zs[iz].astype(np.float32),
+            'vals': vals[keep].astype(np.float32),
+            'counts': counts,
+            'shape': list(pooled.shape),
+        })
+    return levels
+
+
+def _b64_float32(arr):
+    """Encode a float32 array as base64 of its little-endian bytes."""
+    return base64.b64encode(np.ascontiguousarray(arr, dtype='<f4').tobytes()).decode('ascii')
+
+
+# JS run after the figure is created. {plot_id} is filled in by plotly.
+# Slider steps use method 'skip'; this handler swaps in typed-array prefixes
+# (subarray views, no copies) of the active level's shared point buffer.
+_SCATTER_POST_SCRIPT = """
+(function() {
+    var gd = document.getElementById('{plot_id}');
+    var payload = __PAYLOAD__;
+    function decode(s) {
+        var bin = atob(s);
+        var bytes = new Uint8Array(bin.length);
+        for (var i = 0; i < bin.length; i++) { bytes[i] = bin.charCodeAt(i); }
+        return new Float32Array(bytes.buffer);
+    }
+    var levels = payload.levels.map(function(lv) {
+        return {x: decode(lv.x), y: decode(lv.y), z: decode(lv.z), v: decode(lv.vals),
+                counts: lv.counts, cmin: lv.cmin, cmax: lv.cmax};
+    });
+    var state = {level: payload.initial_level, step: 0};
+    function render() {
+        var lv = levels[state.level];
+        var n = lv.counts[state.step];
+        Plotly.restyle(gd, {
+            x: [lv.x.subarray(0, n)], y: [lv.y.subarray(0, n)], z: [lv.z.subarray(0, n)],
+            'marker.color': [lv.v.subarray(0, n)], 'marker.cmin': lv.cmin, 'marker.cmax': lv.cmax
+        }, [0]);
+    }
+    gd.on('plotly_sliderchange', function(e) {
+        if (e.slider.name === 'threshold') { state.step = parseInt(e.step.value, 10); }
+        else if (e.slider.name === 'lod') { state.level = parseInt(e.step.value, 10); }
+        render();
+    });
+    render();
+})();
+"""
+
+
+def write_scatter_html(levels, percentiles, output_file, max_points=200000, include_plotlyjs=True):
+    """
+    Write the LOD scatter viewer: one empty Scatter3d trace, a threshold slider
+    and a detail-level slider, with all point data embedded once per level.
+    The initial level is the finest one whose initial point count fits max_points.
+    """
+    import plotly.graph_objects as go
+
+    # Finest level that stays within the point budget at the initial threshold
+    initial_level = len(levels) - 1
+    for i, lv in enumerate(levels):
+        if lv['counts'][0] <= max_points:
+            initial_level = i
+            break
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter3d(
+        x=[], y=[], z=[],
+        mode='markers',
+        marker=dict(
+            size=3,
+            color=[],
+            colorscale='Jet',
+            opacity=0.3,
+            colorbar=dict(title='Intensity')
+        ),
+        name='SAR Data'
+    ))
+
+    threshold_steps = [dict(method='skip', args=[], label=f"{p:.1f}%", value=str(i)) for i, p in enumerate(percentiles)]
+    lod_steps = [dict(method='skip', args=[], label=f"{lv['factor']}x ({lv['counts'][0]} pts)", value=str(i)) for i, lv in enumerate(levels)]
+
+    fig.update_layout(
+        title='3D SAR Reconstruction',
+        scene=dict(
+            xaxis_title='Horizontal (mm)',
+            yaxis_title='Vertical (mm)',
+            zaxis_title='Depth Z (mm)',
+            aspectmode='data' # Preserve aspect ratio
+        ),
+        margin=dict(l=0, r=0, b=0, t=40),
+        sliders=[
+            dict(name='threshold', active=0, currentvalue={"prefix": "Intensity Threshold: "}, pad={"t": 50}, steps=threshold_steps),
+            dict(name='lod', active=initial_level, currentvalue={"prefix": "Voxel Downsampling: "}, pad={"t": 130}, steps=lod_steps),
+        ]
+    )
+
+    payload = {
+        'initial_level': initial_level,
+        'levels': [{
+            'x': _b64_float32(lv['x']),
+            'y': _b64_float32(lv['y']),
+            'z': _b64_float32(lv['z']),
+            'vals': _b64_float32(lv['vals']),
+            'counts': lv['counts'],
+            # Fixed color range per level so colors don't jump between thresholds
+            'cmin': float(lv['vals'][-1]) if len(lv['vals']) else 0.0,
+            'cmax': float(lv['vals'][0]) if len(lv['vals']) else 1.0,
+        } for lv in levels],
+    }
+    post_script = _SCATTER_POST_SCRIPT.replace('__PAYLOAD__', json.dumps(payload))
+    fig.write_html(output_file, include_plotlyjs=include_plotlyjs, post_script=post_script)
+    return initial_level
+
+
+def export_scatter3d(sar_stack, z_values, y_axis, x_axis, output_file, initial_percentile=95.0,
+                     num_steps=20, lod_factors=(1, 2, 4), max_points=200000):
+    """
+    Build LOD point buffers for sar_stack (Z, Y, X) and write the HTML viewer.
+    Returns the list of levels (for logging).
+    """
+    percentiles = np.linspace(initial_percentile, 99.9, num_steps)
+    levels = build_scatter_levels(sar_stack, z_values, y_axis, x_axis, percentiles, lod_factors)
+    for lv in levels:
+        print(f"  LOD {lv['factor']}x: grid {lv['shape']}, {lv['counts'][0]} points > {initial_percentile} percentile")
+    initial_level = write_scatter_html(levels, percentiles, output_file, max_points=max_points)
+    print(f"  Initial detail level: {levels[initial_level]['factor']}x (point budget {max_points})")
+    return levels
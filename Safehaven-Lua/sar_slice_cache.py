@@ -0,0 +1,164 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# On-disk cache of reconstructed magnitude slices.
+#
+# Each slice is stored as <cache_dir>/<key>.npz (slice, x_axis, y_axis, z_mm),
+# where key = sha256(dump content hash, reconstruction config, z). The config
+# holds everything that changes a slice's pixels (algorithm and its
+# parameters, frame counts, FFT sizes, crop/display geometry), so an
+# overlapping sweep such as 300-400 mm followed by 320-340 mm reuses the
+# slices it already has and only reconstructs the missing depths.
+#
+# Files are written atomically and a hit refreshes the file's mtime, so the
+# cache directory can be shared by several processes (batch_process_dumps.py
+# workers). Every instance keeps a running total of the cache size (one scan
+# on the first put, then only its own writes are added); when that exceeds
+# max_bytes, the directory is rescanned (which also picks up other processes'
+# writes) and the least recently used files are deleted down to
+# EVICT_TO_FRACTION of max_bytes, so a full cache is not rescanned on every put.
+
+SLICE_CACHE_VERSION = 1
+EVICT_TO_FRACTION = 0.9
+
+
+def dump_content_hash(folder, hash_cache=None):
+    """
+    SHA-256 over the names and bytes of the dump's scan*.bin files.
+    hash_cache maps folder -> {'stamp': ..., 'hash': ...}; the hash is reused while
+    the file names, sizes and mtimes are unchanged (rehashing GBs of dumps on every
+    rerun would dominate a mostly-finished batch).
+    """
+    files = sorted((name for name in os.listdir(folder) if name.startswith('scan') and name.endswith('.bin')),
+                   key=lambda name: (len(name), name))
+    stamp = []
+    for name in files:
+        st = os.stat(os.path.join(folder, name))
+        stamp.append([name, st.st_size, st.st_mtime_ns])
+    key = os.path.abspath(folder)
+    if hash_cache is not None and hash_cache.get(key, {}).get('stamp') == stamp:
+        return hash_cache[key]['hash']
+
+    h = hashlib.sha256()
+    for name in files:
+        h.update(name.encode('utf-8') + b'\0')
+        with open(os.path.join(folder, name), 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    digest = h.hexdigest()
+    if hash_cache is not None:
+        hash_cache[key] = {'stamp': stamp, 'hash': digest}
+    return digest
+
+
+class SARSliceCache:
+    """
+    Size-capped LRU cache of reconstructed slices on disk.
+    """
+
+    def __init__(self, cache_dir, max_bytes=4 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._total = None # running size estimate, see evict()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(dump_hash, config, z_mm):
+        """Cache key for one slice; config must be JSON-serializable."""
+        blob = json.dumps({'version': SLICE_CACHE_VERSION, 'dump': dump_hash,
+                           'config': config, 'z_mm': float(z_mm)}, sort_keys=True)
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def get(self, key):
+        """Return (slice, x_axis, y_axis) or None."""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                result = (data['slice'], data['x_axis'], data['y_axis'])
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            # Missing, evicted by another process, or a corrupt file
+            self.misses += 1
+            return None
+        try:
+            os.utime(path) # mark as recently used
+        except OSError:
+            pass
+        self.hits += 1
+        return result
+
+    def put(self, key, z_mm, sar_slice, x_axis, y_axis):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, slice=sar_slice, x_axis=x_axis, y_axis=y_axis, z_mm=float(z_mm))
+        if self._total is None:
+            self._total = self.size_bytes()
+        try:
+            self._total -= os.path.getsize(path) # overwritten entry
+        except OSError:
+            pass
+        self._total += os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        if self._total > self.max_bytes:
+            self.evict()
+
+    def size_bytes(self):
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, path, st.st_size))
+        return entries
+
+    def evict(self):
+        """
+        Rescan the cache and, if it exceeds max_bytes, delete least recently used
+        slices until it fits in EVICT_TO_FRACTION of max_bytes.
+        """
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+        removed = 0
+        if total > self.max_bytes:
+            for _, path, size in sorted(entries):
+                if total <= self.max_bytes * EVICT_TO_FRACTION:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        self._total = total
+        return removed
+
+    def iter_slices(self, dump_hash, config, z_values, compute_fn):
+        """
+        Yield (z_mm, slice, x_axis, y_axis) for z_values in order, reading hits from
+        the cache and calling compute_fn([z_mm]) (an iterator of the same tuples)
+        for misses, which are then stored.
+        """
+        for z_mm in z_values:
+            key = self.key(dump_hash, config, z_mm)
+            cached = self.get(key)
+            if cached is not None:
+                print(f"Z = {z_mm} mm: cached")
+                yield (z_mm,) + cached
+                continue
+            for z_out, sar_slice, x_axis, y_axis in compute_fn([z_mm]):
+                self.put(key, z_out, sar_slice, x_axis, y_axis)
+                yield z_out, sar_slice, x_axis, y_axis
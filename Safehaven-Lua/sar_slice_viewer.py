@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import numpy as np
+
+# Compact replacement for the frame-embedded Plotly slice viewer (--plotly).
+#
+# Output directory layout:
+#   index.html              static viewer (no external dependencies)
+#   manifest.json           shape, dtype, Z values, axes extents, per-slice scales
+#   slices/slice_00000.bin  raw little-endian uint8/uint16 slice (Y*X values)
+#   ...
+#
+# Each slice is quantized against its own max: value ~= q * scale[i].
+# The page fetches a slice only when the slider reaches it, so opening a
+# 500-slice export costs one small manifest request.
+# Browsers block fetch() on file:// URLs; use serve_slice_viewer() (or
+# `python -m http.server -d <dir>`) to view it.
+
+_VIEWER_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>SAR Slice Viewer</title>
+<style>
+  body { font-family: sans-serif; margin: 16px; background: #fafafa; }
+  #wrap { display: flex; align-items: flex-start; gap: 12px; }
+  canvas#img { image-rendering: pixelated; border: 1px solid #888; }
+  canvas#bar { border: 1px solid #888; }
+  #controls { margin-top: 10px; }
+  #slider { width: 600px; }
+  .muted { color: #666; font-size: 0.9em; }
+</style>
+</head>
+<body>
+<h3 id="title">SAR Reconstruction</h3>
+<div id="wrap">
+  <div>
+    <canvas id="img"></canvas>
+    <div class="muted" id="extent"></div>
+  </div>
+  <div>
+    <canvas id="bar" width="20" height="256"></canvas>
+    <div class="muted" id="barmax"></div>
+  </div>
+</div>
+<div id="controls">
+  Depth Z: <input type="range" id="slider" min="0" max="0" value="0"> <span id="zlabel"></span> mm
+  <label><input type="checkbox" id="perslice"> Normalize per slice</label>
+</div>
+<div class="muted" id="hover">&nbsp;</div>
+<script>
+(function() {
+  var manifest = null;
+  var cache = new Map();      // slice index -> typed array (LRU order)
+  var CACHE_LIMIT = 64;
+  var pending = {};
+  var current = 0;
+
+  // Jet colormap lookup table (256 RGB entries)
+  var lut = new Uint8Array(256 * 3);
+  for (var i = 0; i < 256; i++) {
+    var v = i / 255;
+    var r = Math.min(Math.max(1.5 - Math.abs(4 * v - 3), 0), 1);
+    var g = Math.min(Math.max(1.5 - Math.abs(4 * v - 2), 0), 1);
+    var b = Math.min(Math.max(1.5 - Math.abs(4 * v - 1), 0), 1);
+    lut[3 * i] = Math.round(255 * r); lut[3 * i + 1] = Math.round(255 * g); lut[3 * i + 2] = Math.round(255 * b);
+  }
+
+  var canvas = document.getElementById('img');
+  var ctx = canvas.getContext('2d');
+  var slider = document.getElementById('slider');
+  var perslice = document.getElementById('perslice');
+
+  function fileName(i) { return 'slices/slice_' + String(i).padStart(5, '0') + '.bin'; }
+
+  function load(i) {
+    if (cache.has(i)) {
+      var hit = cache.get(i); cache.delete(i); cache.set(i, hit);
+      return Promise.resolve(hit);
+    }
+    if (pending[i]) { return pending[i]; }
+    pending[i] = fetch(fileName(i)).then(function(resp) {
+      if (!resp.ok) { throw new Error('HTTP ' + resp.status + ' for ' + fileName(i)); }
+      return resp.arrayBuffer();
+    }).then(function(buf) {
+      var arr = manifest.dtype === 'uint16' ? new Uint16Array(buf) : new Uint8Array(buf);
+      cache.set(i, arr);
+      if (cache.size > CACHE_LIMIT) { cache.delete(cache.keys().next().value); }
+      delete pending[i];
+      return arr;
+    });
+    return pending[i];
+  }
+
+  function draw(i, q) {
+    var nx = manifest.shape[2], ny = manifest.shape[1];
+    var img = ctx.createImageData(nx, ny);
+    // Map quantized values to LUT indices: global max keeps slices comparable
+    var ref = perslice.checked ? manifest.slice_max[i] : manifest.global_max;
+    var k = ref > 0 ? 255 * manifest.scales[i] / ref : 0;
+    for (var y = 0; y < ny; y++) {
+      // Row 0 is the lowest Y: flip so Y increases upwards (like pcolormesh)
+      var src = (ny - 1 - y) * nx, dst = y * nx * 4;
+      for (var x = 0; x < nx; x++) {
+        var li = Math.min(255, Math.round(q[src + x] * k)) * 3;
+        img.data[dst] = lut[li]; img.data[dst + 1] = lut[li + 1]; img.data[dst + 2] = lut[li + 2]; img.data[dst + 3] = 255;
+        dst += 4;
+      }
+    }
+    ctx.putImageData(img, 0, 0);
+    document.getElementById('zlabel').textContent = manifest.z_values[i];
+    document.getElementById('title').textContent = 'SAR Reconstruction (Z=' + manifest.z_values[i] + 'mm)';
+    document.getElementById('barmax').textContent = (perslice.checked ? manifest.slice_max[i] : manifest.global_max).toExponential(3);
+  }
+
+  function show(i) {
+    current = i;
+    load(i).then(function(q) { if (current === i) { draw(i, q); } });
+    // Prefetch neighbours so scrubbing stays smooth
+    [i - 1, i + 1].forEach(function(j) { if (j >= 0 && j < manifest.z_values.length) { load(j); } });
+  }
+
+  fetch('manifest.json').then(function(r) { return r.json(); }).then(function(m) {
+    manifest = m;
+    var ny = m.shape[1], nx = m.shape[2];
+    canvas.width = nx; canvas.height = ny;
+    // Display with the physical aspect ratio of the X/Y extents
+    var w = 800, xext = m.x_range[1] - m.x_range[0], yext = m.y_range[1] - m.y_range[0];
+    canvas.style.width = w + 'px';
+    canvas.style.height = Math.round(w * (yext > 0 && xext > 0 ? yext / xext : ny / nx)) + 'px';
+    document.getElementById('extent').textContent =
+      'X ' + m.x_range[0].toFixed(1) + ' .. ' + m.x_range[1].toFixed(1) + ' mm, Y ' +
+      m.y_range[0].toFixed(1) + ' .. ' + m.y_range[1].toFixed(1) + ' mm';
+    var bar = document.getElementById('bar').getContext('2d');
+    for (var i = 0; i < 256; i++) {
+      bar.fillStyle = 'rgb(' + lut[3 * i] + ',' + lut[3 * i + 1] + ',' + lut[3 * i + 2] + ')';
+      bar.fillRect(0, 255 - i, 20, 1);
+    }
+    slider.max = m.z_values.length - 1;
+    slider.value = Math.floor(m.z_values.length / 2);
+    show(parseInt(slider.value, 10));
+  }).catch(function(err) {
+    document.getElementById('title').textContent =
+      'Could not load slices (' + err + '). Serve this folder over HTTP, e.g. python -m http.server';
+  });
+
+  slider.addEventListener('input', function() { show(parseInt(slider.value, 10)); });
+  perslice.addEventListener('change', function() { show(current); });
+
+  canvas.addEventListener('mousemove', function(e) {
+    if (!manifest || !cache.has(current)) { return; }
+    var nx = manifest.shape[2], ny = manifest.shape[1];
+    var rect = canvas.getBoundingClientRect();
+    var px = Math.floor((e.clientX - rect.left) / rect.width * nx);
+    var py = ny - 1 - Math.floor((e.clientY - rect.top) / rect.height * ny);
+    if (px < 0 || px >= nx || py < 0 || py >= ny) { return; }
+    var xm = manifest.x_range[0] + (manifest.x_range[1] - manifest.x_range[0]) * px / Math.max(nx - 1, 1);
+    var ym = manifest.y_range[0] + (manifest.y_range[1] - manifest.y_range[0]) * py / Math.max(ny - 1, 1);
+    var val = cache.get(current)[py * nx + px] * manifest.scales[current];
+    document.getElementById('hover').textContent =
+      'x=' + xm.toFixed(1) + ' mm, y=' + ym.toFixed(1) + ' mm, intensity=' + val.toExponential(3);
+  });
+})();
+</script>
+</body>
+</html>
+"""
+
+
+def export_slice_viewer(sar_stack, z_values, x_axis, y_axis, out_dir, bits=8):
+    """
+    Write sar_stack (Z, Y, X) as quantized per-slice binary blobs plus a static
+    HTML/JS viewer into out_dir. Slices are read one at a time, so a memmapped
+    stack or a SARVolume works without loading the whole volume.
+    Returns the path to index.html.
+    """
+    if bits not in (8, 16):
+        raise ValueError(f"bits must be 8 or 16, got {bits}")
+    q_dtype = np.dtype('<u1') if bits == 8 else np.dtype('<u2')
+    q_max = 255 if bits == 8 else 65535
+
+    slice_dir = os.path.join(out_dir, 'slices')
+    os.makedirs(slice_dir, exist_ok=True)
+
+    scales = []
+    slice_maxes = []
+    n_slices = len(z_values)
+    slice_shape = None
+    for i in range(n_slices):
+        sar_slice = np.asarray(sar_stack[i], dtype=np.float32)
+        slice_shape = sar_slice.shape
+        slice_max = float(np.max(sar_slice))
+        # value ~= q * scale, with q in [0, q_max]
+        scale = slice_max / q_max if slice_max > 0 else 0.0
+        if scale > 0:
+            q = np.rint(sar_slice / scale)
+        else:
+            q = np.zeros_like(sar_slice)
+        np.clip(q, 0, q_max, out=q)
+        q.astype(q_dtype).tofile(os.path.join(slice_dir, f"slice_{i:05d}.bin"))
+        scales.append(scale)
+        slice_maxes.append(slice_max)
+
+    # Slices left over from an earlier, longer export into the same directory
+    written = {f"slice_{i:05d}.bin" for i in range(n_slices)}
+    for name in os.listdir(slice_dir):
+        if name.startswith('slice_') and name.endswith('.bin') and name not in written:
+            os.remove(os.path.join(slice_dir, name))
+
+    manifest = {
+        'shape': [n_slices] + list(slice_shape or (0, 0)),
+        'dtype': 'uint8' if bits == 8 else 'uint16',
+        'z_values': [float(z) for z in z_values],
+        'x_range': [float(np.min(x_axis)), float(np.max(x_axis))],
+        'y_range': [float(np.min(y_axis)), float(np.max(y_axis))],
+        'scales': scales,
+        'slice_max': slice_maxes,
+        'global_max': max(slice_maxes) if slice_maxes else 0.0,
+    }
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+
+    index_path = os.path.join(out_dir, 'index.html')
+    with open(index_path, 'w', encoding='utf-8') as f:
+        f.write(_VIEWER_HTML)
+    return index_path
+
+
+def serve_slice_viewer(out_dir, port=0, open_browser=True, background=False):
+    """
+    Serve an exported viewer over http://localhost (needed for fetch()) until
+    Ctrl+C. port=0 picks a free port. With background=True the server runs on
+    a daemon thread and is returned right away; pass it to
+    wait_for_slice_viewer() once everything else is done.
+    """
+    import functools
+    import http.server
+    import threading
+    import webbrowser
+
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        # Silence per-request logging; slices are fetched on every slider move
+        def log_message(self, format, *args):
+            pass
+
+    handler = functools.partial(QuietHandler, directory=out_dir)
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', port), handler)
+    url = f"http://127.0.0.1:{httpd.server_address[1]}/index.html"
+    print(f"Serving slice viewer at {url}" + ("" if background else " (Ctrl+C to stop)"))
+    if open_browser:
+        try:
+            webbrowser.open(url)
+        except Exception:
+            pass
+    if background:
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        return httpd
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped slice viewer server.")
+    finally:
+        httpd.server_close()
+
+
+def wait_for_slice_viewer(httpd):
+    """Keep a background viewer server (serve_slice_viewer(..., background=True)) alive until Ctrl+C."""
+    if httpd is None:
+        return
+    url = f"http://127.0.0.1:{httpd.server_address[1]}/index.html"
+    print(f"Still serving slice viewer at {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        print("Stopped slice viewer server.")
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
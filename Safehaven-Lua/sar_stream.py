@@ -0,0 +1,178 @@
+import os
+import numpy as np
+
+
+class SARStreamSink:
+    """
+    Streaming accumulator for the Z-sweep in mainSARneuronauts2py_rev3_2.py.
+
+    Every reconstructed magnitude slice (Y, X) is pushed through add_slice() as
+    soon as it is produced. The sink keeps the three Maximum Intensity
+    Projections, the global min/max and an intensity histogram up to date, so
+    main() no longer needs the whole (Z, Y, X) volume in RAM to build them.
+
+    If spill_dir is given, slices are appended to a raw file on disk instead of
+    being kept in a list; volume() then returns a read-only np.memmap over that
+    file, which keeps long sweeps at constant memory.
+    """
+
+    def __init__(self, spill_dir=None, spill_dtype=np.float64, hist_bins=256):
+        # Z values (mm) of the slices that were actually added, in sweep order
+        self.z_values = []
+
+        # Slice geometry, fixed by the first slice
+        self.slice_shape = None
+
+        # Maximum Intensity Projections
+        self.mip_xy = None   # (Y, X): max over Z, updated in place
+        self._xz_rows = []   # one (X,) row per slice: max over Y
+        self._yz_rows = []   # one (Y,) row per slice: max over X
+
+        # Global statistics
+        self.global_max = -np.inf
+        self.global_min = np.inf
+
+        # Histogram over [0, hist_range). The range doubles (merging bin pairs)
+        # whenever a slice exceeds it, so counts stay exact without knowing the
+        # final global max up front. hist_bins must be even for the merge step.
+        if hist_bins < 2 or hist_bins % 2 != 0:
+            raise ValueError(f"hist_bins must be an even number >= 2, got {hist_bins}")
+        self.hist_bins = hist_bins
+        self.hist_counts = np.zeros(hist_bins, dtype=np.int64)
+        self.hist_range = None
+
+        # Slice storage: either an in-memory list or an append-only spill file
+        self.spill_dtype = np.dtype(spill_dtype)
+        self.spill_path = None
+        self._spill_file = None
+        self._slices = []
+        self._volume = None
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self.spill_path = os.path.join(spill_dir, 'sar_stack.raw')
+            self._spill_file = open(self.spill_path, 'wb')
+
+    def __len__(self):
+        return len(self.z_values)
+
+    def add_slice(self, z_mm, sar_slice):
+        """
+        Consume one magnitude slice of shape (Y, X) reconstructed at depth z_mm.
+        """
+        sar_slice = np.asarray(sar_slice)
+        if self.slice_shape is None:
+            self.slice_shape = sar_slice.shape
+            self.mip_xy = sar_slice.astype(np.float64, copy=True)
+        else:
+            if sar_slice.shape != self.slice_shape:
+                raise ValueError(f"Slice at Z={z_mm} has shape {sar_slice.shape}, expected {self.slice_shape}")
+            np.maximum(self.mip_xy, sar_slice, out=self.mip_xy)
+
+        # Per-slice projections become one row of the X-Z / Y-Z images
+        self._xz_rows.append(np.max(sar_slice, axis=0))
+        self._yz_rows.append(np.max(sar_slice, axis=1))
+
+        # Global statistics
+        slice_max = float(np.max(sar_slice))
+        self.global_max = max(self.global_max, slice_max)
+        self.global_min = min(self.global_min, float(np.min(sar_slice)))
+        self._update_histogram(sar_slice, slice_max)
+
+        # Keep or spill the slice
+        if self._spill_file is not None:
+            self._spill_file.write(np.ascontiguousarray(sar_slice, dtype=self.spill_dtype).tobytes())
+        else:
+            self._slices.append(sar_slice)
+
+        self.z_values.append(z_mm)
+
+    def _update_histogram(self, sar_slice, slice_max):
+        """
+        Add a slice to the running histogram, growing the range as needed.
+        """
+        if self.hist_range is None:
+            # First slice: start with a range just above its max
+            self.hist_range = slice_max if slice_max > 0 else 1.0
+            self.hist_range *= 1.0 + 1e-9
+
+        # Double the range until the new slice fits, merging adjacent bin pairs
+        half = self.hist_bins // 2
+        while slice_max >= self.hist_range:
+            merged = self.hist_counts.reshape(half, 2).sum(axis=1)
+            self.hist_counts = np.concatenate([merged, np.zeros(half, dtype=np.int64)])
+            self.hist_range *= 2.0
+
+        counts, _ = np.histogram(sar_slice, bins=self.hist_bins, range=(0.0, self.hist_range))
+        self.hist_counts += counts
+
+    @property
+    def mip_xz(self):
+        """Maximum Intensity Projection over Y, shape (Z, X)."""
+        return np.array(self._xz_rows)
+
+    @property
+    def mip_yz(self):
+        """Maximum Intensity Projection over X, shape (Z, Y)."""
+        return np.array(self._yz_rows)
+
+    def histogram(self):
+        """
+        Return (counts, bin_edges) of every voxel seen so far.
+        """
+        if self.hist_range is None:
+            return self.hist_counts.copy(), np.linspace(0.0, 1.0, self.hist_bins + 1)
+        return self.hist_counts.copy(), np.linspace(0.0, self.hist_range, self.hist_bins + 1)
+
+    def percentile(self, q):
+        """
+        Approximate percentile (0-100) of all voxels from the running histogram.
+        Accuracy is one histogram bin.
+        """
+        counts, edges = self.histogram()
+        total = counts.sum()
+        if total == 0:
+            return 0.0
+        cdf = np.cumsum(counts) / total
+        idx = int(np.searchsorted(cdf, q / 100.0))
+        idx = min(idx, len(counts) - 1)
+        return float(edges[idx + 1])
+
+    def close(self):
+        """
+        Flush and close the spill file (if any). Safe to call more than once.
+        """
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def volume(self):
+        """
+        Return the full (Z, Y, X) stack.
+
+        In spill mode this is a read-only np.memmap, so callers that only touch
+        one slice at a time (dump, slice viewers) never page in the whole volume.
+        """
+        if self.spill_path is not None:
+            self.close()
+            if not self.z_values:
+                return np.zeros((0, 0, 0), dtype=self.spill_dtype)
+            shape = (len(self.z_values),) + tuple(self.slice_shape)
+            return np.memmap(self.spill_path, dtype=self.spill_dtype, mode='r', shape=shape)
+        if not self._slices:
+            return np.zeros((0, 0, 0))
+        if self._volume is None or len(self._volume) != len(self._slices):
+            self._volume = self._stack_slices()
+        return self._volume
+
+    def _stack_slices(self):
+        """
+        Copy the kept slices into one (Z, Y, X) array. Each list entry is
+        replaced by a view into that array right after its copy, which frees
+        the original slice; as np.empty pages are only committed on write,
+        the peak stays about one volume instead of two.
+        """
+        stack = np.empty((len(self._slices),) + tuple(self.slice_shape), dtype=np.result_type(*self._slices))
+        for i, sar_slice in enumerate(self._slices):
+            stack[i] = sar_slice
+            self._slices[i] = stack[i]
+        return stack
@@ -0,0 +1,111 @@
+import os
+import re
+import json
+import numpy as np
+
+# Training tensor store: reconstructed slices go straight into the 100x100
+# reflectivity tensors used by the weapon classifier
+# (Safehaven-Classification/weapon_classifier.py), skipping the 8-bit PNG
+# dump and the per-epoch cv2 decode.
+#
+# Store layout (a directory, one shard per exported dump/run):
+#   <name>.npy    float32/float16 array (N, 100, 100), rho in [0, 1]
+#   <name>.json   {'label', 'dtype', 'shape', 'provenance': {...},
+#                  'z_values': [...]}   one z per tensor row
+#
+# Shards are written atomically and independently, so parallel
+# batch_process_dumps.py workers can export into the same store. Re-exporting
+# a dump under the same name replaces its shard.
+#
+# The tensor of a slice matches what generate_reflectivity_image() computes
+# from its --sar_dump PNG, minus the 8-bit quantization: the PNG holds the
+# slice min-max stretched to 0-255 (plt.imsave autoscale), rho = I / I_max,
+# then cv2.resize(INTER_LINEAR) to 100x100.
+
+TENSOR_SIZE = (100, 100)
+TENSOR_DTYPES = ('float32', 'float16')
+
+
+def reflectivity_tensor(sar_slice, target_size=TENSOR_SIZE):
+    """
+    Float reflectivity image of one magnitude slice: min-max normalized to [0, 1]
+    and resized to target_size (width, height) like generate_reflectivity_image().
+    """
+    import cv2
+    sar_slice = np.asarray(sar_slice, dtype=np.float32)
+    s_min = float(sar_slice.min())
+    span = float(sar_slice.max()) - s_min
+    if span > 0:
+        rho = (sar_slice - s_min) / span
+    else:
+        # Constant slice: the PNG path gives an all-black image
+        rho = np.zeros_like(sar_slice)
+    return cv2.resize(rho, target_size, interpolation=cv2.INTER_LINEAR)
+
+
+def shard_name(text):
+    """File-system safe shard name."""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', str(text)).strip('_') or 'shard'
+
+
+class SARTensorShardWriter:
+    """
+    Collects reflectivity tensors of one dump/run and writes them as a shard of
+    a tensor store on close().
+    """
+
+    def __init__(self, store_dir, name, label, provenance=None, dtype='float32', target_size=TENSOR_SIZE):
+        if dtype not in TENSOR_DTYPES:
+            raise ValueError(f"Unknown tensor dtype: {dtype} (choose from {TENSOR_DTYPES})")
+        if not label:
+            raise ValueError("A class label is required for a training tensor shard")
+        self.store_dir = store_dir
+        self.name = shard_name(name)
+        self.label = str(label)
+        self.provenance = dict(provenance or {})
+        self.dtype = dtype
+        self.target_size = tuple(target_size)
+        self.z_values = []
+        self._tensors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Don't publish a partial shard if the sweep failed
+        if exc_type is None:
+            self.close()
+
+    def add_slice(self, z_mm, sar_slice):
+        self._tensors.append(reflectivity_tensor(sar_slice, self.target_size).astype(self.dtype))
+        self.z_values.append(float(z_mm))
+
+    def close(self):
+        """Write <name>.npy and <name>.json. Returns the .npy path."""
+        os.makedirs(self.store_dir, exist_ok=True)
+        width, height = self.target_size
+        if self._tensors:
+            tensors = np.stack(self._tensors)
+        else:
+            tensors = np.zeros((0, height, width), dtype=self.dtype)
+        npy_path = os.path.join(self.store_dir, self.name + '.npy')
+        json_path = os.path.join(self.store_dir, self.name + '.json')
+
+        tmp_npy = npy_path + '.tmp'
+        with open(tmp_npy, 'wb') as f:
+            np.save(f, tensors)
+        meta = {
+            'label': self.label,
+            'dtype': self.dtype,
+            'shape': list(tensors.shape),
+            'provenance': self.provenance,
+            'z_values': self.z_values,
+        }
+        tmp_json = json_path + '.tmp'
+        with open(tmp_json, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        # Data first: a shard is only listed once its .json exists
+        os.replace(tmp_npy, npy_path)
+        os.replace(tmp_json, json_path)
+        return npy_path
+
@@ -0,0 +1,272 @@
+import os
+import json
+import glob
+import numpy as np
+
+# On-disk layout of a SAR volume store (a directory, conventionally *.sarvol):
+#
+#   meta.json          axes, dtype, shape, chunk table and free-form attrs
+#   chunk_00000.npy    slices [0, chunk_depth)            shape (n, Y, X)
+#   chunk_00001.npy    slices [chunk_depth, 2*chunk_depth)
+#   ...
+#
+# Chunks are plain .npy files so they can be opened with np.load(mmap_mode='r')
+# and only the slices/rows that are actually indexed get paged in.
+# float16 chunks store slice / scale (scale = chunk max) because SAR magnitudes
+# are far above the float16 range (~65504); the reader multiplies it back.
+
+VOLUME_FORMAT = 'sarvol'
+VOLUME_VERSION = 1
+META_FILE = 'meta.json'
+
+
+class SARVolumeWriter:
+    """
+    Incrementally writes Z-slices (Y, X) into a chunked SAR volume store.
+
+    Slices are buffered until chunk_depth of them are available, then written as
+    one .npy chunk and meta.json is rewritten. An interrupted sweep therefore
+    leaves a readable store holding every completed chunk.
+    """
+
+    def __init__(self, path, dtype='float32', chunk_depth=16, attrs=None, overwrite=False):
+        if dtype not in ('float32', 'float16'):
+            raise ValueError(f"Unsupported volume dtype: {dtype} (use 'float32' or 'float16')")
+        if chunk_depth < 1:
+            raise ValueError(f"chunk_depth must be >= 1, got {chunk_depth}")
+
+        self.path = path
+        self.dtype = dtype
+        self.chunk_depth = chunk_depth
+        self.attrs = dict(attrs or {})
+
+        # Refuse to silently mix chunks from two different sweeps
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            if not overwrite:
+                raise FileExistsError(f"SAR volume store already exists: {path}")
+            for old_chunk in glob.glob(os.path.join(path, 'chunk_*.npy')):
+                os.remove(old_chunk)
+            os.remove(meta_path)
+        os.makedirs(path, exist_ok=True)
+
+        self.z_values = []
+        self.x_axis = None
+        self.y_axis = None
+        self.slice_shape = None
+        self.chunks = []
+        self._buffer = []
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add_slice(self, z_mm, sar_slice, x_axis=None, y_axis=None):
+        """
+        Append one magnitude slice reconstructed at depth z_mm.
+        Axes only need to be passed once (they are constant across Z).
+        """
+        if self._closed:
+            raise RuntimeError("Cannot add slices to a closed SARVolumeWriter")
+        sar_slice = np.asarray(sar_slice)
+        if self.slice_shape is None:
+            self.slice_shape = sar_slice.shape
+        elif sar_slice.shape != self.slice_shape:
+            raise ValueError(f"Slice at Z={z_mm} has shape {sar_slice.shape}, expected {self.slice_shape}")
+
+        if self.x_axis is None and x_axis is not None:
+            self.x_axis = [float(v) for v in x_axis]
+        if self.y_axis is None and y_axis is not None:
+            self.y_axis = [float(v) for v in y_axis]
+
+        self._buffer.append(sar_slice)
+        self.z_values.append(float(z_mm))
+        if len(self._buffer) >= self.chunk_depth:
+            self._flush()
+
+    def _flush(self):
+        """
+        Write buffered slices as the next chunk and refresh meta.json.
+        """
+        if not self._buffer:
+            return
+        block = np.stack(self._buffer).astype(np.float32)
+        scale = 1.0
+        if self.dtype == 'float16':
+            # Normalize to [0, 1] so the block fits float16's range
+            block_max = float(np.max(block))
+            scale = block_max if block_max > 0 else 1.0
+            block = (block / scale).astype(np.float16)
+
+        chunk_idx = len(self.chunks)
+        chunk_file = f"chunk_{chunk_idx:05d}.npy"
+        np.save(os.path.join(self.path, chunk_file), block)
+
+        start = sum(c['count'] for c in self.chunks)
+        self.chunks.append({'file': chunk_file, 'start': start, 'count': len(self._buffer), 'scale': scale})
+        self._buffer = []
+        self._write_meta(complete=False)
+
+    def _write_meta(self, complete):
+        """
+        Atomically (write + rename) update meta.json.
+        """
+        n_written = sum(c['count'] for c in self.chunks)
+        shape = [n_written] + list(self.slice_shape or (0, 0))
+        meta = {
+            'format': VOLUME_FORMAT,
+            'version': VOLUME_VERSION,
+            'dtype': self.dtype,
+            'shape': shape,
+            'chunk_depth': self.chunk_depth,
+            'z_values': self.z_values[:n_written],
+            'x_axis': self.x_axis,
+            'y_axis': self.y_axis,
+            'chunks': self.chunks,
+            'attrs': self.attrs,
+            'complete': complete,
+        }
+        tmp_path = os.path.join(self.path, META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+
+    def close(self):
+        """
+        Flush the last partial chunk and mark the store complete.
+        """
+        if self._closed:
+            return
+        self._flush()
+        self._write_meta(complete=True)
+        self._closed = True
+
+
+class SARVolume:
+    """
+    Lazy reader for a SAR volume store written by SARVolumeWriter.
+
+    Indexing mirrors a (Z, Y, X) numpy array:
+        vol[i]                 -> one slice (Y, X)
+        vol[a:b]               -> block (n, Y, X)
+        vol[a:b, y0:y1, x0:x1] -> sub-block; only the touched rows are read
+    Values are always returned as float32 (float16 stores are rescaled).
+    """
+
+    def __init__(self, path):
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"Not a SAR volume store (missing {META_FILE}): {path}")
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta.get('format') != VOLUME_FORMAT:
+            raise ValueError(f"Unknown volume format in {meta_path}: {meta.get('format')}")
+
+        self.path = path
+        self.meta = meta
+        self.dtype = meta['dtype']
+        self.shape = tuple(meta['shape'])
+        self.chunk_depth = meta['chunk_depth']
+        self.chunks = meta['chunks']
+        self.attrs = meta.get('attrs', {})
+        self.complete = meta.get('complete', False)
+        self.z_values = np.array(meta['z_values'], dtype=np.float64)
+        self.x_axis = np.array(meta['x_axis']) if meta['x_axis'] is not None else None
+        self.y_axis = np.array(meta['y_axis']) if meta['y_axis'] is not None else None
+
+        # Chunk index -> memmapped array, opened on first access
+        self._open_chunks = {}
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def z_step(self):
+        """Median spacing between stored Z slices (mm), or None for a single slice."""
+        if len(self.z_values) < 2:
+            return None
+        return float(np.median(np.diff(self.z_values)))
+
+    def _chunk(self, chunk_idx):
+        if chunk_idx not in self._open_chunks:
+            chunk_path = os.path.join(self.path, self.chunks[chunk_idx]['file'])
+            self._open_chunks[chunk_idx] = np.load(chunk_path, mmap_mode='r')
+        return self._open_chunks[chunk_idx]
+
+    def _read(self, z_start, z_stop, y_key=slice(None), x_key=slice(None)):
+        """
+        Read slices [z_start, z_stop) restricted to (y_key, x_key), touching only
+        the chunks that overlap the requested Z range.
+        """
+        parts = []
+        for chunk_idx, chunk in enumerate(self.chunks):
+            c_start = chunk['start']
+            c_stop = c_start + chunk['count']
+            lo = max(z_start, c_start)
+            hi = min(z_stop, c_stop)
+            if lo >= hi:
+                continue
+            data = self._chunk(chunk_idx)[lo - c_start:hi - c_start, y_key, x_key]
+            data = np.asarray(data, dtype=np.float32)
+            if chunk['scale'] != 1.0:
+                data = data * np.float32(chunk['scale'])
+            parts.append(data)
+        if not parts:
+            return np.zeros((0,) + self.shape[1:], dtype=np.float32)[:, y_key, x_key]
+        return parts[0] if len(parts) == 1 else np.concatenate(parts, axis=0)
+
+    def get_slice(self, idx):
+        """Load a single Z slice (Y, X) by index."""
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Slice index {idx} out of range for {len(self)} slices")
+        return self._read(idx, idx + 1)[0]
+
+    def index_of(self, z_mm):
+        """Index of the stored slice nearest to depth z_mm."""
+        return int(np.argmin(np.abs(self.z_values - z_mm)))
+
+    def slice_at(self, z_mm):
+        """Load the slice nearest to depth z_mm."""
+        return self.get_slice(self.index_of(z_mm))
+
+    def block(self, z_start=0, z_stop=None, y_key=slice(None), x_key=slice(None)):
+        """Load a (z, y, x) sub-block."""
+        z_stop = len(self) if z_stop is None else min(z_stop, len(self))
+        return self._read(z_start, z_stop, y_key, x_key)
+
+    def __getitem__(self, key):
+        rest = ()
+        if isinstance(key, tuple):
+            key, rest = key[0], key[1:]
+        y_key = rest[0] if len(rest) > 0 else slice(None)
+        x_key = rest[1] if len(rest) > 1 else slice(None)
+
+        if isinstance(key, (int, np.integer)):
+            return self.get_slice(int(key))[y_key, x_key]
+        if isinstance(key, slice):
+            z_indices = range(*key.indices(len(self)))
+            if len(z_indices) == 0:
+                return self._read(0, 0, y_key, x_key)
+            # Read the covering range once, then pick the (possibly strided) slices
+            lo, hi = min(z_indices), max(z_indices) + 1
+            data = self._read(lo, hi, y_key, x_key)
+            if key.step in (None, 1):
+                return data
+            return data[[i - lo for i in z_indices]]
+        raise TypeError(f"Unsupported SARVolume index: {key!r}")
+
+    def iter_slices(self):
+        """
+        Yield (z_mm, slice, x_axis, y_axis) one slice at a time, matching
+        iter_sar_slices() in mainSARneuronauts2py_rev3_2.py.
+        """
+        for chunk_idx, chunk in enumerate(self.chunks):
+            block = self._read(chunk['start'], chunk['start'] + chunk['count'])
+            for i in range(chunk['count']):
+                z_idx = chunk['start'] + i
+                yield float(self.z_values[z_idx]), block[i], self.x_axis, self.y_axis
@@ -1,4 +1,7 @@
 import cmath
+import os
+import re
+import time
 
 import numpy as np
 
@@ -11,9 +14,20 @@ def readDCA1000(
     numADCBits: int = 16,
     isReal: bool = True,
     trim_to_windows: bool = False,
+    follow_parts: bool = True,
+    interleaved: bool = False,
 ) -> np.ndarray:
     """
-    Extract ADC data from a DCA1000 binary file
+    Extract ADC data from a DCA1000 binary file. Split captures (_Raw_0.bin,
+    _Raw_1.bin, ...) are read as one; see iterDCA1000 for constant-memory
+    chunked reading of long captures.
+
+    By default window r is the r-th contiguous block of the file. With
+    interleaved, every numberOfWindows (real) or 2 * numberOfWindows (complex:
+    I lanes, then Q lanes) consecutive values are one sample of every window
+    instead, the layout of TI's MATLAB readDCA1000 (column-major reshape); that
+    layout can be read while the capture is still being written, see
+    followDCA1000.
 
     Args:
         filename (str):        Path to .bin file
@@ -21,12 +35,18 @@ def readDCA1000(
         numADCBits (int):      ADC bit resolution (default 16)
         isReal (bool):         True for real-only data, False for complex data
         trim_to_windows (bool):  True to trim data length to be divisible by numberOfWindows
+        follow_parts (bool):   Continue into the _Raw_1, _Raw_2, ... parts of a split capture
+        interleaved (bool):    Sample-interleaved instead of block layout (see above)
 
     Returns:
         adcData (np.ndarray): Numpy array of converted ADC data
     """
-    # Read binary file
-    adcData = np.fromfile(filename, dtype="int16")
+    # Read binary file (all parts of a split capture)
+    parts = dca1000Parts(filename) if follow_parts else [filename]
+    if len(parts) == 1:
+        adcData = np.fromfile(filename, dtype="int16")
+    else:
+        adcData = np.concatenate([np.fromfile(part, dtype="int16") for part in parts])
 
     # If not a 16 bit ADC, then the data is unsigned: need to convert to signed to correct the data
     if numADCBits != 16:
@@ -38,14 +58,209 @@ def readDCA1000(
         new_len = len(adcData) - len(adcData) % numberOfWindows
         adcData = adcData[:new_len]
 
+    rows = numberOfWindows if isReal else numberOfWindows * 2
+    if interleaved:
+        adcData = adcData.reshape(-1, rows).T
+    else:
+        adcData = adcData.reshape(rows, -1)
     # Only real data in the file
     if isReal:
-        adcData = adcData.reshape(numberOfWindows, -1)
+        return adcData
     # Combine the real and imaginary parts of the complex data (first four lanes are real, last four are imaginary) using I + jQ
-    else:
-        adcData = adcData.reshape(numberOfWindows * 2, -1)
-        adcData = adcData[[0, 1, 2, 3], :] + cmath.sqrt(-1) * adcData[[4, 5, 6, 7], :]
-    return adcData
+    return adcData[[0, 1, 2, 3], :] + cmath.sqrt(-1) * adcData[[4, 5, 6, 7], :]
+
+
+def dca1000Parts(filename: str) -> list:
+    """
+    All parts of a DCA1000 capture, in order. Long captures are split into
+    <name>_Raw_0.bin, <name>_Raw_1.bin, ...; given any part, the following
+    consecutive parts are included. Other file names are a single part.
+    """
+    match = re.match(r"^(.*_Raw_)(\d+)\.bin$", filename)
+    if not match:
+        return [filename]
+    prefix, index = match.group(1), int(match.group(2))
+    parts = [filename]
+    while os.path.exists(f"{prefix}{index + 1}.bin"):
+        index += 1
+        parts.append(f"{prefix}{index}.bin")
+    return parts
+
+
+class _PartsReader:
+    """Reads int16 ranges of the virtual concatenation of the capture parts."""
+
+    def __init__(self, parts):
+        self.files = [open(part, "rb") for part in parts]
+        self.sizes = [os.path.getsize(part) // 2 for part in parts]
+        self.total = sum(self.sizes)
+
+    def read(self, start, count):
+        out = np.empty(count, dtype="int16")
+        filled = 0
+        base = 0
+        for f, size in zip(self.files, self.sizes):
+            if filled < count and start + filled < base + size:
+                local = start + filled - base
+                n = min(count - filled, size - local)
+                f.seek(2 * local)
+                out[filled : filled + n] = np.fromfile(f, dtype="int16", count=n)
+                filled += n
+            base += size
+        return out
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+
+def iterDCA1000(
+    filename: str = "first.bin",
+    chunk_size: int = 65536,
+    numberOfWindows: int = 4,
+    numADCBits: int = 16,
+    isReal: bool = True,
+    trim_to_windows: bool = False,
+    follow_parts: bool = True,
+):
+    """
+    Streaming version of readDCA1000: yields the same array in column chunks
+    of at most chunk_size samples per window, so arbitrarily long captures are
+    processed in constant memory (numberOfWindows * (2 if complex) * chunk_size
+    int16 values are read at a time). Concatenating the chunks along axis 1
+    gives readDCA1000's result. For chirp- or frame-aligned chunks, use a
+    multiple of the samples per chirp (or per frame) as chunk_size.
+
+    Every chunk gathers values from all windows, i.e. from rows distant parts
+    of the file, and the window boundaries depend on the total length: only
+    complete captures can be read this way. For a capture that is still being
+    written, use followDCA1000 (sample-interleaved layout).
+
+    Args:
+        filename (str):        Path to .bin file (the first part of a split capture)
+        chunk_size (int):      Samples per window in each yielded chunk
+        numberOfWindows (int): Number of windows to make from the data
+        numADCBits (int):      ADC bit resolution (default 16)
+        isReal (bool):         True for real-only data, False for complex data
+        trim_to_windows (bool):  True to trim data length to be divisible by numberOfWindows
+        follow_parts (bool):   Continue into the _Raw_1, _Raw_2, ... parts of a split capture
+
+    Yields:
+        adcData (np.ndarray): [numberOfWindows, <= chunk_size] chunk of converted ADC data
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be > 0, got {chunk_size}")
+    rows = numberOfWindows if isReal else numberOfWindows * 2
+    reader = _PartsReader(dca1000Parts(filename) if follow_parts else [filename])
+    try:
+        # Same windowing as readDCA1000's reshape: window r is the r-th contiguous
+        # block of the (possibly multi-part) stream
+        if reader.total % rows and not trim_to_windows:
+            raise ValueError(
+                f"{reader.total} samples in {filename} cannot be split into {rows} windows (use trim_to_windows)"
+            )
+        window_len = reader.total // rows
+        for start in range(0, window_len, chunk_size):
+            count = min(chunk_size, window_len - start)
+            adcData = np.stack([reader.read(r * window_len + start, count) for r in range(rows)])
+
+            # If not a 16 bit ADC, then the data is unsigned: need to convert to signed to correct the data
+            if numADCBits != 16:
+                l_max = 2 ** (numADCBits - 1) - 1
+                adcData[adcData > l_max] = adcData[adcData > l_max] - 2**numADCBits
+
+            if isReal:
+                yield adcData
+            else:
+                # I + jQ: first windows real, last windows imaginary
+                yield adcData[:numberOfWindows, :] + cmath.sqrt(-1) * adcData[numberOfWindows:, :]
+    finally:
+        reader.close()
+
+
+def followDCA1000(
+    filename: str = "first.bin",
+    chunk_size: int = 65536,
+    numberOfWindows: int = 4,
+    numADCBits: int = 16,
+    isReal: bool = True,
+    poll_interval: float = 0.05,
+    idle_timeout: float = 2.0,
+):
+    """
+    Live reader: yields the samples of a capture in file order while it is
+    being written, without knowing its total length, so it works on files that
+    are still growing. Assumes the sample-interleaved layout of
+    readDCA1000(..., interleaved=True); concatenating the chunks of a finished
+    capture gives that result (minus a trailing partial sample).
+
+    Follows the _Raw_1, _Raw_2, ... parts of a split capture as they appear
+    (a sample split across two parts is joined). Ends when no new data arrived
+    for idle_timeout seconds.
+
+    Args:
+        filename (str):        Path to .bin file (the first part of a split capture)
+        chunk_size (int):      Maximum samples per window in each yielded chunk
+        numberOfWindows (int): Number of windows (RX lanes) in the data
+        numADCBits (int):      ADC bit resolution (default 16)
+        isReal (bool):         True for real-only data, False for complex data
+        poll_interval (float): Seconds to wait before checking for new data
+        idle_timeout (float):  Seconds without new data before the capture counts as finished
+
+    Yields:
+        adcData (np.ndarray): [numberOfWindows, 1..chunk_size] chunk of converted ADC data
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be > 0, got {chunk_size}")
+    rows = numberOfWindows if isReal else numberOfWindows * 2
+    sample_bytes = 2 * rows
+    match = re.match(r"^(.*_Raw_)(\d+)\.bin$", filename)
+    index = int(match.group(2)) if match else 0
+    deadline = time.monotonic() + idle_timeout
+    while not os.path.exists(filename) and time.monotonic() < deadline:
+        time.sleep(poll_interval)
+    f = open(filename, "rb")
+    pending = b""
+    last_data = time.monotonic()
+    try:
+        while True:
+            count = chunk_size * sample_bytes - len(pending)
+            data = f.read(count)
+            next_part = f"{match.group(1)}{index + 1}.bin" if match else None
+            if not data and next_part and os.path.exists(next_part):
+                # The writer moved on to the next part: switch once this one is drained
+                data = f.read(count)
+                if not data:
+                    index += 1
+                    f.close()
+                    f = open(next_part, "rb")
+                    continue
+            if data:
+                last_data = time.monotonic()
+                pending += data
+                whole = len(pending) - len(pending) % sample_bytes
+                if whole == 0:
+                    continue
+                adcData = np.frombuffer(pending[:whole], dtype="int16").reshape(-1, rows).T.copy()
+                pending = pending[whole:]
+
+                # If not a 16 bit ADC, then the data is unsigned: need to convert to signed to correct the data
+                if numADCBits != 16:
+                    l_max = 2 ** (numADCBits - 1) - 1
+                    adcData[adcData > l_max] = adcData[adcData > l_max] - 2**numADCBits
+
+                if isReal:
+                    yield adcData
+                else:
+                    # I + jQ: first lanes real, last lanes imaginary
+                    yield adcData[:numberOfWindows, :] + cmath.sqrt(-1) * adcData[numberOfWindows:, :]
+            elif time.monotonic() - last_data > idle_timeout:
+                return
+            else:
+                time.sleep(poll_interval)
+    finally:
+        f.close()
 
 
-print(readDCA1000())
+if __name__ == "__main__":
+    print(readDCA1000())
@@ -1,4 +1,8 @@
 import cmath
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import torch
@@ -6,6 +10,8 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torch.utils.data import DataLoader, Dataset
 
+from SafeHavenBinParser import dca1000Parts
+
 # ======================== DATA LOADING ========================
 
 
@@ -15,9 +21,20 @@ def readDCA1000(
     numADCBits: int = 16,
     isReal: bool = True,
     trim_to_windows: bool = False,
+    interleaved: bool = False,
 ) -> np.ndarray:
-    """Extract ADC data from DCA1000 binary file"""
-    adcData = np.fromfile(filename, dtype="int16")
+    """
+    Extract ADC data from DCA1000 binary file. Split captures (_Raw_0.bin,
+    _Raw_1.bin, ...) are read as one; see iterDCA1000 for constant-memory
+    chunked reading of long captures. interleaved selects the
+    sample-interleaved layout instead of one contiguous block per window (see
+    SafeHavenBinParser.readDCA1000).
+    """
+    parts = dca1000Parts(filename)
+    if len(parts) == 1:
+        adcData = np.fromfile(filename, dtype="int16")
+    else:
+        adcData = np.concatenate([np.fromfile(part, dtype="int16") for part in parts])
 
     if numADCBits != 16:
         l_max = 2 ** (numADCBits - 1) - 1
@@ -27,23 +44,22 @@ def readDCA1000(
         new_len = len(adcData) - len(adcData) % numberOfWindows
         adcData = adcData[:new_len]
 
+    rows = numberOfWindows if isReal else numberOfWindows * 2
+    adcData = adcData.reshape(-1, rows).T if interleaved else adcData.reshape(rows, -1)
     if isReal:
-        adcData = adcData.reshape(numberOfWindows, -1)
-    else:
-        adcData = adcData.reshape(numberOfWindows * 2, -1)
-        adcData = adcData[[0, 1, 2, 3], :] + 1j * adcData[[4, 5, 6, 7], :]
-
-    return adcData
+        return adcData
+    return adcData[[0, 1, 2, 3], :] + 1j * adcData[[4, 5, 6, 7], :]
 
 
 def process_radar_cube(
-    adc_data, num_range_bins=256, num_doppler_bins=256, num_angle_bins=64
+    adc_data, num_range_bins=256, num_doppler_bins=256, num_angle_bins=64, window="none"
 ):
     """
     Convert raw ADC to Range-Doppler-Angle cube via FFT processing
 
     Args:
-        adc_data: Complex ADC samples [num_rx, num_samples]
+        adc_data: Complex ADC samples [num_rx, num_chirps, samples_per_chirp]
+        window: Taper applied to the range and Doppler FFT inputs ('none' or 'hann')
         num_range_bins: Range FFT size
         num_doppler_bins: Doppler FFT size
         num_angle_bins: Angle FFT size
@@ -51,15 +67,13 @@ def process_radar_cube(
     Returns:
         radar_cube: 3D numpy array [Range, Doppler, Angle]
     """
-    num_rx = adc_data.shape[0]
+    _check_chirps(adc_data)
 
     # 1. Range FFT (across fast-time samples)
-    range_fft = np.fft.fft(adc_data, n=num_range_bins, axis=1)
+    range_fft = np.fft.fft(_taper(adc_data, 2, window), n=num_range_bins, axis=2)
 
-    # 2. Doppler FFT (across chirps - reshape if needed based on your config)
-    # Assuming adc_data columns can be reshaped to [num_chirps, samples_per_chirp]
-    # Adjust this based on your actual chirp configuration
-    doppler_fft = np.fft.fft(range_fft, n=num_doppler_bins, axis=1)
+    # 2. Doppler FFT (across chirps)
+    doppler_fft = np.fft.fft(_taper(range_fft, 1, window), n=num_doppler_bins, axis=1)
     doppler_fft = np.fft.fftshift(doppler_fft, axes=1)
 
     # 3. Angle FFT (across RX antennas for AoA estimation)
@@ -69,18 +83,310 @@ def process_radar_cube(
     # Take magnitude (power spectrum)
     radar_cube = np.abs(angle_fft) ** 2
 
-    # Reshape to [Range, Doppler, Angle] if needed
-    # This depends on your exact FFT output shape
-    radar_cube = (
-        np.transpose(radar_cube, (1, 0, 2)) if radar_cube.ndim == 3 else radar_cube
-    )
+    # [Angle, Doppler, Range] -> [Range, Doppler, Angle]
+    return np.transpose(radar_cube, (2, 1, 0))
+
+
+def _check_chirps(adc_data):
+    if np.ndim(adc_data) != 3:
+        raise ValueError(
+            f"ADC data must be [num_rx, num_chirps, samples_per_chirp], got shape {np.shape(adc_data)} "
+            "(cut flat captures into chirps, see compute_radar_cube)"
+        )
+
+
+CUBE_WINDOWS = ("none", "hann")
+
+
+def _taper(x, axis, window):
+    """Multiplies x along axis by a periodic window ('none' leaves x unchanged)."""
+    if window not in CUBE_WINDOWS:
+        raise ValueError(f"Unknown window: {window} (choose from {CUBE_WINDOWS})")
+    if window == "none":
+        return x
+    length = x.shape[axis]
+    taper = np.hanning(length + 1)[:-1].astype(x.real.dtype)
+    shape = [1] * x.ndim
+    shape[axis] = length
+    return x * taper.reshape(shape)
+
+
+def _decimated_fft(x, n, axis, target):
+    """
+    Every (n // target)-th bin of np.fft.fft(x, n, axis), computed as a
+    target-point FFT of x folded (summed) into n // target blocks:
+        X[(n // target) * m] = sum_k x[k] e^(-2 pi i m k / target),  k taken mod target
+    Only used when target divides n; otherwise the full FFT is returned.
+    """
+    if target >= n or n % target:
+        return np.fft.fft(x, n=n, axis=axis)
+    # Zero-pad / truncate to n like np.fft.fft(x, n) does
+    length = x.shape[axis]
+    if length < n:
+        pad = [(0, 0)] * x.ndim
+        pad[axis] = (0, n - length)
+        x = np.pad(x, pad)
+    elif length > n:
+        x = np.take(x, np.arange(n), axis=axis)
+    shape = x.shape[:axis] + (n // target, target) + x.shape[axis + 1 :]
+    return np.fft.fft(x.reshape(shape).sum(axis=axis), axis=axis)
+
+
+def _decimation_target(n, length, target):
+    """
+    Bins of an n-point FFT over `length` input samples to compute for a
+    cube axis of `target` bins. A spectral peak is only about n / length bins
+    wide, so keeping every k-th bin for k beyond that zero-padding factor
+    would step over peaks (a target between kept bins vanishes); the rest of
+    the reduction is left to _pool_bins.
+    """
+    if target >= n or n % target:
+        return n
+    step = min(n // target, max(1, n // length))
+    while n % step:
+        step -= 1
+    return n // step
+
+
+def _pool_bins(cube, target_size):
+    """Average-pool every axis whose size is a multiple of the target size."""
+    for axis, (size, target) in enumerate(zip(cube.shape, target_size)):
+        if target < size and size % target == 0:
+            shape = cube.shape[:axis] + (target, size // target) + cube.shape[axis + 1 :]
+            cube = cube.reshape(shape).mean(axis=axis + 1)
+    return cube
+
+
+def process_radar_cube_target(
+    adc_data,
+    cube_size=(64, 64, 32),
+    num_range_bins=256,
+    num_doppler_bins=256,
+    num_angle_bins=64,
+    method="decimate",
+    window="none",
+):
+    """
+    Target-resolution variant of process_radar_cube, in complex64/float32.
+
+    method:
+        'decimate': the FFTs only compute every k-th bin (smaller FFTs over
+                    the folded input, see _decimated_fft), as far as the zero
+                    padding of that axis allows (_decimation_target); the
+                    remaining reduction to cube_size is pooled
+        'pool':     full FFTs, then the power is averaged over blocks of k bins
+                    (box-filtered, so no aliasing of fine structure)
+    Axes that don't divide evenly keep their size and are resized afterwards
+    like the FFT-then-zoom path. The output is not bit-identical to
+    process_radar_cube + zoom (zoom interpolates between neighbouring bins);
+    benchmark_radar_cube.py checks the agreement.
+    window: taper of the range and Doppler FFT inputs, applied before folding
+    ('none' or 'hann'); compare with process_radar_cube using the same window.
 
-    return radar_cube
+    Returns:
+        radar_cube: float32 numpy array [Range, Doppler, Angle], not yet normalized
+    """
+    _check_chirps(adc_data)
+    adc_data = np.asarray(adc_data).astype(np.complex64)
+    num_rx, num_chirps, samples_per_chirp = adc_data.shape
+    if method == "decimate":
+        range_target = _decimation_target(num_range_bins, samples_per_chirp, cube_size[0])
+        doppler_target = _decimation_target(num_doppler_bins, num_chirps, cube_size[1])
+        angle_target = _decimation_target(num_angle_bins, num_rx, cube_size[2])
+    else:
+        range_target, doppler_target, angle_target = num_range_bins, num_doppler_bins, num_angle_bins
+
+    # 1. Range FFT (across fast-time samples)
+    range_fft = _decimated_fft(_taper(adc_data, 2, window), num_range_bins, 2, range_target)
+
+    # 2. Doppler FFT (across chirps; fftshift commutes with decimation)
+    doppler_fft = _decimated_fft(_taper(range_fft, 1, window), num_doppler_bins, 1, doppler_target)
+    doppler_fft = np.fft.fftshift(doppler_fft, axes=1)
+
+    # 3. Angle FFT (across RX antennas)
+    angle_fft = _decimated_fft(doppler_fft, num_angle_bins, 0, angle_target)
+    angle_fft = np.fft.fftshift(angle_fft, axes=0)
+
+    # Pool what decimation left over (everything for 'pool')
+    radar_cube = np.transpose(np.abs(angle_fft).astype(np.float32) ** 2, (2, 1, 0))
+    return _pool_bins(radar_cube, cube_size)
 
 
 # ======================== DATASET ========================
 
 
+def resize_cube(cube, target_size):
+    """Resize 3D cube using scipy interpolation"""
+    from scipy.ndimage import zoom
+
+    zoom_factors = [t / s for t, s in zip(target_size, cube.shape)]
+    return zoom(cube, zoom_factors, order=1)
+
+
+CUBE_METHODS = ("fft_zoom", "decimate", "pool")
+
+
+def compute_radar_cube(
+    bin_file,
+    cube_size=(64, 64, 32),
+    num_range_bins=256,
+    num_doppler_bins=256,
+    num_angle_bins=64,
+    method="fft_zoom",
+    adc_data=None,
+    samples_per_chirp=256,
+    window="hann",
+    interleaved=False,
+):
+    """
+    Full preprocessing of one capture: read, FFT cube, normalize, resize.
+
+    Args:
+        method: 'fft_zoom' (full FFTs, then trilinear zoom), or 'decimate' /
+                'pool' (cube computed at the target resolution, see
+                process_radar_cube_target)
+        adc_data: Already loaded ADC data (bin_file is not read then)
+        samples_per_chirp: [num_rx, N] ADC data is cut into whole chirps,
+                [num_rx, chirps, samples_per_chirp] (a trailing partial chirp
+                is dropped); already 3D data is used as is
+        window: Taper of the range and Doppler FFT inputs, 'hann' or 'none'
+                (the same for all methods, so only the FFT-size reduction differs)
+        interleaved: Read bin_file in the sample-interleaved layout (see
+                readDCA1000), as delivered live by followDCA1000
+
+    Returns:
+        radar_cube: float32 numpy array of cube_size
+    """
+    if method not in CUBE_METHODS:
+        raise ValueError(f"Unknown cube method: {method} (choose from {CUBE_METHODS})")
+    if adc_data is None:
+        adc_data = readDCA1000(bin_file, isReal=False, interleaved=interleaved)
+    if adc_data.ndim == 2:
+        if not samples_per_chirp:
+            raise ValueError("samples_per_chirp is required to cut [num_rx, N] ADC data into chirps")
+        chirps = adc_data.shape[1] // samples_per_chirp
+        if chirps == 0:
+            raise ValueError(f"Capture shorter than one chirp ({samples_per_chirp} samples)")
+        adc_data = adc_data[:, : chirps * samples_per_chirp].reshape(adc_data.shape[0], chirps, samples_per_chirp)
+    if method != "fft_zoom":
+        radar_cube = process_radar_cube_target(
+            adc_data, cube_size, num_range_bins, num_doppler_bins, num_angle_bins, method, window
+        )
+    else:
+        radar_cube = process_radar_cube(
+            adc_data, num_range_bins, num_doppler_bins, num_angle_bins, window
+        )
+
+    # Normalize
+    radar_cube = (radar_cube - np.mean(radar_cube)) / (np.std(radar_cube) + 1e-8)
+
+    # Resize to target cube size via interpolation (only leftover axes for decimate/pool)
+    if tuple(radar_cube.shape) != tuple(cube_size):
+        radar_cube = resize_cube(radar_cube, cube_size)
+    return radar_cube.astype(np.float32)
+
+
+# ======================== RADAR CUBE CACHE ========================
+
+# Preprocessed cubes are stored once as float16 .npy files in cache_dir and
+# memory-mapped on access. Key = sha256(file content hash, cube parameters),
+# so renamed/copied captures hit the cache and changed parameters miss it.
+# File hashes are remembered in cache_dir/hashes.json by (size, mtime), so a
+# warm cache costs one stat() per capture instead of a full re-read.
+RADAR_CACHE_VERSION = 2
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cache_cube(job):
+    """Worker: compute one cube and write it atomically as float16."""
+    bin_file, cube_path, params = job
+    cube = compute_radar_cube(bin_file, **params).astype(np.float16)
+    tmp_path = f"{cube_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, cube)
+    os.replace(tmp_path, cube_path)
+    return cube_path
+
+
+class RadarCubeCache:
+    """Memmapped float16 store of preprocessed radar cubes"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._hash_index_path = os.path.join(cache_dir, "hashes.json")
+        self._hashes = {}
+        if os.path.exists(self._hash_index_path):
+            with open(self._hash_index_path, "r", encoding="utf-8") as f:
+                self._hashes = json.load(f)
+
+    def file_hash(self, bin_file):
+        # All parts of a split capture are read as one, so all of them are hashed
+        parts = dca1000Parts(bin_file)
+        stamp = []
+        for part in parts:
+            st = os.stat(part)
+            stamp.append([os.path.basename(part), st.st_size, st.st_mtime_ns])
+        key = os.path.abspath(bin_file)
+        entry = self._hashes.get(key)
+        if entry is None or entry["stamp"] != stamp:
+            digest = "".join(file_sha256(part) for part in parts)
+            if len(parts) > 1:
+                digest = hashlib.sha256(digest.encode("utf-8")).hexdigest()
+            entry = {"stamp": stamp, "hash": digest}
+            self._hashes[key] = entry
+        return entry["hash"]
+
+    def cube_path(self, bin_file, params):
+        blob = json.dumps(
+            {
+                "version": RADAR_CACHE_VERSION,
+                "file": self.file_hash(bin_file),
+                "params": params,
+            },
+            sort_keys=True,
+        )
+        return os.path.join(
+            self.cache_dir, hashlib.sha256(blob.encode("utf-8")).hexdigest() + ".npy"
+        )
+
+    def build(self, bin_files, params, num_workers=None):
+        """
+        Compute the cubes that are not cached yet (on a process pool).
+        Returns the cube path of every file, in order.
+        """
+        paths = [self.cube_path(f, params) for f in bin_files]
+        self._save_hashes()
+        missing = [
+            (f, p, params) for f, p in zip(bin_files, paths) if not os.path.exists(p)
+        ]
+        if missing:
+            print(
+                f"Preprocessing {len(missing)} of {len(bin_files)} radar cubes into {self.cache_dir}..."
+            )
+            workers = min(num_workers or os.cpu_count() or 1, len(missing))
+            if workers <= 1:
+                for job in missing:
+                    _cache_cube(job)
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    list(pool.map(_cache_cube, missing))
+        return paths
+
+    def _save_hashes(self):
+        tmp_path = f"{self._hash_index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._hashes, f)
+        os.replace(tmp_path, self._hash_index_path)
+
+
 class WeaponRadarDataset(Dataset):
     """Dataset for weapon detection from radar cubes [web:24][web:28]"""
 
@@ -92,12 +398,24 @@ class WeaponRadarDataset(Dataset):
         num_range_bins=256,
         num_doppler_bins=256,
         num_angle_bins=64,
+        cache_dir=None,
+        num_workers=None,
+        method="fft_zoom",
+        samples_per_chirp=256,
+        window="hann",
+        interleaved=False,
     ):
         """
         Args:
             bin_files: List of paths to .bin files
             labels: List of labels (0=no weapon, 1=weapon)
             cube_size: Target size for radar cube (R, D, A)
+            cache_dir: Optional radar cube cache; every cube is computed once
+                       (here, on num_workers processes) and memory-mapped afterwards
+            method: 'fft_zoom', 'decimate' or 'pool', see compute_radar_cube
+            samples_per_chirp: ADC samples per chirp, see compute_radar_cube
+            window: Range and Doppler window, see compute_radar_cube
+            interleaved: Sample-interleaved capture layout, see compute_radar_cube
         """
         self.bin_files = bin_files
         self.labels = labels
@@ -105,22 +423,40 @@ class WeaponRadarDataset(Dataset):
         self.num_range_bins = num_range_bins
         self.num_doppler_bins = num_doppler_bins
         self.num_angle_bins = num_angle_bins
+        self.method = method
+        self.samples_per_chirp = samples_per_chirp
+        self.window = window
+        self.interleaved = interleaved
+        self.cube_paths = None
+        if cache_dir:
+            self.cube_paths = RadarCubeCache(cache_dir).build(
+                bin_files, self.cube_params(), num_workers
+            )
+
+    def cube_params(self):
+        return {
+            "cube_size": list(self.cube_size),
+            "num_range_bins": self.num_range_bins,
+            "num_doppler_bins": self.num_doppler_bins,
+            "num_angle_bins": self.num_angle_bins,
+            "method": self.method,
+            "samples_per_chirp": self.samples_per_chirp,
+            "window": self.window,
+            "interleaved": self.interleaved,
+        }
 
     def __len__(self):
         return len(self.bin_files)
 
     def __getitem__(self, idx):
-        # Load and process radar data
-        adc_data = readDCA1000(self.bin_files[idx], isReal=False)
-        radar_cube = process_radar_cube(
-            adc_data, self.num_range_bins, self.num_doppler_bins, self.num_angle_bins
-        )
-
-        # Normalize
-        radar_cube = (radar_cube - np.mean(radar_cube)) / (np.std(radar_cube) + 1e-8)
-
-        # Resize to target cube size via interpolation
-        radar_cube = self._resize_cube(radar_cube, self.cube_size)
+        if self.cube_paths is not None:
+            # Copy out of the memmap (float16 cubes are widened to float32)
+            radar_cube = np.array(
+                np.load(self.cube_paths[idx], mmap_mode="r"), dtype=np.float32
+            )
+        else:
+            # Load and process radar data
+            radar_cube = compute_radar_cube(self.bin_files[idx], **self.cube_params())
 
         # Convert to tensor [C, D, H, W] format where C=1 (single channel)
         radar_cube = torch.from_numpy(radar_cube).float().unsqueeze(0)
@@ -130,10 +466,7 @@ class WeaponRadarDataset(Dataset):
 
     def _resize_cube(self, cube, target_size):
         """Resize 3D cube using scipy interpolation"""
-        from scipy.ndimage import zoom
-
-        zoom_factors = [t / s for t, s in zip(target_size, cube.shape)]
-        return zoom(cube, zoom_factors, order=1)
+        return resize_cube(cube, target_size)
 
 
 # ======================== 3D CNN ARCHITECTURE ========================
@@ -294,9 +627,20 @@ def train_weapon_detector(
 # ======================== INFERENCE ========================
 
 
-def predict_weapon(model, bin_file, device="cuda", threshold=0.5):
+def predict_weapon(
+    model,
+    bin_file,
+    device="cuda",
+    threshold=0.5,
+    cube_size=(64, 64, 32),
+    method="fft_zoom",
+    samples_per_chirp=256,
+    window="hann",
+    interleaved=False,
+):
     """
-    Predict whether weapon is present in radar scan
+    Predict whether weapon is present in radar scan. The cube parameters must
+    match the WeaponRadarDataset the model was trained on.
 
     Returns:
         prediction: 0 (no weapon) or 1 (weapon)
@@ -304,10 +648,15 @@ def predict_weapon(model, bin_file, device="cuda", threshold=0.5):
     """
     model.eval()
 
-    # Load and process single file
-    adc_data = readDCA1000(bin_file, isReal=False)
-    radar_cube = process_radar_cube(adc_data)
-    radar_cube = (radar_cube - np.mean(radar_cube)) / (np.std(radar_cube) + 1e-8)
+    # Load and process single file (same preprocessing as WeaponRadarDataset)
+    radar_cube = compute_radar_cube(
+        bin_file,
+        cube_size,
+        method=method,
+        samples_per_chirp=samples_per_chirp,
+        window=window,
+        interleaved=interleaved,
+    )
 
     # Convert to tensor
     radar_tensor = torch.from_numpy(radar_cube).float().unsqueeze(0).unsqueeze(0)
@@ -333,10 +682,13 @@ if __name__ == "__main__":
     val_labels = [1, 0, ...]
 
     # Create datasets and loaders [web:30]
+    # Cubes are preprocessed once into the cache; epochs only read memmaps
     train_dataset = WeaponRadarDataset(
-        train_files, train_labels, cube_size=(64, 64, 32)
+        train_files, train_labels, cube_size=(64, 64, 32), cache_dir="radar_cube_cache"
+    )
+    val_dataset = WeaponRadarDataset(
+        val_files, val_labels, cube_size=(64, 64, 32), cache_dir="radar_cube_cache"
     )
-    val_dataset = WeaponRadarDataset(val_files, val_labels, cube_size=(64, 64, 32))
 
     train_loader = DataLoader(train_dataset, batch_size=8, shuffle=True, num_workers=4)
     val_loader = DataLoader(val_dataset, batch_size=8, shuffle=False, num_workers=4)
@@ -0,0 +1,225 @@
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+from attempt1_SafeHaven3DCNN import CUBE_METHODS, CUBE_WINDOWS, compute_radar_cube, readDCA1000
+
+# Validation and per-file benchmark of the radar cube methods.
+#
+# Every capture reports, per method:
+#   - ms per file (median of --runs, file already read; read time separately)
+#   - agreement of the normalized cube with 'fft_zoom' (full FFTs + trilinear
+#     zoom, the original preprocessing) and, for 'decimate', with 'pool':
+#     Pearson correlation, relative L2 error, and whether the peak of the
+#     range, Doppler and angle profiles is within one bin
+#
+# Without input files, synthetic captures are generated as [rx, chirps,
+# samples]: one dominant point target (range beat frequency, chirp-to-chirp
+# Doppler step, RX phase step) plus weaker targets and noise. The dominant
+# target's true position in the output cube is known, so every method is also
+# checked for finding it within one bin on all three axes.
+#
+# fft_zoom is not the validation reference: the range spectrum of a point
+# target is about one bin wide and the linear zoom samples every ~4th bin
+# without prefiltering, so it misses the target in ~20% of the synthetic
+# captures (reported as its target match rate). 'pool' box-filters instead and
+# 'decimate' only skips bins that zero padding interpolated, then pools; both
+# are checked against the true target positions, and decimate against pool.
+#
+# The run fails (exit code 1) if a method misses ACCEPTANCE, so the benchmark
+# doubles as the validation gate for changes to the cube computation.
+
+AXES = ("range", "doppler", "angle")
+
+# Limits per method, measured on the synthetic captures with margin (hann
+# window: decimate and pool find the target on every axis in 32/32 captures,
+# decimate vs. pool r ~0.91 mean, 0.89 min). Target checks need synthetic
+# captures and are skipped for input files.
+ACCEPTANCE = {
+    "decimate": {"target_match_rate_min": 0.95, "pool_correlation_mean": 0.85, "pool_correlation_min": 0.75},
+    "pool": {"target_match_rate_min": 0.95},
+}
+
+
+def synthetic_capture(rng, num_rx=4, num_chirps=64, samples_per_chirp=256, num_targets=3, noise=20.0):
+    """
+    ([rx, chirps, samples] capture, position of the dominant target as a
+    fraction of the [range, Doppler, angle] axes of the cube).
+    """
+    samples = np.arange(samples_per_chirp)[None, None, :]
+    chirps = np.arange(num_chirps)[None, :, None]
+    rx = np.arange(num_rx)[:, None, None]
+    adc = np.zeros((num_rx, num_chirps, samples_per_chirp), dtype=np.complex128)
+    target = None
+    for i in range(num_targets):
+        beat = rng.uniform(0.0, 0.5)
+        doppler = rng.uniform(-0.5, 0.5)
+        phase_step = rng.uniform(-np.pi, np.pi)
+        amplitude = 1000.0 if i == 0 else rng.uniform(100, 300)
+        adc += amplitude * np.exp(1j * (2 * np.pi * (beat * samples + doppler * chirps) + phase_step * rx))
+        if i == 0:
+            # Doppler and angle spectra are fftshifted
+            target = np.array([beat, doppler + 0.5, phase_step / (2 * np.pi) + 0.5])
+    adc += noise * (rng.standard_normal(adc.shape) + 1j * rng.standard_normal(adc.shape))
+    return adc, target
+
+
+def median_ms(fn, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000.0)
+
+
+def agreement(reference, cube):
+    diff = cube - reference
+    # Strongest bin of every axis' marginal profile (the global argmax is
+    # unstable when the cube has several near-equal maxima)
+    peaks = []
+    for axis in range(reference.ndim):
+        other = tuple(a for a in range(reference.ndim) if a != axis)
+        peaks.append(bool(abs(int(np.argmax(cube.sum(axis=other))) - int(np.argmax(reference.sum(axis=other)))) <= 1))
+    return {
+        "correlation": float(np.corrcoef(reference.ravel(), cube.ravel())[0, 1]),
+        "relative_l2": float(np.linalg.norm(diff) / (np.linalg.norm(reference) + 1e-12)),
+        "peak_match_axes": peaks,
+    }
+
+
+def target_match(cube, target):
+    """Whether the cube's maximum lies within one bin of the target on each axis (Doppler and angle wrap around)."""
+    size = np.array(cube.shape)
+    distance = np.abs(np.array(np.unravel_index(np.argmax(cube), cube.shape)) - target * size)
+    distance[1:] = np.minimum(distance[1:], size[1:] - distance[1:])
+    return [bool(d <= 1.0) for d in distance]
+
+
+def check_acceptance(summary):
+    """Failed checks as readable strings (empty if every method passes)."""
+    failures = []
+    for method, limits in ACCEPTANCE.items():
+        for name, limit in limits.items():
+            value = summary.get(method, {}).get(name)
+            if value is not None and value < limit:
+                failures.append(f"{method}: {name} {value:.3f} (limit {limit})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Validate and benchmark the target-resolution radar cube methods against FFT-then-zoom"
+    )
+    parser.add_argument("inputs", nargs="*", help=".bin captures or folders of them (default: synthetic captures)")
+    parser.add_argument("--synthetic", type=int, default=32, help="Synthetic captures when no inputs are given (default: 32)")
+    parser.add_argument("--cube_size", type=int, nargs=3, default=[64, 64, 32], help="Target cube size (default: 64 64 32)")
+    parser.add_argument("--samples_per_chirp", type=int, default=256, help="ADC samples per chirp of input files (default: 256)")
+    parser.add_argument("--window", type=str, default="hann", choices=list(CUBE_WINDOWS), help="Range/Doppler window of all methods (default: hann)")
+    parser.add_argument("--no_check", action="store_true", help="Report only; don't fail on ACCEPTANCE")
+    parser.add_argument("--runs", type=int, default=20, help="Timed runs per file and method (default: 20)")
+    parser.add_argument("--output", type=str, default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    files = []
+    for item in args.inputs:
+        if os.path.isdir(item):
+            files += sorted(glob.glob(os.path.join(item, "**", "*.bin"), recursive=True))
+        else:
+            files.append(item)
+
+    captures = []
+    if files:
+        for path in files:
+            start = time.perf_counter()
+            adc = readDCA1000(path, isReal=False)
+            captures.append((path, adc, None, (time.perf_counter() - start) * 1000.0))
+    else:
+        rng = np.random.default_rng(0)
+        captures = [(f"synthetic_{i}", *synthetic_capture(rng), None) for i in range(args.synthetic)]
+
+    cube_size = tuple(args.cube_size)
+    kwargs = {"samples_per_chirp": args.samples_per_chirp, "window": args.window}
+    results = []
+    print(f"{len(captures)} captures, cube {cube_size}, window {args.window}, {args.runs} runs each")
+    for name, adc, target, read_ms in captures:
+        cubes = {method: compute_radar_cube(None, cube_size, method=method, adc_data=adc, **kwargs) for method in CUBE_METHODS}
+        row = {"file": name, "read_ms": read_ms, "methods": {}}
+        for method, cube in cubes.items():
+            entry = {"ms": median_ms(lambda: compute_radar_cube(None, cube_size, method=method, adc_data=adc, **kwargs), args.runs)}
+            if method != "fft_zoom":
+                entry["fft_zoom"] = agreement(cubes["fft_zoom"], cube)
+            if method == "decimate":
+                entry["pool"] = agreement(cubes["pool"], cube)
+            if target is not None:
+                entry["target_match_axes"] = target_match(cube, target)
+            row["methods"][method] = entry
+        base = row["methods"]["fft_zoom"]["ms"]
+        parts = []
+        for method, m in row["methods"].items():
+            part = f"{method} {m['ms']:7.3f} ms"
+            details = []
+            if method != "fft_zoom":
+                details.append(f"x{base / m['ms']:.1f}, r={m['fft_zoom']['correlation']:.3f}")
+            if "pool" in m:
+                details.append(f"r(pool)={m['pool']['correlation']:.3f}")
+            if "target_match_axes" in m:
+                details.append(f"target {''.join('=' if ok else 'x' for ok in m['target_match_axes'])}")
+            parts.append(part + (f" ({', '.join(details)})" if details else ""))
+        print(f"  {os.path.basename(name):16s} " + "  ".join(parts))
+        results.append(row)
+
+    summary = {}
+    zoom_ms = np.mean([r["methods"]["fft_zoom"]["ms"] for r in results])
+    for method in CUBE_METHODS:
+        rows = [r["methods"][method] for r in results]
+        s = summary[method] = {"ms_mean": float(np.mean([m["ms"] for m in rows]))}
+        for reference in ("fft_zoom", "pool"):
+            if reference in rows[0]:
+                correlation = [m[reference]["correlation"] for m in rows]
+                s[f"{reference}_correlation_mean"] = float(np.mean(correlation))
+                s[f"{reference}_correlation_min"] = float(np.min(correlation))
+                s[f"{reference}_relative_l2_mean"] = float(np.mean([m[reference]["relative_l2"] for m in rows]))
+                s[f"{reference}_peak_match_rate"] = dict(
+                    zip(AXES, np.mean([m[reference]["peak_match_axes"] for m in rows], axis=0).tolist())
+                )
+        if method != "fft_zoom":
+            s["speedup"] = float(zoom_ms / s["ms_mean"])
+        if "target_match_axes" in rows[0]:
+            s["target_match_rate"] = dict(zip(AXES, np.mean([m["target_match_axes"] for m in rows], axis=0).tolist()))
+            s["target_match_rate_min"] = min(s["target_match_rate"].values())
+    failures = check_acceptance(summary)
+
+    print("Summary:")
+    for method, s in summary.items():
+        line = f"  {method:9s} {s['ms_mean']:7.3f} ms/file"
+        if "speedup" in s:
+            line += f"  x{s['speedup']:.1f}  r={s['fft_zoom_correlation_mean']:.3f} (min {s['fft_zoom_correlation_min']:.3f})"
+        if "pool_correlation_mean" in s:
+            line += f"  r(pool)={s['pool_correlation_mean']:.3f} (min {s['pool_correlation_min']:.3f})"
+        if "target_match_rate" in s:
+            line += "  target " + " / ".join(f"{axis} {rate:.0%}" for axis, rate in s["target_match_rate"].items())
+        print(line)
+    for failure in failures:
+        print(f"FAILED {failure}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {"cube_size": list(cube_size), "window": args.window, "results": results, "summary": summary,
+                 "acceptance": ACCEPTANCE, "failures": failures},
+                f,
+                indent=2,
+            )
+        print(f"Saved results to {args.output}")
+
+    if failures and not args.no_check:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from attempt1_SafeHaven3DCNN import CUBE_METHODS, CUBE_WINDOWS, Weapon3DCNN, compute_radar_cube
+from SafeHavenBinParser import followDCA1000, iterDCA1000
+
+# Sliding-window streaming inference for the 3D CNN.
+#
+# predict_weapon classifies a finished capture. Here the samples are consumed
+# as they arrive (from any source yielding complex [num_rx, n] chunks in time
+# order) into a rolling window of the last window_samples per RX. Every hop_samples new samples the window is turned
+# into a radar cube exactly like WeaponRadarDataset does for a whole capture
+# (compute_radar_cube), so windows are classified at a fixed cadence and
+# overlap by window_samples - hop_samples. samples_per_chirp must match
+# training (it cuts the window into [num_rx, chirps, samples_per_chirp]), as
+# must the cube method and cube_window (range/Doppler taper); window and hop must be
+# whole chirps.
+#
+# Sources:
+#   - replay_frames: a complete capture in readDCA1000's layout (the one the
+#     training cubes use), where every RX window is a contiguous block of the
+#     file. The block boundaries depend on the total length and every chunk
+#     reads from all blocks, so only finished files can be replayed; the
+#     windows are time windows only if the blocks are the RX channels.
+#   - live_frames (--live): a capture that is still being written, read in
+#     file order with followDCA1000. This assumes the sample-interleaved layout
+#     (readDCA1000(..., interleaved=True)); the model has to be trained on cubes
+#     read the same way (WeaponRadarDataset(..., interleaved=True),
+#     evaluate_kfold.py --interleaved).
+#
+# Cubes are queued and classified batch_windows at a time: batching amortizes
+# the forward pass, but a window waits for up to batch_windows - 1 further
+# hops, so latency (window complete -> result) grows with the batch size.
+# Per-window cube time, inference time and latency are reported.
+
+
+class RollingRadarWindow:
+    """Ring buffer holding the last window_samples of every RX channel."""
+
+    def __init__(self, window_samples, num_rx=4):
+        self.window_samples = window_samples
+        self.buffer = np.zeros((num_rx, window_samples), dtype=np.complex128)
+        self.pos = 0
+        self.total = 0
+
+    def push(self, chunk):
+        n = chunk.shape[1]
+        if n >= self.window_samples:
+            self.buffer[:] = chunk[:, -self.window_samples :]
+            self.pos = 0
+        else:
+            first = min(n, self.window_samples - self.pos)
+            self.buffer[:, self.pos : self.pos + first] = chunk[:, :first]
+            self.buffer[:, : n - first] = chunk[:, first:]
+            self.pos = (self.pos + n) % self.window_samples
+        self.total += n
+
+    def window(self):
+        """Copy of the current window, oldest sample first."""
+        return np.concatenate([self.buffer[:, self.pos :], self.buffer[:, : self.pos]], axis=1)
+
+
+class StreamingRadarClassifier:
+    """
+    feed(chunk) consumes complex [num_rx, n] samples and returns the results
+    of the windows classified meanwhile (possibly none); flush() classifies
+    the windows still queued at the end of the stream.
+
+    Every result is a dict with window, start_sample, end_sample, prediction,
+    confidence, cube_ms, inference_ms (per window) and latency_ms (from the
+    window's last sample arriving to its result).
+    """
+
+    def __init__(
+        self,
+        model,
+        window_samples=16384,
+        hop_samples=4096,
+        samples_per_chirp=256,
+        num_rx=4,
+        cube_size=(64, 64, 32),
+        method="fft_zoom",
+        cube_window="hann",
+        batch_windows=1,
+        threshold=0.5,
+        device="cpu",
+    ):
+        if hop_samples <= 0 or window_samples <= 0 or batch_windows <= 0:
+            raise ValueError("window_samples, hop_samples and batch_windows must be > 0")
+        if window_samples % samples_per_chirp or hop_samples % samples_per_chirp:
+            raise ValueError(
+                f"window_samples and hop_samples must be multiples of samples_per_chirp ({samples_per_chirp})"
+            )
+        if method not in CUBE_METHODS:
+            raise ValueError(f"Unknown cube method: {method} (choose from {CUBE_METHODS})")
+        self.model = model.to(device).eval()
+        self.window = RollingRadarWindow(window_samples, num_rx)
+        self.hop_samples = hop_samples
+        self.samples_per_chirp = samples_per_chirp
+        self.cube_size = tuple(cube_size)
+        self.method = method
+        self.cube_window = cube_window
+        self.batch_windows = batch_windows
+        self.threshold = threshold
+        self.device = device
+        self.next_end = window_samples
+        self.windows = 0
+        self.pending = []
+
+    def feed(self, chunk):
+        results = []
+        offset = 0
+        # Split the chunk at window ends so the cadence does not depend on the chunk size
+        while offset < chunk.shape[1]:
+            n = min(chunk.shape[1] - offset, self.next_end - self.window.total)
+            self.window.push(chunk[:, offset : offset + n])
+            offset += n
+            if self.window.total == self.next_end:
+                results += self._window_complete()
+                self.next_end += self.hop_samples
+        return results
+
+    def flush(self):
+        return self._classify() if self.pending else []
+
+    def _window_complete(self):
+        ready = time.perf_counter()
+        cube = compute_radar_cube(
+            None,
+            self.cube_size,
+            method=self.method,
+            adc_data=self.window.window(),
+            samples_per_chirp=self.samples_per_chirp,
+            window=self.cube_window,
+        )
+        self.pending.append(
+            {
+                "window": self.windows,
+                "start_sample": self.window.total - self.window.window_samples,
+                "end_sample": self.window.total,
+                "cube": cube,
+                "ready": ready,
+                "cube_ms": (time.perf_counter() - ready) * 1000.0,
+            }
+        )
+        self.windows += 1
+        return self._classify() if len(self.pending) >= self.batch_windows else []
+
+    def _classify(self):
+        batch, self.pending = self.pending, []
+        start = time.perf_counter()
+        x = torch.from_numpy(np.stack([w.pop("cube") for w in batch])).float().unsqueeze(1).to(self.device)
+        with torch.no_grad():
+            confidence = F.softmax(self.model(x), dim=1)[:, 1].cpu().numpy()
+        done = time.perf_counter()
+        for w, conf in zip(batch, confidence):
+            w["confidence"] = float(conf)
+            w["prediction"] = 1 if conf >= self.threshold else 0
+            w["inference_ms"] = (done - start) * 1000.0 / len(batch)
+            w["latency_ms"] = (done - w.pop("ready")) * 1000.0
+        return batch
+
+    def stream(self, chunks):
+        """Generator over the results of a whole stream of chunks."""
+        for chunk in chunks:
+            yield from self.feed(chunk)
+        yield from self.flush()
+
+
+def replay_frames(bin_file, chunk_samples=1024, sample_rate=None):
+    """
+    Complex [num_rx, chunk_samples] chunks of a complete capture (all parts of
+    a split capture) in readDCA1000's block layout. Needs the total length, so
+    the file must be finished; see live_frames for a capture in progress.
+    With sample_rate (samples/s per RX), chunks are paced like a live capture;
+    otherwise they are yielded as fast as they are read.
+    """
+    start = time.perf_counter()
+    sent = 0
+    for chunk in iterDCA1000(bin_file, chunk_size=chunk_samples, isReal=False, trim_to_windows=True):
+        if sample_rate:
+            delay = start + (sent + chunk.shape[1]) / sample_rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        sent += chunk.shape[1]
+        yield chunk
+
+
+def live_frames(bin_file, chunk_samples=1024, idle_timeout=2.0):
+    """
+    Complex [num_rx, <= chunk_samples] chunks of a capture that is still being
+    written, in file order (sample-interleaved layout, see followDCA1000).
+    Ends idle_timeout seconds after the last new data.
+    """
+    yield from followDCA1000(bin_file, chunk_size=chunk_samples, isReal=False, idle_timeout=idle_timeout)
+
+
+def latency_summary(results):
+    if not results:
+        return {"windows": 0}
+    latency = np.array([r["latency_ms"] for r in results])
+    return {
+        "windows": len(results),
+        "alerts": sum(r["prediction"] for r in results),
+        "latency_ms_median": float(np.median(latency)),
+        "latency_ms_p95": float(np.percentile(latency, 95)),
+        "latency_ms_max": float(latency.max()),
+        "cube_ms_mean": float(np.mean([r["cube_ms"] for r in results])),
+        "inference_ms_mean": float(np.mean([r["inference_ms"] for r in results])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify a replayed capture with sliding windows while it streams in")
+    parser.add_argument("bin_file", help="Capture to replay (the first part of a split capture)")
+    parser.add_argument("--live", action="store_true", help="Follow a capture that is still being written, in file order (sample-interleaved layout; the model must be trained on it)")
+    parser.add_argument("--idle_timeout", type=float, default=2.0, help="With --live, stop after this many seconds without new data (default: 2.0)")
+    parser.add_argument("--model", type=str, default="best_weapon_detector.pth", help="Weapon3DCNN state dict (default: best_weapon_detector.pth)")
+    parser.add_argument("--window", type=int, default=16384, help="Samples per RX in a window (default: 16384)")
+    parser.add_argument("--hop", type=int, default=4096, help="New samples per RX between windows (default: 4096)")
+    parser.add_argument("--samples_per_chirp", type=int, default=256, help="ADC samples per chirp, as in training (default: 256)")
+    parser.add_argument("--chunk", type=int, default=1024, help="Samples per RX read at a time (default: 1024)")
+    parser.add_argument("--batch", type=int, default=1, help="Windows per forward pass (default: 1)")
+    parser.add_argument("--cube_size", type=int, nargs=3, default=[64, 64, 32], help="Cube size, as in training (default: 64 64 32)")
+    parser.add_argument("--method", type=str, default="fft_zoom", choices=list(CUBE_METHODS), help="Cube method, as in training (default: fft_zoom)")
+    parser.add_argument("--cube_window", type=str, default="hann", choices=list(CUBE_WINDOWS), help="Range/Doppler window of the cubes, as in training (default: hann)")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Weapon confidence threshold (default: 0.5)")
+    parser.add_argument("--sample_rate", type=float, default=None, help="Pace the replay at this many samples/s per RX, ignored with --live (default: as fast as possible)")
+    parser.add_argument("--device", type=str, default="cpu", help="Torch device (default: cpu)")
+    parser.add_argument("--output", type=str, default=None, help="Write the per-window results as JSON")
+    args = parser.parse_args()
+
+    model = Weapon3DCNN(num_classes=2, input_channels=1)
+    model.load_state_dict(torch.load(args.model, map_location=args.device))
+    classifier = StreamingRadarClassifier(
+        model,
+        window_samples=args.window,
+        hop_samples=args.hop,
+        samples_per_chirp=args.samples_per_chirp,
+        cube_size=args.cube_size,
+        method=args.method,
+        cube_window=args.cube_window,
+        batch_windows=args.batch,
+        threshold=args.threshold,
+        device=args.device,
+    )
+
+    if args.live:
+        frames = live_frames(args.bin_file, args.chunk, args.idle_timeout)
+    else:
+        frames = replay_frames(args.bin_file, args.chunk, args.sample_rate)
+    results = []
+    for r in classifier.stream(frames):
+        results.append(r)
+        flag = "WEAPON" if r["prediction"] else "clear "
+        print(
+            f"  window {r['window']:4d} [{r['start_sample']:>9d}, {r['end_sample']:>9d})  {flag} {r['confidence']:.2%}  "
+            f"latency {r['latency_ms']:7.2f} ms (cube {r['cube_ms']:6.2f}, inference {r['inference_ms']:6.2f})"
+        )
+
+    summary = latency_summary(results)
+    if results:
+        print(
+            f"{summary['windows']} windows, {summary['alerts']} alerts, latency median {summary['latency_ms_median']:.2f} ms "
+            f"p95 {summary['latency_ms_p95']:.2f} ms max {summary['latency_ms_max']:.2f} ms"
+        )
+    else:
+        print(f"Capture shorter than one window ({args.window} samples per RX)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results, "summary": summary}, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()